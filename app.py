@@ -1,4 +1,8 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import (Flask, render_template, request, jsonify, send_from_directory, send_file,
+                   Response, stream_with_context, url_for)
+from werkzeug.security import safe_join
+from urllib.parse import quote
+import mimetypes
 import os
 import threading
 import time
@@ -9,28 +13,57 @@ from dotenv import load_dotenv
 import sys
 
 # Import our existing functions (we'll refactor script.py)
+from async_scraper import run_sync, set_all_versions
+from planner import build_plan, execute_plan
 from rada_scraper import (
     get_latest_sesja_url, get_latest_porządek_url, download_attachments,
-    get_all_sesja_urls, download_specific_sesja, get_existing_sessions
+    get_all_sesja_urls, download_specific_sesja,
+    register_file_hook, DEF_URL
 )
+from tracing import run_traced, TRACE_DIR
+from watcher import Watcher
+from search_index import get_search_index, index_saved_file
+from file_index import get_file_index, update_file_index, warm_file_indexes
+from blob_store import get_blob_store, file_sha256
+from zip_stream import iter_zip, folder_files
+from job_store import JobStore, LeaseHeartbeat, new_owner_id, WORKER_ID
+from compression import compress_response
+import throttle
+import keywords
+import cold_storage
+import deferred_naming
+import http_cache
 
 load_dotenv()
 app = Flask(__name__)
 
+# Keep the full-text index and the file listing in sync with downloaded files
+register_file_hook(index_saved_file)
+register_file_hook(update_file_index)
+
 # Configuration
 # Prefer environment variable when available (works on Render and locally)
 DEFAULT_DOWNLOAD_DIR = os.getenv("DOWNLOAD_DIR", "./data")
 SETTINGS_FILE = "app_settings.json"
 LOG_FILE = "download_log.json"
 
-# Global settings
-app_settings = {
+# File serving: "x-sendfile" (Apache/lighttpd) or "x-accel" (nginx) lets a front
+# proxy send the bytes; X_ACCEL_PREFIX is the nginx internal location of the archive
+SENDFILE_MODE = os.getenv("SENDFILE_MODE", "").lower()
+X_ACCEL_PREFIX = os.getenv("X_ACCEL_PREFIX", "/protected-files/")
+FILE_CACHE_MAX_AGE = int(os.getenv("FILE_CACHE_MAX_AGE", str(7 * 24 * 3600)))
+app.config["USE_X_SENDFILE"] = SENDFILE_MODE == "x-sendfile"
+STATIC_MAX_AGE = 365 * 24 * 3600  # static URLs carry a content hash (asset_url)
+
+# Default settings; saved values live in the shared state store
+DEFAULT_SETTINGS = {
     "download_base_dir": DEFAULT_DOWNLOAD_DIR,
-    "available_albums": ["SesjeRady", "Archiwum", "Backup", "Dokumenty"]
+    "available_albums": ["SesjeRady", "Archiwum", "Backup", "Dokumenty"],
+    # Seconds between background checks for new sessions/agendas (0 = off)
+    "watcher_interval": int(os.getenv("WATCH_INTERVAL", "0"))
 }
 
-# Global variables for status tracking
-download_status = {
+DEFAULT_STATUS = {
     "is_running": False,
     "current_task": "",
     "progress": 0,
@@ -38,75 +71,152 @@ download_status = {
     "error": None
 }
 
+# Settings, status, logs and the running-job lease are shared by all workers
+job_store = JobStore()
+DOWNLOAD_LEASE = "download"
+LEASE_TTL = 60  # seconds; renewed every LEASE_TTL/3 while a job runs
+
+
 def log_action(action, details=""):
-    """Log actions to JSON file"""
-    log_entry = {
-        "timestamp": datetime.now().isoformat(),
-        "action": action,
-        "details": details
-    }
-    
+    """Log actions to the shared state store"""
     try:
-        if os.path.exists(LOG_FILE):
-            with open(LOG_FILE, 'r', encoding='utf-8') as f:
-                logs = json.load(f)
-        else:
-            logs = []
-        
-        logs.append(log_entry)
-        # Keep only last 100 entries
-        if len(logs) > 100:
-            logs = logs[-100:]
-            
-        with open(LOG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(logs, f, ensure_ascii=False, indent=2)
+        job_store.add_log(datetime.now().isoformat(), action, details)
     except Exception as e:
         print(f"Error logging action: {e}")
 
 def update_status(task, progress=0, error=None):
-    """Update global download status"""
-    global download_status
-    download_status.update({
-        "current_task": task,
-        "progress": progress,
-        "last_update": datetime.now().isoformat(),
-        "error": error
-    })
+    """Update shared download status"""
+    job_store.update("download_status",
+                     current_task=task,
+                     progress=progress,
+                     last_update=datetime.now().isoformat(),
+                     error=error)
+
+
+# The worker running a download publishes the scraper's throttle state
+throttle.register_state_listener(lambda state: job_store.set("throttle", state))
+# ...and the AI circuit breaker / deferred renaming queue
+deferred_naming.register_state_listener(lambda state: job_store.set("ai_naming", state))
+
+
+def get_download_status():
+    """Current download status; is_running means some worker holds the download lease"""
+    status = dict(DEFAULT_STATUS, **job_store.get("download_status", {}))
+    status["is_running"] = job_store.lease_holder(DOWNLOAD_LEASE) is not None
+    return status
+
+
+def get_job_options():
+    """Read optional job flags from the JSON body or query string (e.g. ?trace=1&profile=1&keywords=local)"""
+    data = request.get_json(silent=True) or {}
+
+    def flag(name):
+        value = data.get(name, request.args.get(name, False))
+        return str(value).lower() in ("1", "true", "yes", "on")
+
+    # Keyword backend for this job: ai, local or auto (default: KEYWORDS_MODE)
+    keyword_mode = data.get('keywords', request.args.get('keywords')) or None
+    # Every porządek version instead of the latest (default: ALL_AGENDA_VERSIONS)
+    all_versions = flag("all_versions") if 'all_versions' in data or 'all_versions' in request.args else None
+    return {"trace": flag("trace"), "profile": flag("profile"), "keywords": keyword_mode,
+            "all_versions": all_versions}
+
+
+def start_job(job_name, target, options=None):
+    """Run a download job in a background thread, traced/profiled when requested.
+    Returns False when another download holds the lease (in any worker)."""
+    if options is None:
+        options = get_job_options()
+
+    keyword_mode = keywords.check_mode(options.get("keywords"))
+
+    owner = new_owner_id()
+    if not job_store.acquire_lease(DOWNLOAD_LEASE, owner, LEASE_TTL):
+        return False
+    update_status("Uruchamianie...", 0)
+
+    def run():
+        heartbeat = LeaseHeartbeat(job_store, DOWNLOAD_LEASE, owner, LEASE_TTL).start()
+        keywords.set_mode(keyword_mode)
+        set_all_versions(options.get("all_versions"))
+        try:
+            written = run_traced(job_name, target, trace=options["trace"], profile=options["profile"])
+            if written:
+                log_action("Zapisano ślad zadania", ", ".join(written))
+        finally:
+            heartbeat.stop()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return True
 
 
 def load_settings():
-    """Load settings from JSON file"""
-    global app_settings
+    """Import settings and logs from the old JSON files into the state store (once)"""
     try:
-        if os.path.exists(SETTINGS_FILE):
+        if job_store.get("settings") is None and os.path.exists(SETTINGS_FILE):
             with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
-                saved_settings = json.load(f)
-                app_settings.update(saved_settings)
+                job_store.set("settings", json.load(f))
+        if job_store.log_count() == 0 and os.path.exists(LOG_FILE):
+            with open(LOG_FILE, 'r', encoding='utf-8') as f:
+                for entry in json.load(f):
+                    job_store.add_log(entry["timestamp"], entry["action"], entry.get("details", ""))
     except Exception as e:
         print(f"Error loading settings: {e}")
 
 
-def save_settings():
-    """Save settings to JSON file"""
-    try:
-        with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(app_settings, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"Error saving settings: {e}")
+def get_settings():
+    """Current settings (defaults overridden by saved values)"""
+    return dict(DEFAULT_SETTINGS, **job_store.get("settings", {}))
+
+
+def update_settings(**changes):
+    """Save changed settings to the shared state store"""
+    job_store.update("settings", **changes)
 
 
 def get_current_download_dir():
     """Get current download directory"""
-    return app_settings.get("download_base_dir", DEFAULT_DOWNLOAD_DIR)
+    return get_settings().get("download_base_dir", DEFAULT_DOWNLOAD_DIR)
 
 
 def set_download_dir(new_dir):
     """Set new download directory"""
-    global app_settings
-    app_settings["download_base_dir"] = new_dir
-    save_settings()
+    update_settings(download_base_dir=new_dir)
     # Ensure directory exists
     Path(new_dir).mkdir(parents=True, exist_ok=True)
+    warm_album_indexes()
+
+
+def album_dirs():
+    """{album name: folder} of the available albums (siblings of the current
+    folder, as in /api/settings/folder) plus the current folder itself"""
+    current_dir = get_current_download_dir()
+    parent = os.path.dirname(os.path.abspath(current_dir))
+    albums = {name: os.path.join(parent, name) for name in get_settings()["available_albums"]}
+    albums.setdefault(os.path.basename(os.path.abspath(current_dir)), current_dir)
+    return albums
+
+
+def warm_album_indexes():
+    """Load the file indexes of all albums in the background (current one first)"""
+    dirs = list(album_dirs().values())
+    current_dir = get_current_download_dir()
+    return warm_file_indexes([current_dir] + [d for d in dirs if d != current_dir])
+
+
+def requested_indexes():
+    """{album: FileIndex} for ?album=<name> or ?album=all (default: the current folder)"""
+    album = request.args.get('album', '').strip()
+    if not album:
+        current_dir = get_current_download_dir()
+        return {os.path.basename(os.path.abspath(current_dir)): get_file_index(current_dir)}
+    albums = album_dirs()
+    if album == 'all':
+        return {name: get_file_index(path) for name, path in albums.items() if os.path.isdir(path)}
+    if album not in albums:
+        raise KeyError(f"Nieznany album: {album}")
+    return {album: get_file_index(albums[album])}
 
 
 @app.route('/api/settings/folder/set_path', methods=['POST'])
@@ -175,6 +285,52 @@ def pick_folder_via_dialog():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.errorhandler(keywords.UnknownModeError)
+def unknown_keyword_mode(e):
+    return jsonify({"error": str(e)}), 400
+
+
+@app.template_global()
+def asset_url(filename):
+    """URL of a static file with its content hash, so it can be cached forever"""
+    path = os.path.join(app.static_folder, filename)
+    return url_for('static', filename=filename, v=file_sha256(path)[:12])
+
+
+def versioned_json(version, build):
+    """JSON response with a weak ETag from a version counter.
+    build() runs only when the client's copy (If-None-Match) is out of date."""
+    if request.if_none_match.contains_weak(version):
+        response = Response(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(version, weak=True)
+    response.cache_control.no_cache = True
+    return response
+
+
+@app.after_request
+def cache_and_compress(response):
+    """ETag revalidation for JSON/HTML, immutable static assets, gzip/brotli"""
+    if request.endpoint == 'static':
+        if request.args.get('v'):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+        if response.status_code == 200:
+            # Small text files: buffer them so they can be compressed
+            response.direct_passthrough = False
+            response.set_data(response.get_data())
+    elif (request.method == 'GET' and response.status_code == 200 and not response.is_streamed
+            and response.mimetype in ('application/json', 'text/html')):
+        # Endpoints without a version counter get an ETag from the body
+        response.add_etag(weak=True)
+        response.cache_control.no_cache = True
+        response = response.make_conditional(request)
+    return compress_response(response, request.accept_encodings)
+
+
 @app.route('/')
 def index():
     """Main dashboard page"""
@@ -190,19 +346,24 @@ def get_status():
         
         # Get existing sessions info
         current_dir = get_current_download_dir()
-        existing_sessions = get_existing_sessions(current_dir)
+        existing_sessions = get_file_index(current_dir).sessions()
         
         status_info = {
             "latest_sesja": sesja_number,
             "latest_porzadek": porzadek_number,
             "sesja_url": sesja_url,
             "porzadek_url": porzadek_url,
-            "download_status": download_status,
-            "base_url": "https://bip.pila.pl/2025.html",
+            "download_status": get_download_status(),
+            "base_url": DEF_URL,
             "current_download_dir": current_dir,
             "existing_sessions": existing_sessions,
             "existing_sessions_count": len(existing_sessions),
-            "available_albums": app_settings["available_albums"]
+            "available_albums": get_settings()["available_albums"],
+            "watcher": get_watcher_status(),
+            "throttle": job_store.get("throttle"),
+            "ai_naming": job_store.get("ai_naming"),
+            "file_index": get_file_index(current_dir).status(),
+            "http_cache": http_cache.status()
         }
         return jsonify(status_info)
     except Exception as e:
@@ -211,12 +372,7 @@ def get_status():
 @app.route('/api/download/latest', methods=['POST'])
 def download_latest():
     """Download latest files (current script functionality)"""
-    if download_status["is_running"]:
-        return jsonify({"error": "Download already in progress"}), 400
-    
     def run_download():
-        global download_status
-        download_status["is_running"] = True
         try:
             update_status("Szukam najnowszej sesji...", 10)
             sesja_url, sesja_number = get_latest_sesja_url()
@@ -231,7 +387,7 @@ def download_latest():
             Path(porzadek_dir).mkdir(parents=True, exist_ok=True)
             
             update_status(f"Pobieranie plików z Sesji {sesja_number}, Porządek {porzadek_number}...", 50)
-            download_attachments(porzadek_url, porzadek_dir)
+            download_attachments(porzadek_url, porzadek_dir, store=get_blob_store(current_download_dir))
             
             update_status("Zakończono pomyślnie!", 100)
             log_action("Pobrano najnowsze pliki", f"Sesja {sesja_number}, Porządek {porzadek_number}")
@@ -239,28 +395,21 @@ def download_latest():
         except Exception as e:
             update_status("Błąd podczas pobierania", 0, str(e))
             log_action("Błąd", str(e))
-        finally:
-            download_status["is_running"] = False
     
-    thread = threading.Thread(target=run_download)
-    thread.start()
+    if not start_job("latest", run_download):
+        return jsonify({"error": "Download already in progress"}), 400
     
     return jsonify({"message": "Download started"})
 
 @app.route('/api/download/all', methods=['POST'])
 def download_all():
     """Update only existing sessions (download latest porządek from sessions we already have)"""
-    if download_status["is_running"]:
-        return jsonify({"error": "Download already in progress"}), 400
-    
     def run_download_all():
-        global download_status
-        download_status["is_running"] = True
         try:
             current_download_dir = get_current_download_dir()
             update_status("Sprawdzanie istniejących sesji...", 5)
             
-            existing_sessions = get_existing_sessions(current_download_dir)
+            existing_sessions = get_file_index(current_download_dir).sessions()
             if not existing_sessions:
                 update_status("Brak istniejących sesji do aktualizacji", 100, "Nie znaleziono żadnych sesji")
                 log_action("Brak sesji do aktualizacji", "Folder jest pusty")
@@ -294,23 +443,16 @@ def download_all():
         except Exception as e:
             update_status("Błąd podczas aktualizacji", 0, str(e))
             log_action("Błąd aktualizacji istniejących", str(e))
-        finally:
-            download_status["is_running"] = False
     
-    thread = threading.Thread(target=run_download_all)
-    thread.start()
+    if not start_job("all", run_download_all):
+        return jsonify({"error": "Download already in progress"}), 400
     
     return jsonify({"message": "Update existing sessions started"})
 
 @app.route('/api/download/session/<int:session_number>', methods=['POST'])
 def download_session(session_number):
     """Download specific session"""
-    if download_status["is_running"]:
-        return jsonify({"error": "Download already in progress"}), 400
-    
     def run_download_session():
-        global download_status
-        download_status["is_running"] = True
         try:
             update_status(f"Szukam Sesji {session_number}...", 20)
             
@@ -335,11 +477,9 @@ def download_session(session_number):
         except Exception as e:
             update_status("Błąd podczas pobierania sesji", 0, str(e))
             log_action("Błąd pobierania sesji", str(e))
-        finally:
-            download_status["is_running"] = False
     
-    thread = threading.Thread(target=run_download_session)
-    thread.start()
+    if not start_job("session", run_download_session):
+        return jsonify({"error": "Download already in progress"}), 400
     
     return jsonify({"message": f"Download session {session_number} started"})
 
@@ -347,12 +487,7 @@ def download_session(session_number):
 @app.route('/api/download/from_first', methods=['POST'])
 def download_from_first():
     """Download all sessions from the first session available online"""
-    if download_status["is_running"]:
-        return jsonify({"error": "Download already in progress"}), 400
-    
     def run_download_from_first():
-        global download_status
-        download_status["is_running"] = True
         try:
             update_status("Wyszukiwanie wszystkich sesji...", 5)
             all_sessions = get_all_sesja_urls()
@@ -377,66 +512,446 @@ def download_from_first():
         except Exception as e:
             update_status("Błąd podczas pobierania od pierwszej sesji", 0, str(e))
             log_action("Błąd pobierania od pierwszej", str(e))
-        finally:
-            download_status["is_running"] = False
     
-    thread = threading.Thread(target=run_download_from_first)
-    thread.start()
+    if not start_job("from_first", run_download_from_first):
+        return jsonify({"error": "Download already in progress"}), 400
     
     return jsonify({"message": "Download all sessions from first started"})
 
 
+def albums_version(indexes):
+    return "-".join(f"{quote(name)}:{index.version()}" for name, index in sorted(indexes.items()))
+
+
 @app.route('/api/files')
 def list_files():
-    """List all downloaded files"""
+    """List all downloaded files (from the incremental file index).
+    ?album=<name> lists another album, ?album=all every album (each file with its "album")"""
+    try:
+        indexes = requested_indexes()
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
+    try:
+        if 'album' not in request.args:
+            index = next(iter(indexes.values()))
+            return versioned_json(index.version(), index.list_files)
+
+        def build():
+            return [dict(item, album=name) for name, index in sorted(indexes.items())
+                    for item in index.list_files()]
+        return versioned_json(albums_version(indexes), build)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/stats')
+def get_stats():
+    """Archive statistics (per session, porządek and extension, keyword coverage)
+    from aggregates the file index keeps up to date; ?album=all gives them per album"""
+    try:
+        indexes = requested_indexes()
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
+    try:
+        if request.args.get('album') != 'all':
+            index = next(iter(indexes.values()))
+            return versioned_json(index.version(), index.statistics)
+        return versioned_json(albums_version(indexes),
+                              lambda: {name: index.statistics() for name, index in indexes.items()})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/search')
+def search_files():
+    """Full-text search in downloaded documents: /api/search?q=...&limit=20"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Podaj zapytanie (q)"}), 400
+    try:
+        limit = min(int(request.args.get('limit', 20)), 200)
+        started = time.perf_counter()
+        results = get_search_index(get_current_download_dir()).search(query, limit)
+        return jsonify({
+            "query": query,
+            "results": results,
+            "took_ms": round((time.perf_counter() - started) * 1000, 2)
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/search/rebuild', methods=['POST'])
+def rebuild_search_index():
+    """(Re)index existing files in the background.
+    Runs as a job, so only one rebuild (and no download) runs in any worker."""
+    current_download_dir = get_current_download_dir()
+
+    def run_rebuild():
+        try:
+            update_status("Indeksowanie plików...", 10)
+            result = get_search_index(current_download_dir).rebuild()
+            update_status("Zakończono indeksowanie!", 100)
+            log_action("Zaktualizowano indeks wyszukiwania",
+                       f"Nowe/zmienione: {result['indexed']}, usunięte: {result['removed']}, "
+                       f"czas: {result['seconds']} s")
+        except Exception as e:
+            update_status("Błąd podczas indeksowania", 0, str(e))
+            log_action("Błąd indeksowania", str(e))
+
+    if not start_job("search_rebuild", run_rebuild):
+        return jsonify({"error": "Download already in progress"}), 400
+
+    return jsonify({"message": "Indeksowanie rozpoczęte"})
+
+
+@app.route('/api/export/zip')
+def export_zip():
+    """Stream a ZIP of a session/agenda folder (?path=Sesja20 or ?path=Sesja20/Porzadek2)
+    or of full-text search results (?q=...)"""
     try:
-        files_info = []
         current_download_dir = get_current_download_dir()
-        if os.path.exists(current_download_dir):
-            for sesja_folder in os.listdir(current_download_dir):
-                sesja_path = os.path.join(current_download_dir, sesja_folder)
-                if os.path.isdir(sesja_path) and sesja_folder.startswith("Sesja"):
-                    
-                    for porzadek_folder in os.listdir(sesja_path):
-                        porzadek_path = os.path.join(sesja_path, porzadek_folder)
-                        if os.path.isdir(porzadek_path) and porzadek_folder.startswith("Porzadek"):
-                            
-                            for filename in os.listdir(porzadek_path):
-                                file_path = os.path.join(porzadek_path, filename)
-                                if os.path.isfile(file_path):
-                                    file_info = {
-                                        "filename": filename,
-                                        "sesja": sesja_folder,
-                                        "porzadek": porzadek_folder,
-                                        "size": os.path.getsize(file_path),
-                                        "modified": datetime.fromtimestamp(os.path.getmtime(file_path)).isoformat(),
-                                        "path": os.path.relpath(file_path, current_download_dir)
-                                    }
-                                    files_info.append(file_info)
-        
-        return jsonify(files_info)
+        query = request.args.get('q', '').strip()
+        rel_folder = request.args.get('path', '').strip().strip('/')
+        if query:
+            results = get_search_index(current_download_dir).search(query, limit=500)
+            files = [(r["path"], cold_storage.resolve(os.path.join(current_download_dir, r["path"])))
+                     for r in results]
+            files = [(arcname, path) for arcname, path in files if path]
+            zip_name = "wyniki_wyszukiwania.zip"
+        elif rel_folder:
+            folder = safe_join(current_download_dir, rel_folder)
+            if not folder or not os.path.isdir(folder) or not rel_folder.startswith("Sesja"):
+                return jsonify({"error": "Nie znaleziono folderu"}), 404
+            files = folder_files(current_download_dir, rel_folder)
+            zip_name = rel_folder.replace("/", "_") + ".zip"
+        else:
+            return jsonify({"error": "Podaj folder (path) lub zapytanie (q)"}), 400
+
+        if not files:
+            return jsonify({"error": "Brak plików do spakowania"}), 404
+
+        log_action("Eksport ZIP", f"{zip_name} ({len(files)} plików)")
+        return Response(stream_with_context(iter_zip(files)), mimetype="application/zip",
+                        headers={"Content-Disposition": f'attachment; filename="{zip_name}"'})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+
+@app.route('/api/blobs')
+def get_blob_stats():
+    """Blob store statistics (stored vs. deduplicated bytes, last scrub result)"""
+    try:
+        return jsonify(get_blob_store(get_current_download_dir()).stats())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/blobs/scrub', methods=['POST'])
+def scrub_blobs():
+    """Verify all stored blobs against their SHA-256 in the background.
+    Runs as a job, so it never overlaps a download or another scrub."""
+    store = get_blob_store(get_current_download_dir())
+
+    def run_scrub():
+        try:
+            update_status("Weryfikacja plików...", 10)
+            result = store.scrub()
+            if result["corrupt"]:
+                update_status("Weryfikacja zakończona - uszkodzone pliki", 100)
+                log_action("Błąd weryfikacji plików", f"Uszkodzone: {', '.join(result['corrupt'])}")
+            else:
+                update_status("Zakończono weryfikację plików!", 100)
+                log_action("Zweryfikowano pliki", f"Sprawdzono {result['checked']} w {result['seconds']} s")
+        except Exception as e:
+            update_status("Błąd podczas weryfikacji", 0, str(e))
+            log_action("Błąd weryfikacji plików", str(e))
+
+    if not start_job("scrub", run_scrub):
+        return jsonify({"error": "Download already in progress"}), 400
+
+    return jsonify({"message": "Weryfikacja rozpoczęta"})
+
+
+@app.route('/api/cold/compress', methods=['POST'])
+def compress_cold_sessions():
+    """Compress sessions unchanged for {"days": N} days (default COLD_AFTER_DAYS).
+    Runs as a job, so it never overlaps a download."""
+    data = request.get_json(silent=True) or {}
+    try:
+        days = float(data.get('days', cold_storage.COLD_AFTER_DAYS))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Nieprawidłowa liczba dni"}), 400
+    current_download_dir = get_current_download_dir()
+
+    def run_compress():
+        try:
+            update_status("Kompresja starych sesji...", 10)
+            summary = cold_storage.compress_sessions(current_download_dir, days)
+            saved = (summary["bytes_before"] - summary["bytes_after"]) / 1024 / 1024
+            update_status("Zakończono kompresję starych sesji!", 100)
+            log_action("Kompresja starych sesji",
+                       f"{len(summary['sessions'])} sesji, {summary['compressed']} plików, "
+                       f"zaoszczędzono {saved:.1f} MB w {summary['seconds']} s")
+        except Exception as e:
+            update_status("Błąd podczas kompresji", 0, str(e))
+            log_action("Błąd kompresji", str(e))
+
+    if not start_job("cold", run_compress):
+        return jsonify({"error": "Download already in progress"}), 400
+
+    return jsonify({"message": "Kompresja rozpoczęta", "sessions": cold_storage.cold_sessions(current_download_dir, days)})
+
+
+@app.route('/api/plan', methods=['POST'])
+def start_plan():
+    """Dry run: compare remote agendas with the archive ({"sessions": [3, 5]} or ?sessions=3,5).
+    Fetches only pages and HEADs; runs as a job, poll GET /api/plan for the result."""
+    data = request.get_json(silent=True) or {}
+    try:
+        sessions = data.get('sessions') or request.args.get('sessions', '')
+        if isinstance(sessions, str):
+            sessions = sessions.split(',')
+        sessions = [int(n) for n in sessions if str(n).strip()]
+    except (TypeError, ValueError):
+        return jsonify({"error": "Nieprawidłowe numery sesji"}), 400
+    current_download_dir = get_current_download_dir()
+
+    def run_build_plan():
+        try:
+            job_store.set("plan_state", {"building": True, "error": None})
+            update_status("Planowanie...", 5)
+
+            def progress(done, total, sesja_number):
+                update_status(f"Planowanie: Sesja {sesja_number} ({done}/{total})...", int(done / total * 90) + 5)
+
+            plan = run_sync(build_plan(current_download_dir, sessions, progress))
+            job_store.set("plan", plan)
+            job_store.set("plan_state", {"building": False, "error": None})
+            update_status("Plan gotowy!", 100)
+            log_action("Utworzono plan pobierania", f"plan {plan['id']}: {plan['summary']['todo']} plików do pobrania")
+        except Exception as e:
+            job_store.set("plan_state", {"building": False, "error": str(e)})
+            update_status("Błąd podczas planowania", 0, str(e))
+            log_action("Błąd planowania", str(e))
+
+    if not start_job("plan_build", run_build_plan):
+        return jsonify({"error": "Download already in progress"}), 400
+
+    return jsonify({"message": "Planowanie rozpoczęte"}), 202
+
+
+@app.route('/api/plan')
+def get_plan():
+    """The last plan (kept for /api/plan/execute) and whether a new one is being built"""
+    state = job_store.get("plan_state", {"building": False, "error": None})
+    if state["building"] and job_store.lease_holder(DOWNLOAD_LEASE) is None:
+        state = {"building": False, "error": "Planowanie przerwane"}  # the worker died
+    return jsonify(dict(state, plan=job_store.get("plan")))
+
+
+@app.route('/api/plan/execute', methods=['POST'])
+def execute_saved_plan():
+    """Download exactly the last plan: {"plan_id": "..."}"""
+    data = request.get_json(silent=True) or {}
+    plan = job_store.get("plan")
+    if not plan or plan["id"] != data.get('plan_id'):
+        return jsonify({"error": "Plan nie istnieje lub jest nieaktualny - utwórz nowy plan"}), 404
+    if plan["base_dir"] != os.path.abspath(get_current_download_dir()):
+        return jsonify({"error": "Plan dotyczy innego folderu - utwórz nowy plan"}), 409
+
+    def run_plan():
+        try:
+            def progress(done, total, sesja_number):
+                update_status(f"Plan: Sesja {sesja_number}...", int(done / total * 90) + 5)
+
+            results = run_sync(execute_plan(plan, progress))
+            update_status("Zakończono wykonywanie planu!", 100)
+            log_action("Wykonano plan pobierania",
+                       f"{len(results)} plików, plan {plan['id']} ({plan['summary']['todo']} zaplanowanych)")
+        except Exception as e:
+            update_status("Błąd podczas wykonywania planu", 0, str(e))
+            log_action("Błąd wykonywania planu", str(e))
+
+    if not start_job("plan", run_plan):
+        return jsonify({"error": "Download already in progress"}), 400
+
+    return jsonify({"message": "Wykonywanie planu rozpoczęte", "todo": plan["summary"]["todo"]})
+
+
 @app.route('/api/logs')
 def get_logs():
     """Get download logs"""
     try:
-        if os.path.exists(LOG_FILE):
-            with open(LOG_FILE, 'r', encoding='utf-8') as f:
-                logs = json.load(f)
-            return jsonify(logs[-20:])  # Last 20 entries
-        else:
-            return jsonify([])
+        return versioned_json(f"logs-{job_store.last_log_id()}",
+                              lambda: job_store.get_logs(20))  # Last 20 entries
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def download_watched_sessions(sessions):
+    """Watcher callback: download only the sessions with a new session/agenda page.
+    Returns False when another download is running (the watcher retries later)."""
+    def run_download_watched():
+        try:
+            current_download_dir = get_current_download_dir()
+            total_sessions = len(sessions)
+            for i, (sesja_url, sesja_number) in enumerate(sessions):
+                update_status(f"Nowe dokumenty: Sesja {sesja_number}...", int(i / total_sessions * 90) + 5)
+                download_specific_sesja(sesja_url, sesja_number, current_download_dir)
+            update_status("Zakończono pobieranie nowych dokumentów!", 100)
+            log_action("Pobrano nowe dokumenty (automatycznie)",
+                       ", ".join(f"Sesja {number}" for _, number in sessions))
+        except Exception as e:
+            update_status("Błąd podczas automatycznego pobierania", 0, str(e))
+            log_action("Błąd automatycznego pobierania", str(e))
+
+    return start_job("watcher", run_download_watched, options={"trace": False, "profile": False})
+
+
+def watcher_lease():
+    """Only one worker runs watcher checks; the lease outlives a few intervals"""
+    return job_store.acquire_lease("watcher", WORKER_ID, ttl=max(watcher.interval, 60) * 3)
+
+
+def watcher_interval():
+    return int(get_settings().get("watcher_interval") or 0)
+
+
+watcher = Watcher(download_watched_sessions, should_run=watcher_lease,
+                  get_interval=watcher_interval,
+                  checks_requested=lambda: job_store.get("watcher_check", 0),
+                  on_status=lambda status: job_store.set("watcher_status", status),
+                  on_stop=lambda: job_store.release_lease("watcher", WORKER_ID))
+
+
+def get_watcher_status():
+    """Watcher status as published by the worker holding the watcher lease"""
+    local = watcher.status()
+    interval = watcher_interval()
+    holder = job_store.lease_holder("watcher")
+    status = dict(job_store.get("watcher_status") or local)
+    status.update(interval=interval, worker=holder,
+                  running=interval > 0 and (holder is not None or local["running"]))
+    return status
+
+
+def apply_watcher_settings():
+    """Start or stop the background watcher according to the settings
+    (watchers of other workers follow the shared setting on their own)"""
+    interval = watcher_interval()
+    if interval > 0:
+        watcher.interval = interval
+        watcher.start()
+    else:
+        watcher.stop()
+
+
+@app.route('/api/watcher', methods=['GET'])
+def get_watcher():
+    """Get background watcher status"""
+    return jsonify(get_watcher_status())
+
+
+@app.route('/api/watcher', methods=['POST'])
+def set_watcher():
+    """Enable/disable the watcher: {"interval": seconds} (0 disables)"""
+    try:
+        data = request.get_json() or {}
+        interval = int(data.get('interval', 0))
+        if 0 < interval < 60:
+            return jsonify({"error": "Minimalny odstęp to 60 sekund"}), 400
+        update_settings(watcher_interval=interval)
+        apply_watcher_settings()
+        log_action("Zmieniono ustawienia obserwatora", f"Co {interval} s" if interval else "Wyłączony")
+        return jsonify(get_watcher_status())
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+
+@app.route('/api/watcher/check', methods=['POST'])
+def trigger_watcher():
+    """Run a watcher check now"""
+    if not get_watcher_status()["running"]:
+        return jsonify({"error": "Obserwator jest wyłączony"}), 400
+    # The worker holding the watcher lease picks this up within a few seconds
+    job_store.set("watcher_check", time.time())
+    watcher.trigger()
+    return jsonify({"message": "Sprawdzanie rozpoczęte"})
+
+
+@app.route('/api/traces')
+def list_traces():
+    """List saved job traces and profiles"""
+    if not os.path.isdir(TRACE_DIR):
+        return jsonify([])
+    names = sorted(os.listdir(TRACE_DIR), reverse=True)
+    return jsonify([{"name": name, "size": os.path.getsize(os.path.join(TRACE_DIR, name))} for name in names])
+
+
+@app.route('/api/traces/<path:name>')
+def download_trace(name):
+    """Download a trace (Chrome trace JSON) or profile (.prof) file"""
+    return send_from_directory(os.path.abspath(TRACE_DIR), name, as_attachment=True)
+
+
+def send_cold_file(cold_path, file_path, as_attachment):
+    """Serve a compressed file of an old session (cold_storage.py) under its original
+    name: the gzip bytes as they are when the client accepts gzip, otherwise
+    decompressed while streaming. No Range requests for these files."""
+    etag = file_sha256(cold_path)
+    mimetype = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+    gzipped = request.accept_encodings.quality("gzip") > 0
+    if gzipped:
+        response = send_file(cold_path, mimetype=mimetype, as_attachment=as_attachment,
+                             download_name=os.path.basename(file_path), conditional=False,
+                             max_age=FILE_CACHE_MAX_AGE)
+        etag += "-gz"  # another representation, another validator
+    else:
+        response = send_file(cold_storage.open_file(cold_path), mimetype=mimetype, as_attachment=as_attachment,
+                             download_name=os.path.basename(file_path), conditional=False,
+                             max_age=FILE_CACHE_MAX_AGE)
+        response.content_length = cold_storage.original_size(cold_path)
+    response.set_etag(etag)
+    response.vary.add("Accept-Encoding")
+    response.make_conditional(request, accept_ranges=False)
+    if gzipped and response.status_code == 200:
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
 @app.route('/download/<path:filename>')
 def download_file(filename):
-    """Download a specific file"""
+    """Download a specific file (?inline=1 opens it in the browser, e.g. a PDF viewer).
+    Uses the content hash as a strong ETag; 304 and Range requests are handled."""
     try:
         current_download_dir = get_current_download_dir()
-        return send_from_directory(current_download_dir, filename, as_attachment=True)
+        file_path = safe_join(os.path.abspath(current_download_dir), filename)
+        stored_path = cold_storage.resolve(file_path) if file_path else None
+        if not stored_path:
+            return jsonify({"error": "Nie znaleziono pliku"}), 404
+
+        as_attachment = request.args.get('inline') != '1'
+        if stored_path != file_path:
+            return send_cold_file(stored_path, file_path, as_attachment)
+        etag = file_sha256(file_path)
+
+        if SENDFILE_MODE == "x-accel":
+            # nginx serves the bytes (including Range); we only answer validators
+            response = Response(status=200)
+            response.set_etag(etag)
+            response.cache_control.public = True
+            response.cache_control.max_age = FILE_CACHE_MAX_AGE
+            if request.if_none_match.contains(etag):
+                response.status_code = 304
+                return response
+            response.headers["X-Accel-Redirect"] = X_ACCEL_PREFIX + quote(filename.replace(os.sep, "/"))
+            response.headers["Content-Type"] = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+            disposition = "attachment" if as_attachment else "inline"
+            response.headers["Content-Disposition"] = \
+                f"{disposition}; filename*=UTF-8''{quote(os.path.basename(file_path))}"
+            return response
+
+        return send_file(file_path, as_attachment=as_attachment, etag=etag,
+                         conditional=True, max_age=FILE_CACHE_MAX_AGE)
     except Exception as e:
         return jsonify({"error": str(e)}), 404
 
@@ -446,7 +961,7 @@ def get_folder_settings():
     """Get current folder settings"""
     return jsonify({
         "current_download_dir": get_current_download_dir(),
-        "available_albums": app_settings["available_albums"]
+        "available_albums": get_settings()["available_albums"]
     })
 
 
@@ -484,13 +999,15 @@ def add_album():
         if not album_name:
             return jsonify({"error": "Nazwa albumu nie może być pusta"}), 400
         
-        if album_name not in app_settings["available_albums"]:
-            app_settings["available_albums"].append(album_name)
-            save_settings()
+        available_albums = get_settings()["available_albums"]
+        if album_name not in available_albums:
+            available_albums = available_albums + [album_name]
+            update_settings(available_albums=available_albums)
+            warm_album_indexes()
             
         return jsonify({
             "message": f"Album '{album_name}' dodany",
-            "available_albums": app_settings["available_albums"]
+            "available_albums": available_albums
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -503,6 +1020,11 @@ if __name__ == '__main__':
     # Ensure download directory exists
     current_dir = get_current_download_dir()
     Path(current_dir).mkdir(parents=True, exist_ok=True)
+
+    # Start background watcher (only in the reloader child when debugging)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        apply_watcher_settings()
+        warm_album_indexes()
     
     # Run the app
     app.run(host='0.0.0.0', port=5000, debug=True)
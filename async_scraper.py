@@ -0,0 +1,760 @@
+"""
+Asyncio scraping engine
+All network I/O of rada_scraper (year index, session and agenda pages,
+attachment downloads, OpenRouter calls) runs as coroutines on one event loop
+in a background thread. throttle.py adapts the number of parallel requests
+to each server (AIMD) and caps bandwidth; blocking work (text extraction, renames, file hooks) runs in worker
+threads so the loop keeps many downloads and AI calls in flight.
+The functions in rada_scraper are thin synchronous wrappers over this module.
+In all-versions mode (ALL_AGENDA_VERSIONS=1 or the job's all_versions flag)
+a session download archives every "porządek obrad nr N", oldest first. Each
+version's attachment list is compared with the previous version: links seen
+before are revalidated with a conditional GET (the blob store's ETag and
+Last-Modified) and hardlinked from the previous folder, only new, changed and
+replaced druki are downloaded and analyzed. What each version holds is
+recorded in SesjaN/.agenda_versions.json.
+A save guard (set_save_guard, used by worker.py) is asked before an attachment
+gets its final name, so only one of several processes renames it.
+"""
+
+import asyncio
+import atexit
+import contextvars
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urljoin
+
+import cold_storage
+import deferred_naming
+import http_cache
+import keywords
+import rada_scraper
+import throttle
+from blob_store import file_sha256, get_blob_store
+from text_cache import get_text_cache
+from tracing import span
+
+BLOCKING_THREADS = int(os.getenv("SCRAPER_THREADS", "4"))  # text extraction, renames, hooks
+CHUNK_SIZE = 64 * 1024
+ATTACHMENT_EXTENSIONS = (".pdf", ".doc", ".docx", ".xls", ".xlsx", ".gml")
+ALL_VERSIONS = os.getenv("ALL_AGENDA_VERSIONS", "").lower() in ("1", "true", "yes", "on")
+VERSIONS_FILENAME = ".agenda_versions.json"
+
+_all_versions = contextvars.ContextVar("all_versions", default=None)
+_save_guard = contextvars.ContextVar("save_guard", default=None)
+
+_loop = None
+_loop_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=BLOCKING_THREADS, thread_name_prefix="scraper-io")
+# Only touched from the loop thread
+_session = None
+
+
+def set_all_versions(enabled):
+    """All-versions mode for the current thread/job (None = ALL_AGENDA_VERSIONS default)."""
+    _all_versions.set(enabled)
+
+
+def all_versions():
+    enabled = _all_versions.get()
+    return ALL_VERSIONS if enabled is None else enabled
+
+
+def set_save_guard(guard):
+    """Object with claim(save_dir, filename) -> bool and done(save_dir, filename),
+    consulted before every final rename in the current thread/job (None = no guard).
+    Its deferred() returns the guard for renames that happen after the job
+    (deferred_naming.py)."""
+    _save_guard.set(guard)
+
+
+def get_loop():
+    """The engine's event loop, started in a daemon thread on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="scraper-loop", daemon=True).start()
+        return _loop
+
+
+def shutdown():
+    """Close the HTTP session and stop the loop (registered with atexit)."""
+    global _loop
+    with _loop_lock:
+        loop, _loop = _loop, None
+    if loop is None:
+        return
+    if _session is not None:
+        try:
+            asyncio.run_coroutine_threadsafe(_session.close(), loop).result(timeout=5)
+        except Exception as e:
+            print(f"Error closing HTTP session: {e}")
+    loop.call_soon_threadsafe(loop.stop)
+
+
+atexit.register(shutdown)
+
+
+async def _run_blocking(func, *args):
+    """Run blocking work in the engine's thread pool, with the caller's
+    context variables (e.g. the job's trace)."""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_executor, context.run, func, *args)
+
+
+async def _in_context(coro, context):
+    """Run coro with the caller's context variables (e.g. the job's keyword mode)."""
+    for var, value in context.items():
+        var.set(value)
+    return await coro
+
+
+def run_sync(coro):
+    """Run a coroutine on the engine loop and wait for its result.
+    Must not be called from the loop itself (await the coroutine there)."""
+    loop = get_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("run_sync() wywołane w pętli silnika - użyj await")
+    context = contextvars.copy_context()
+    return asyncio.run_coroutine_threadsafe(_in_context(coro, context), loop).result()
+
+
+def _get_session():
+    """Shared aiohttp session; connections per host are limited by throttle.py."""
+    global _session
+    if _session is None or _session.closed:
+        import aiohttp  # heavy; only needed once the scraper goes online
+        _session = aiohttp.ClientSession(
+            headers=rada_scraper.HEADERS,
+            timeout=aiohttp.ClientTimeout(sock_connect=30, sock_read=120),
+            connector=aiohttp.TCPConnector(limit=0))
+    return _session
+
+
+def _conditional_headers(etag=None, last_modified=None):
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+
+async def _with_retries(attempt):
+    """Run attempt() again after 429/503 or an overload error, up to throttle.RETRIES
+    times; a Retry-After pause of the host applies to the next attempt."""
+    for n in range(throttle.RETRIES):
+        try:
+            return await attempt()
+        except Exception as e:
+            if n == throttle.RETRIES - 1 or not throttle.should_retry(e):
+                raise
+            await asyncio.sleep(0.5 * 2 ** n)
+
+
+async def fetch_page(url):
+    """Fetch an HTML page and return its text, through the page cache (http_cache.py)."""
+    cache = http_cache.get_cache()
+    entry = cache.get(url) if cache else None
+    if http_cache.replaying():
+        if entry is None:
+            raise http_cache.OfflineMiss(f"Brak strony w pamięci podręcznej (tryb offline): {url}")
+        cache.stats["replayed"] += 1
+        return entry["body"]
+    if entry and cache.is_fresh(entry):
+        cache.stats["hits"] += 1
+        return entry["body"]
+
+    try:
+        html, etag, last_modified = await fetch_page_if_changed(
+            url, *((entry["etag"], entry["last_modified"]) if entry else ()))
+    except Exception as e:
+        if not entry:
+            raise
+        print(f"Nie udało się odświeżyć {url} ({e}) - używam kopii z pamięci podręcznej")
+        cache.stats["stale"] += 1
+        return entry["body"]
+    if cache is None:
+        return html
+    if html is None:
+        cache.stats["revalidated"] += 1
+        cache.touch(url)
+        return entry["body"]
+    cache.stats["fetched"] += 1
+    cache.put(url, html, etag, last_modified)
+    return html
+
+
+async def fetch_page_if_changed(url, etag=None, last_modified=None):
+    """Conditional GET of an HTML page.
+    Returns (html, etag, last_modified); html is None when the server answered 304."""
+    headers = _conditional_headers(etag, last_modified)
+    session = _get_session()
+
+    async def attempt():
+        async with throttle.request_slot(url, session) as slot, session.get(url, headers=headers) as resp:
+            slot.response(resp)
+            if resp.status == 304:
+                return None, etag, last_modified
+            resp.raise_for_status()
+            return await resp.text(), resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+
+    with span("fetch_page", url=url, conditional=bool(headers)):
+        return await _with_retries(attempt)
+
+
+async def fetch_head(url):
+    """HEAD request: (size or None, etag) of an attachment without downloading it."""
+    if http_cache.replaying():
+        return None, None  # offline: nothing is known about the server's copy
+    session = _get_session()
+
+    async def attempt():
+        async with throttle.request_slot(url, session) as slot, session.head(url, allow_redirects=True) as resp:
+            slot.response(resp)
+            resp.raise_for_status()
+            return resp.content_length, resp.headers.get("ETag")
+
+    with span("head", url=url):
+        return await _with_retries(attempt)
+
+
+async def get_all_sesja_urls():
+    """All Sesja Rady Miasta links and their numbers (latest first)."""
+    url = rada_scraper.DEF_URL
+    sessions = rada_scraper.parse_sesja_links(await fetch_page(url), url)
+    cache = http_cache.get_cache()
+    if cache:
+        cache.mark_closed(http_cache.closed_sessions(sessions))
+    return sessions
+
+
+async def get_latest_sesja_url():
+    """Latest Sesja Rady Miasta link and its number."""
+    sessions = await get_all_sesja_urls()
+    if not sessions:
+        raise RuntimeError("Nie udało się znaleźć numeru sesji")
+    return sessions[0]  # assume first is the latest
+
+
+async def get_latest_porządek_url(sesja_url):
+    """Porządek obrad with the highest number inside a Sesja page."""
+    porzadki = rada_scraper.parse_porzadek_links(await fetch_page(sesja_url), sesja_url)
+    cache = http_cache.get_cache()
+    if cache and cache.is_closed(sesja_url):
+        # Agendas of a closed session do not change either
+        cache.mark_closed([url for url, _ in porzadki])
+    return max(porzadki, key=lambda x: x[1])
+
+
+async def download_to_file(file_url, dest_path, etag=None, last_modified=None):
+    """Stream an attachment to dest_path, hashing it on the way.
+    Returns (sha256, size, etag, last_modified); sha256 is None when the server
+    answered 304 Not Modified to the validators (nothing is written then)."""
+    if http_cache.replaying():
+        if etag or last_modified:
+            return None, 0, etag, last_modified  # stored before - treat as unchanged
+        raise http_cache.OfflineMiss(f"Brak pliku w archiwum (tryb offline): {file_url}")
+    headers = _conditional_headers(etag, last_modified)
+    session = _get_session()
+
+    async def attempt():
+        digest = hashlib.sha256()
+        size = 0
+        async with throttle.request_slot(file_url, session) as slot, \
+                session.get(file_url, headers=headers) as resp:
+            slot.response(resp)
+            if resp.status == 304:
+                return None, 0, etag, last_modified
+            resp.raise_for_status()
+            with open(dest_path, "wb") as f:
+                async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                    await throttle.bandwidth.consume(len(chunk))
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            return digest.hexdigest(), size, resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+
+    return await _with_retries(attempt)
+
+
+async def analyze_content_with_ai(content_text, model=None, on_sent=None):
+    """Use OpenRouter AI to analyze content and return 3-word summary
+    ("" when there is nothing to name, None when the call failed).
+    model defaults to OPENROUTER_MODEL; on_sent() is called when the request
+    got its connection slot and goes out (time spent queued is not latency)."""
+    if not content_text or len(content_text.strip()) < 10:
+        return ""
+
+    prompt = f"""
+    Analyze this Polish document text (first 35 words) and provide exactly 3 words that best describe its main topic or purpose.
+    The response should be in Polish and contain ONLY the 3 words, separated by spaces, no punctuation.
+
+    Document text:
+    {content_text}
+
+    Respond with exactly 3 Polish words:"""
+
+    headers = {
+        "Authorization": f"Bearer {rada_scraper.OPENROUTER_API_KEY}",
+        "Content-Type": "application/json"
+    }
+
+    data = {
+        "model": model or rada_scraper.OPENROUTER_MODEL,
+        "messages": [
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": 10,
+        "temperature": 0.3
+    }
+
+    url = rada_scraper.OPENROUTER_BASE_URL
+    session = _get_session()
+    try:
+        async with throttle.request_slot(url, session, robots=False) as slot:
+            if on_sent:
+                on_sent()
+            async with session.post(url, headers=headers, json=data) as response:
+                slot.response(response)
+                response.raise_for_status()
+                result = await response.json(content_type=None)
+
+        if 'choices' in result and len(result['choices']) > 0:
+            ai_response = result['choices'][0]['message']['content'].strip()
+            # Clean up the response - take only first 3 words
+            words = ai_response.split()[:3]
+            return "_".join(words) if words else ""
+        else:
+            print(f"Unexpected AI response format: {result}")
+            return ""
+
+    except Exception as e:
+        print(f"Error calling OpenRouter AI: {e}")
+        return None
+
+
+def _extract_for_naming(source_path, sha256, archive_dir):
+    """Text for naming: (full_text, first 35 words), from the text cache when
+    this content was extracted before. Runs in a worker thread."""
+    texts = get_text_cache(archive_dir)
+    if rada_scraper.FILE_SAVED_HOOKS:
+        # Extract once for both naming and the registered hooks
+        full_text = texts.full_text(source_path, sha256)
+        return full_text, " ".join(full_text.split()[:35])
+    return "", texts.preview(source_path, sha256)
+
+
+def _save_attachment(link, original_filename, save_dir, existing_filename, druk_number,
+                     temp_filepath, sha256, ai_keywords, full_text, store, replace=False):
+    """Give a downloaded attachment its final name (or rename the existing copy;
+    with replace=True the existing copy gets the new content). Runs in a worker
+    thread, notifies the file hooks and returns the final filename."""
+    if existing_filename:
+        # File exists but without keywords - rename existing file and remove temp
+        if replace:
+            print(f"Plik DRUK_NR{druk_number} zmienił się na serwerze - zastępuję go")
+        else:
+            print(f"Plik DRUK_NR{druk_number} istnieje bez słów kluczowych - dodaję słowa kluczowe")
+        existing_filepath = os.path.join(save_dir, existing_filename)
+
+        # Generate new filename with AI keywords using existing file extension
+        # (a compressed copy of an old session is written back as a plain file)
+        plain_filename = cold_storage.logical_name(existing_filename)
+        existing_ext = os.path.splitext(plain_filename)[1]
+        if ai_keywords:
+            new_filename = f"DRUK_NR{druk_number}_{ai_keywords}{existing_ext}"
+        else:
+            new_filename = plain_filename  # Keep original if AI failed
+
+        new_filepath = os.path.join(save_dir, new_filename)
+
+        # Rename existing file
+        with span("rename", druk=druk_number):
+            if store:
+                # Replace the existing copy with a link to the stored blob
+                if os.path.exists(temp_filepath):
+                    store.put(temp_filepath, sha256)
+                store.link(sha256, new_filepath)
+                if new_filepath != existing_filepath:
+                    os.remove(existing_filepath)
+            elif replace or cold_storage.is_cold(existing_filename):
+                os.replace(temp_filepath, new_filepath)
+                if new_filepath != existing_filepath:
+                    os.remove(existing_filepath)
+            else:
+                os.rename(existing_filepath, new_filepath)
+                # Remove temporary file
+                os.remove(temp_filepath)
+        if replace:
+            print(f"Zastąpiono plik: {existing_filename} -> {new_filename}")
+        else:
+            print(f"Przemianowano istniejący plik: {existing_filename} -> {new_filename}")
+        rada_scraper.notify_file_saved(new_filepath, full_text, old_path=existing_filepath, sha256=sha256)
+        return new_filename
+
+    # New file - generate filename and save
+    final_filename = rada_scraper.generate_new_filename(link, original_filename, ai_keywords)
+    final_filepath = os.path.join(save_dir, final_filename)
+
+    # Rename temp file to final name
+    with span("rename", druk=druk_number):
+        if store:
+            if os.path.exists(temp_filepath):
+                store.put(temp_filepath, sha256)
+            store.link(sha256, final_filepath)
+        else:
+            os.rename(temp_filepath, final_filepath)
+        # A compressed copy from cold storage is replaced by the new plain file
+        cold_twin = final_filepath + cold_storage.COLD_SUFFIX
+        if os.path.exists(cold_twin):
+            os.remove(cold_twin)
+        else:
+            cold_twin = None
+    print(f"Zapisano jako: {final_filepath}")
+    rada_scraper.notify_file_saved(final_filepath, full_text, old_path=cold_twin, sha256=sha256)
+    return final_filename
+
+
+async def download_attachment(link, porzadek_url, save_dir, store=None, replace=False):
+    """Download, name and store one attachment link.
+    replace=True downloads it even when the druk is already saved with keywords
+    (its content changed on the server) and replaces the saved copy.
+    Returns {"url", "filename", "bytes", "seconds"}, or None when it was skipped."""
+    started = time.perf_counter()
+    file_url = urljoin(porzadek_url, link["href"])
+    original_filename = os.path.basename(file_url.split("?")[0])  # clean ?params
+
+    # Extract druk number first to check for duplicates
+    druk_number = rada_scraper.get_druk_number_from_link(link)
+
+    # Check if file with this druk number already exists
+    exists, has_keywords, existing_filename = rada_scraper.check_druk_exists_in_directory(save_dir, druk_number)
+
+    if exists and has_keywords and not replace:
+        print(f"Plik DRUK_NR{druk_number} z słowami kluczowymi już istnieje - pomijam {original_filename}")
+        return None
+
+    # Download to temporary file (either new file or to analyze existing one)
+    temp_filepath = os.path.join(save_dir, f"temp_{original_filename}")
+    known = store.get_url(file_url) if store else None
+    print(f"Pobieram {file_url} -> temp file")
+    with span("download", druk=druk_number, url=file_url):
+        sha256, size, etag, last_modified = await download_to_file(
+            file_url, temp_filepath, *(known[1:] if known else ()))
+    source_path = temp_filepath
+    if sha256 is None:
+        # 304 - the attachment did not change since we stored it
+        sha256 = known[0]
+        source_path = await _run_blocking(store.plain_path, sha256)
+        size = os.path.getsize(source_path)
+        print("Plik nie zmienił się na serwerze - używam zapisanej kopii")
+
+    # Identical content already stored - reuse its keywords
+    archive_dir = os.path.dirname(os.path.dirname(save_dir))
+    ai_keywords = store.get_keywords(sha256) if store and store.has(sha256) else None
+    full_text = None
+    ask_ai_later = False
+    if ai_keywords:
+        print(f"Identyczny plik już pobrany - używam słów kluczowych: {ai_keywords}")
+    else:
+        # Analyze content with AI
+        ai_keywords = ""
+        print(f"Analizuję zawartość pliku {original_filename}...")
+        with span("extract", druk=druk_number):
+            full_text, content_text = await _run_blocking(_extract_for_naming, source_path, sha256, archive_dir)
+        if content_text:
+            ai_keywords, ask_ai_later = await keywords.file_keywords(content_text, archive_dir)
+            if ai_keywords is not None:
+                print(f"Wygenerowano słowa kluczowe ({keywords.current_mode()}): {ai_keywords}")
+        else:
+            print("Nie udało się wyciągnąć tekstu z pliku")
+
+    guard = _save_guard.get()
+    if guard is not None and not await _run_blocking(guard.claim, save_dir, original_filename):
+        print(f"{original_filename} zapisuje inny proces - pomijam")
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+        return None
+
+    final_filename = await _run_blocking(
+        _save_attachment, link, original_filename, save_dir, existing_filename if exists else None,
+        druk_number, temp_filepath, sha256, ai_keywords, full_text, store, replace)
+    if guard is not None:
+        await _run_blocking(guard.done, save_dir, original_filename)
+    named = f"DRUK_NR{druk_number}" + (f"_{ai_keywords}" if ai_keywords else "")
+    if ask_ai_later and druk_number and final_filename.startswith((named + ".", named + "_")):
+        # The AI is unavailable - the file keeps its basic (or local) name until it comes back
+        await deferred_naming.defer(os.path.join(save_dir, final_filename), content_text, druk_number,
+                                    sha256, store, guard, ai_keywords)
+
+    if store:
+        if ai_keywords and not ask_ai_later:
+            store.set_keywords(sha256, ai_keywords)
+        store.set_url(file_url, sha256, etag, last_modified)
+
+    print("---")
+    return {
+        "url": file_url,
+        "filename": final_filename,
+        "sha256": sha256,
+        "bytes": size,
+        "seconds": time.perf_counter() - started
+    }
+
+
+def attachment_links(html):
+    """<a> tags of the attachments on a Porządek obrad page."""
+    from bs4 import BeautifulSoup
+
+    with span("parse_links"):
+        soup = BeautifulSoup(html, "html.parser")
+        return [link for link in soup.find_all("a", href=True)
+                if link["href"].lower().endswith(ATTACHMENT_EXTENSIONS)]
+
+
+async def download_links(links, porzadek_url, save_dir, store=None, replace_hrefs=()):
+    """Download attachment links of one agenda into save_dir.
+    Different druki are downloaded concurrently; the attachments of one druk
+    run in page order, so a later one sees the file saved by the earlier one.
+    Links whose href is in replace_hrefs replace the saved copy (see download_attachment).
+    Returns the per-file results (skipped files are not included)."""
+    groups = {}
+    for link in links:
+        druk_number = rada_scraper.get_druk_number_from_link(link)
+        groups.setdefault(druk_number or link["href"], []).append(link)
+
+    async def download_group(group):
+        results = []
+        for link in group:
+            result = await download_attachment(link, porzadek_url, save_dir, store,
+                                               replace=link["href"] in replace_hrefs)
+            if result:
+                results.append(result)
+        return results
+
+    # Let every druk finish before reporting the first error, so nothing keeps
+    # writing into save_dir after we return
+    outcomes = await asyncio.gather(*(download_group(g) for g in groups.values()), return_exceptions=True)
+    for outcome in outcomes:
+        if isinstance(outcome, BaseException):
+            raise outcome
+    return [result for group_results in outcomes for result in group_results]
+
+
+async def download_attachments(porzadek_url, save_dir, store=None):
+    """Download all file attachments from a Porządek obrad page.
+    Returns the per-file results (skipped files are not included)."""
+    links = attachment_links(await fetch_page(porzadek_url))
+    return await download_links(links, porzadek_url, save_dir, store)
+
+
+def _load_versions(sesja_dir):
+    # Cold storage compressed the manifest too before it learned to skip dotfiles
+    path = cold_storage.resolve(os.path.join(sesja_dir, VERSIONS_FILENAME))
+    if path is None:
+        return {}
+    try:
+        with cold_storage.open_file(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_versions(sesja_dir, versions):
+    path = os.path.join(sesja_dir, VERSIONS_FILENAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(versions, f, ensure_ascii=False, indent=1)
+    os.replace(path + ".tmp", path)
+    if os.path.exists(path + cold_storage.COLD_SUFFIX):
+        os.remove(path + cold_storage.COLD_SUFFIX)
+
+
+def diff_links(links, porzadek_url, previous):
+    """Split an agenda's links against the previous version's manifest
+    ({file_url: {"filename", "sha256"}}): (unchanged, new, changed).
+    A druk whose link points at another file than before counts as changed."""
+    previous_druki = {rada_scraper.get_druk_number_from_link(link) for link in previous.get("links", ())} - {None}
+    unchanged, new, changed = [], [], []
+    for link in links:
+        file_url = urljoin(porzadek_url, link["href"])
+        if file_url in previous.get("files", {}):
+            unchanged.append(link)
+        elif rada_scraper.get_druk_number_from_link(link) in previous_druki:
+            changed.append(link)
+        else:
+            new.append(link)
+    return unchanged, new, changed
+
+
+def _link_unchanged(file_url, entry, previous_dir, save_dir):
+    """Hardlink the file an unchanged link produced in the previous version
+    into save_dir. Returns its manifest entry, or None when that file is gone."""
+    source = cold_storage.resolve(os.path.join(previous_dir, cold_storage.logical_name(entry["filename"])))
+    if not source:
+        return None
+    filename = os.path.basename(source)
+    dest = os.path.join(save_dir, filename)
+    if not os.path.exists(dest):
+        try:
+            os.link(source, dest)
+        except OSError:
+            shutil.copy2(source, dest)
+        rada_scraper.notify_file_saved(dest, None, sha256=entry.get("sha256"))
+    return {"filename": filename, "sha256": entry.get("sha256")}
+
+
+def _kept_entry(entry, save_dir):
+    """Manifest entry of a file an earlier run saved into save_dir, or None when it is gone."""
+    stored = cold_storage.resolve(os.path.join(save_dir, cold_storage.logical_name(entry["filename"])))
+    return {"filename": os.path.basename(stored), "sha256": entry.get("sha256")} if stored else None
+
+
+async def _still_same(file_url, entry, save_dir, store):
+    """Conditional GET of a link seen before, with the validators the blob store
+    keeps for its URL: True when the server still has the file in entry
+    (304, or the same content where the server sends no validators)."""
+    known = store.get_url(file_url)
+    if known and known[0] != entry.get("sha256"):
+        return False
+    temp_filepath = os.path.join(save_dir, f"temp_check_{hashlib.sha1(file_url.encode()).hexdigest()[:12]}")
+    try:
+        sha256, size, etag, last_modified = await download_to_file(file_url, temp_filepath, *(known[1:] if known else ()))
+    finally:
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+    if sha256 is None:
+        return True
+    if sha256 == entry.get("sha256"):
+        store.set_url(file_url, sha256, etag, last_modified)
+        return True
+    return False
+
+
+def _saved_entry(link, porzadek_url, save_dir, results):
+    """Manifest entry of a link downloaded (or skipped as already saved) into save_dir."""
+    file_url = urljoin(porzadek_url, link["href"])
+    if file_url in results:
+        return {"filename": results[file_url]["filename"], "sha256": results[file_url]["sha256"]}
+    druk_number = rada_scraper.get_druk_number_from_link(link)
+    if druk_number:
+        filename = rada_scraper.check_druk_exists_in_directory(save_dir, druk_number)[2]
+    else:
+        stored = cold_storage.resolve(os.path.join(save_dir, os.path.basename(file_url.split("?")[0])))
+        filename = os.path.basename(stored) if stored else None
+    if not filename:
+        return None
+    return {"filename": filename, "sha256": file_sha256(os.path.join(save_dir, filename))}
+
+
+async def download_all_versions(sesja_url, sesja_number, base_save_dir):
+    """Download every porządek of a session, oldest first, fetching only the
+    attachments that are new or changed against the previous version.
+    Links seen before (in the previous version, or in the newest version on an
+    earlier run according to the manifest) are revalidated with a conditional
+    GET first, so a file replaced on BIP under the same URL is downloaded again.
+    Returns the per-file results of the downloads."""
+    sesja_dir = os.path.join(base_save_dir, f"Sesja{sesja_number}")
+    Path(sesja_dir).mkdir(parents=True, exist_ok=True)
+    porzadki = sorted(rada_scraper.parse_porzadek_links(await fetch_page(sesja_url), sesja_url),
+                      key=lambda x: x[1])
+    versions = await _run_blocking(_load_versions, sesja_dir)
+    store = get_blob_store(base_save_dir)
+    results = []
+    previous, previous_dir = {}, None
+    for porzadek_url, porzadek_number in porzadki:
+        save_dir = os.path.join(sesja_dir, f"Porzadek{porzadek_number}")
+        Path(save_dir).mkdir(parents=True, exist_ok=True)
+        links = attachment_links(await fetch_page(porzadek_url))
+        unchanged, new, changed = diff_links(links, porzadek_url, previous)
+
+        # What an earlier run already saved for this version
+        saved = versions.get(str(porzadek_number), {})
+        saved_files = saved.get("files", {}) if saved.get("url") == porzadek_url else {}
+        files, kept = {}, []
+        for link in unchanged + new:
+            file_url = urljoin(porzadek_url, link["href"])
+            entry = saved_files.get(file_url) and await _run_blocking(_kept_entry, saved_files[file_url], save_dir)
+            if entry:
+                files[file_url] = entry
+                kept.append(link)
+        unchanged = [link for link in unchanged if link not in kept]
+        new = [link for link in new if link not in kept]
+
+        # Files kept in older versions are their history; only the newest can still change
+        latest = porzadek_number == porzadki[-1][1]
+        seen = [(link, files[urljoin(porzadek_url, link["href"])]) for link in kept if latest] + \
+               [(link, previous["files"][urljoin(porzadek_url, link["href"])]) for link in unchanged]
+        same = await asyncio.gather(*(_still_same(urljoin(porzadek_url, link["href"]), entry, save_dir, store)
+                                      for link, entry in seen))
+        replaced = [link for (link, _), ok in zip(seen, same) if not ok]
+        for link in replaced:
+            files.pop(urljoin(porzadek_url, link["href"]), None)
+        unchanged = [link for link in unchanged if link not in replaced]
+
+        for link in unchanged:
+            file_url = urljoin(porzadek_url, link["href"])
+            entry = await _run_blocking(_link_unchanged, file_url, previous["files"][file_url], previous_dir, save_dir)
+            if entry:
+                files[file_url] = entry
+            else:
+                new.append(link)  # the earlier copy is gone - download it again
+        print(f"Porządek {porzadek_number}: {len(new)} nowych, {len(changed) + len(replaced)} zmienionych, "
+              f"{len(files)} bez zmian")
+
+        changed += replaced
+        downloaded = await download_links(new + changed, porzadek_url, save_dir, store,
+                                          replace_hrefs={link["href"] for link in replaced})
+        results.extend(downloaded)
+        by_url = {result["url"]: result for result in downloaded}
+        for link in new + changed:
+            entry = await _run_blocking(_saved_entry, link, porzadek_url, save_dir, by_url)
+            if entry:
+                files[urljoin(porzadek_url, link["href"])] = entry
+
+        previous = {"url": porzadek_url, "links": links, "files": files}
+        previous_dir = save_dir
+        versions[str(porzadek_number)] = {"url": porzadek_url, "files": files}
+        await _run_blocking(_save_versions, sesja_dir, versions)
+    return results
+
+
+async def download_specific_sesja(sesja_url, sesja_number, base_save_dir):
+    """Download the latest porządek from a specific session (every porządek
+    in all-versions mode). Returns the per-file results of the downloads."""
+    try:
+        print(f"Przetwarzanie Sesji {sesja_number}...")
+        if all_versions():
+            results = await download_all_versions(sesja_url, sesja_number, base_save_dir)
+            print(f"Zakończono Sesję {sesja_number}")
+            return results
+
+        # Get latest porządek for this session
+        porzadek_url, porzadek_number = await get_latest_porządek_url(sesja_url)
+
+        # Create directories
+        sesja_dir = os.path.join(base_save_dir, f"Sesja{sesja_number}")
+        porzadek_dir = os.path.join(sesja_dir, f"Porzadek{porzadek_number}")
+        Path(porzadek_dir).mkdir(parents=True, exist_ok=True)
+
+        print(f"Pobieranie z Porządku {porzadek_number}...")
+        results = await download_attachments(porzadek_url, porzadek_dir, store=get_blob_store(base_save_dir))
+
+        print(f"Zakończono Sesję {sesja_number}")
+        return results
+
+    except Exception as e:
+        print(f"Błąd podczas przetwarzania Sesji {sesja_number}: {e}")
+        raise
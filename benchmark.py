@@ -0,0 +1,523 @@
+"""
+Benchmark harness
+Runs the scraper end to end against the local BIP stand-in (bip_standin.py)
+and reports files/sec, MB/sec, per-file latency percentiles and peak RSS.
+The startup benchmark measures cold starts of the app (a gunicorn worker
+spawn) and the CLIs in fresh interpreters, with an import-time breakdown.
+The load benchmark serves a synthetic archive with the dev server or gunicorn
+and drives it with N simulated dashboards (page load, /api/status polled
+every 2 s, list refreshes, file downloads); it reports throughput, latency
+percentiles and errors per route.
+The cold benchmark compresses a synthetic archive with cold_storage.py and
+reports the disk space saved and the read latency of plain files against
+decompressed and gzip-passthrough reads of the compressed copies.
+Results are appended to a JSON-lines file so runs can be compared.
+
+Usage:
+    python benchmark.py e2e --sessions 3 --druki 20 --size-kb 200 --ai-latency 0.2
+    python benchmark.py startup --runs 7
+    python benchmark.py load --clients 20 --duration 30 --server both
+    python benchmark.py cold --archive-sessions 20 --archive-files 20 --size-kb 200
+"""
+
+import argparse
+import contextlib
+import gzip
+import http.client
+import io
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from urllib.parse import quote
+
+import bip_standin
+
+RESULTS_FILE = "bench_results.jsonl"
+
+# Code run in a fresh interpreter for each startup measurement
+STARTUP_TARGETS = {
+    "interpreter": "pass",
+    "import_app": "import app",
+    "first_response": "import app; assert app.app.test_client().get('/api/logs').status_code == 200",
+    "cli_planner": "import planner",
+    "cli_script": "import script",
+}
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None where unsupported)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def load_previous(results_file, name, config):
+    """Return the last stored result with the same benchmark name and config."""
+    if not os.path.exists(results_file):
+        return None
+    previous = None
+    with open(results_file, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get("benchmark") == name and entry.get("config") == config:
+                previous = entry
+    return previous
+
+
+def save_result(results_file, entry):
+    with open(results_file, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def print_report(entry, previous=None):
+    """Print metrics, with the relative change against the previous run."""
+    print(f"\n=== {entry['benchmark']} ({entry['timestamp']}) ===")
+    for key, value in entry["metrics"].items():
+        line = f"{key:>22}: {value}"
+        old = (previous or {}).get("metrics", {}).get(key)
+        if isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+            line += f"   ({(value - old) / old * 100:+.1f}% vs {old})"
+        print(line)
+
+
+def run_e2e(config, quiet=True):
+    """Download the whole synthetic archive (like download_from_first) and measure it."""
+    server = bip_standin.start_standin(config)
+    import http_cache
+    import rada_scraper
+
+    rada_scraper.DEF_URL = server.base_url
+    rada_scraper.OPENROUTER_BASE_URL = server.ai_url
+    target_dir = tempfile.mkdtemp(prefix="bench_sesje_")
+    # Synthetic pages must not end up in the user's page cache
+    previous_cache_db = http_cache.CACHE_DB
+    http_cache.set_db(os.path.join(target_dir, "http_cache.db"))
+    results = []
+    output = io.StringIO() if quiet else sys.stdout
+    try:
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(output):
+            for sesja_url, sesja_number in rada_scraper.get_all_sesja_urls():
+                results.extend(rada_scraper.download_specific_sesja(sesja_url, sesja_number, target_dir) or [])
+        elapsed = time.perf_counter() - started
+    finally:
+        server.shutdown()
+        http_cache.set_db(previous_cache_db)
+        shutil.rmtree(target_dir, ignore_errors=True)
+
+    latencies = [r["seconds"] for r in results]
+    total_bytes = sum(r["bytes"] for r in results)
+    return {
+        "files": len(results),
+        "seconds": round(elapsed, 3),
+        "files_per_sec": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "mb_per_sec": round(total_bytes / (1024 * 1024) / elapsed, 2) if elapsed else 0.0,
+        "p50_file_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_file_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "peak_rss_mb": peak_rss_mb(),
+        "ai_calls": server.stats.get("ai_calls", 0),
+        "ai_429": server.stats.get("ai_429", 0),
+    }
+
+
+def _time_python(code, env):
+    """Wall time of `python -c code` in a fresh process, in seconds."""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def import_breakdown(module, env, top=8):
+    """Top-level imports of a module by cumulative import time (ms), from -X importtime."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            env=env, capture_output=True, text=True, check=True)
+    totals, children = {}, {}
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( +)(\S+)", line)
+        if not match:
+            continue
+        # Children are listed before their parent, indented by two more spaces
+        depth, name = len(match.group(2)), match.group(3)
+        if depth == 3:
+            children[name] = round(int(match.group(1)) / 1000, 1)
+        elif depth == 1:
+            if name == module:
+                totals = children
+            children = {}
+    return dict(sorted(totals.items(), key=lambda item: -item[1])[:top])
+
+
+def run_startup(runs=5):
+    """Median cold-start times (ms) of the app and CLIs in fresh interpreters."""
+    state_dir = tempfile.mkdtemp(prefix="bench_startup_")
+    env = dict(os.environ, STATE_DB=os.path.join(state_dir, "state.db"),
+               DOWNLOAD_DIR=os.path.join(state_dir, "data"), PYTHONDONTWRITEBYTECODE="1")
+    try:
+        # Warm up the OS file cache and the __pycache__ of every module once
+        for code in STARTUP_TARGETS.values():
+            _time_python(code, env)
+        metrics = {}
+        for name, code in STARTUP_TARGETS.items():
+            times = [_time_python(code, env) for _ in range(runs)]
+            metrics[f"{name}_ms"] = round(percentile(times, 0.5) * 1000, 1)
+        breakdown = import_breakdown("app", env)
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+    return metrics, breakdown
+
+
+def make_archive(base_dir, sessions, files_per_session, size_kb):
+    """Synthetic SesjaN/Porzadek1 archive with keyword-named attachments.
+    Returns the relative paths of the files."""
+    paths = []
+    for sesja in range(1, sessions + 1):
+        folder = os.path.join(base_dir, f"Sesja{sesja}", "Porzadek1")
+        os.makedirs(folder, exist_ok=True)
+        for index in range(files_per_session):
+            number = bip_standin.druk_number(sesja, index)
+            ext = ("pdf", "docx", "gml")[index % 3]
+            name = f"DRUK_NR{number}_budżet_miasto_zmiana.{ext}"
+            with open(os.path.join(folder, name), "wb") as f:
+                f.write(bip_standin.make_attachment(number, ext, size_kb * 1024))
+            paths.append(f"Sesja{sesja}/Porzadek1/{name}")
+    return paths
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app_server(server, port, env, workers=2, threads=4):
+    """Run the app with the Flask dev server or gunicorn in a subprocess."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    if server == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"]
+        env = dict(env, BIND=f"127.0.0.1:{port}", WEB_CONCURRENCY=str(workers), THREADS=str(threads))
+    else:
+        command = [sys.executable, "-c",
+                   "from app import app, load_settings; load_settings(); "
+                   f"app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    process = subprocess.Popen(command, cwd=here, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/api/logs")
+            if conn.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+        if process.poll() is not None:
+            break
+    process.kill()
+    raise RuntimeError(f"Serwer {server} nie wystartował")
+
+
+class DashboardClient:
+    """One browser tab of the dashboard: keeps its connection alive, sends
+    Accept-Encoding and If-None-Match like a browser, and polls like app.js."""
+
+    def __init__(self, port, files, deadline, record, poll=2.0, download_rate=0.1, seed=0):
+        self.port = port
+        self.files = files
+        self.deadline = deadline
+        self.record = record
+        self.poll = poll
+        self.download_rate = download_rate
+        self.rng = random.Random(seed)
+        self.etags = {}
+        self.conn = None
+
+    def get(self, route, path):
+        """GET path; returns the (decompressed) body."""
+        headers = {"Accept-Encoding": "gzip"}
+        if path in self.etags:
+            headers["If-None-Match"] = self.etags[path]
+        started = time.perf_counter()
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+            self.conn.request("GET", path, headers=headers)
+            response = self.conn.getresponse()
+            body = response.read()
+            if response.getheader("ETag"):
+                self.etags[path] = response.getheader("ETag")
+            self.record(route, response.status, time.perf_counter() - started, len(body))
+            return gzip.decompress(body) if response.getheader("Content-Encoding") == "gzip" else body
+        except (OSError, http.client.HTTPException) as e:
+            self.record(route, type(e).__name__, time.perf_counter() - started, 0)
+            self.conn.close()
+            self.conn = None
+            return b""
+
+    def refresh_lists(self):
+        self.get("files", "/api/files")
+        self.get("stats", "/api/stats")
+        self.get("logs", "/api/logs")
+
+    def run(self):
+        # Page load: HTML, its CSS/JS (cached as immutable afterwards), then the data
+        page = self.get("page", "/").decode("utf-8", "replace")
+        for asset in sorted(set(re.findall(r'/static/[^"\']+', page))):
+            self.get("static", asset)
+        self.get("status", "/api/status")
+        self.get("folder", "/api/settings/folder")
+        self.refresh_lists()
+
+        # Tabs are not opened in sync
+        time.sleep(self.rng.uniform(0, self.poll))
+        tick = 0
+        while time.monotonic() < self.deadline:
+            self.get("status", "/api/status")
+            tick += 1
+            if tick % 5 == 0:
+                self.refresh_lists()
+            if self.files and self.rng.random() < self.download_rate:
+                self.get("download", "/download/" + quote(self.rng.choice(self.files)))
+            time.sleep(max(0.0, self.poll - 0.01))
+        if self.conn:
+            self.conn.close()
+
+
+def run_load(config):
+    """Serve a synthetic archive and drive it with simulated dashboards."""
+    standin = bip_standin.start_standin({"sessions": config["archive_sessions"]})
+    work_dir = tempfile.mkdtemp(prefix="bench_load_")
+    base_dir = os.path.join(work_dir, "data")
+    files = make_archive(base_dir, config["archive_sessions"], config["archive_files"], config["size_kb"])
+    env = dict(os.environ, DOWNLOAD_DIR=base_dir, STATE_DB=os.path.join(work_dir, "state.db"),
+               HTTP_CACHE_DB=os.path.join(work_dir, "http_cache.db"), BIP_URL=standin.base_url, OPENROUTER_BASE_URL=standin.ai_url, WATCH_INTERVAL="0")
+    port = _free_port()
+    process = start_app_server(config["server"], port, env, config.get("workers", 1), config.get("threads", 1))
+
+    samples = []
+    lock = threading.Lock()
+
+    def record(route, status, seconds, size):
+        with lock:
+            samples.append((route, status, seconds, size))
+
+    try:
+        deadline = time.monotonic() + config["duration"]
+        clients = [DashboardClient(port, files, deadline, record, config["poll"], config["download_rate"], seed=n)
+                   for n in range(config["clients"])]
+        threads = [threading.Thread(target=client.run, daemon=True) for client in clients]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        standin.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    def is_error(status):
+        return not isinstance(status, int) or status >= 500
+
+    metrics = {
+        "requests": len(samples),
+        "rps": round(len(samples) / elapsed, 1),
+        "error_rate": round(sum(is_error(s[1]) for s in samples) / len(samples), 4) if samples else 0.0,
+        "mb_sent": round(sum(s[3] for s in samples) / (1024 * 1024), 1),
+    }
+    routes = {}
+    for route in sorted({s[0] for s in samples}):
+        latencies = [s[2] for s in samples if s[0] == route]
+        statuses = [s[1] for s in samples if s[0] == route]
+        routes[route] = {
+            "requests": len(latencies),
+            "rps": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+            "errors": sum(is_error(status) for status in statuses),
+            "not_modified": statuses.count(304),
+        }
+        for key in ("p50_ms", "p95_ms", "errors"):
+            metrics[f"{route}_{key}"] = routes[route][key]
+    return metrics, routes
+
+
+def print_routes(routes):
+    print(f"\n{'route':>10} {'req':>7} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'304':>6} {'errors':>7}")
+    for route, row in routes.items():
+        print(f"{route:>10} {row['requests']:>7} {row['rps']:>7} {row['p50_ms']:>8} {row['p95_ms']:>8} "
+              f"{row['p99_ms']:>8} {row['not_modified']:>6} {row['errors']:>7}")
+
+
+def _disk_usage(base_dir):
+    """Bytes of the files below base_dir, each hardlinked inode counted once."""
+    seen, total = set(), 0
+    for dirpath, dirnames, filenames in os.walk(base_dir):
+        for filename in filenames:
+            stat = os.stat(os.path.join(dirpath, filename))
+            if stat.st_ino not in seen:
+                seen.add(stat.st_ino)
+                total += stat.st_size
+    return total
+
+
+def _read_times(paths, reader, reads):
+    """Per-read latencies (ms) of reading whole files with reader(path)."""
+    times = []
+    for index in range(reads):
+        path = paths[index % len(paths)]
+        started = time.perf_counter()
+        with reader(path) as f:
+            while f.read(1024 * 1024):
+                pass
+        times.append((time.perf_counter() - started) * 1000)
+    return times
+
+
+def run_cold(config):
+    """Compress a synthetic archive whose sessions are all old and measure it."""
+    import cold_storage
+
+    base_dir = tempfile.mkdtemp(prefix="bench_cold_")
+    try:
+        paths = make_archive(base_dir, config["archive_sessions"], config["archive_files"], config["size_kb"])
+        old = time.time() - 2 * config["days"] * 24 * 3600
+        for rel in paths:
+            os.utime(os.path.join(base_dir, rel), (old, old))
+        plain = [os.path.join(base_dir, rel) for rel in paths]
+        random.Random(0).shuffle(plain)
+        plain_times = _read_times(plain, lambda path: open(path, "rb"), config["reads"])
+
+        bytes_before = _disk_usage(base_dir)
+        summary = cold_storage.compress_sessions(base_dir, config["days"])
+        bytes_after = _disk_usage(base_dir)
+
+        stored = [cold_storage.resolve(path) for path in plain]
+        cold = [path for path in stored if cold_storage.is_cold(path)]
+        cold_times = _read_times(cold, cold_storage.open_file, config["reads"]) if cold else []
+        gzip_times = _read_times(cold, lambda path: open(path, "rb"), config["reads"]) if cold else []
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+    return {
+        "files": len(paths),
+        "compressed_files": summary["compressed"],
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after,
+        "saved_pct": round((bytes_before - bytes_after) / bytes_before * 100, 1) if bytes_before else 0.0,
+        "compress_seconds": summary["seconds"],
+        "read_plain_p50_ms": round(percentile(plain_times, 0.5), 3),
+        "read_plain_p95_ms": round(percentile(plain_times, 0.95), 3),
+        "read_decompress_p50_ms": round(percentile(cold_times, 0.5), 3),
+        "read_decompress_p95_ms": round(percentile(cold_times, 0.95), 3),
+        "read_gzip_p50_ms": round(percentile(gzip_times, 0.5), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Testy wydajności pobierania")
+    parser.add_argument("--results", default=RESULTS_FILE, help="plik JSONL z wynikami")
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+
+    e2e = sub.add_parser("e2e", help="pełne pobieranie z lokalnego BIP i atrapy OpenRouter")
+    bip_standin.add_config_arguments(e2e)
+    e2e.add_argument("--verbose", action="store_true", help="pokaż komunikaty scrapera")
+
+    startup = sub.add_parser("startup", help="czas zimnego startu aplikacji i CLI")
+    startup.add_argument("--runs", type=int, default=5, help="liczba pomiarów każdego wariantu")
+
+    load = sub.add_parser("load", help="obciążenie API symulowanymi panelami przeglądarki")
+    load.add_argument("--server", choices=("dev", "gunicorn", "both"), default="both")
+    load.add_argument("--clients", type=int, default=20, help="liczba jednoczesnych paneli")
+    load.add_argument("--duration", type=float, default=30, help="czas testu (s)")
+    load.add_argument("--poll", type=float, default=2.0, help="odstęp odpytywania /api/status (s)")
+    load.add_argument("--download-rate", type=float, default=0.1, help="szansa pobrania pliku na odpytanie")
+    load.add_argument("--workers", type=int, default=2, help="procesy gunicorna")
+    load.add_argument("--threads", type=int, default=4, help="wątki na proces gunicorna")
+    load.add_argument("--archive-sessions", type=int, default=20, help="sesje w syntetycznym archiwum")
+    load.add_argument("--archive-files", type=int, default=20, help="pliki na sesję")
+    load.add_argument("--size-kb", type=int, default=200, help="rozmiar pliku (KB)")
+
+    cold = sub.add_parser("cold", help="oszczędność miejsca i koszt odczytu skompresowanych sesji")
+    cold.add_argument("--archive-sessions", type=int, default=20, help="sesje w syntetycznym archiwum")
+    cold.add_argument("--archive-files", type=int, default=20, help="pliki na sesję")
+    cold.add_argument("--size-kb", type=int, default=200, help="rozmiar pliku (KB)")
+    cold.add_argument("--reads", type=int, default=200, help="liczba zmierzonych odczytów")
+    cold.add_argument("--days", type=float, default=180, help="wiek sesji uznanej za starą (dni)")
+
+    args = parser.parse_args()
+    runs = []
+    if args.benchmark == "startup":
+        metrics, breakdown = run_startup(args.runs)
+        runs.append(({"runs": args.runs}, metrics, {"imports_ms": breakdown}))
+    elif args.benchmark == "load":
+        servers = ("dev", "gunicorn") if args.server == "both" else (args.server,)
+        for server in servers:
+            config = {key: getattr(args, key) for key in
+                      ("clients", "duration", "poll", "download_rate", "workers", "threads",
+                       "archive_sessions", "archive_files", "size_kb")}
+            config["server"] = server
+            if server == "dev":
+                del config["workers"], config["threads"]
+            metrics, routes = run_load(config)
+            runs.append((config, metrics, {"routes": routes}))
+    elif args.benchmark == "cold":
+        config = {key: getattr(args, key) for key in
+                  ("archive_sessions", "archive_files", "size_kb", "reads", "days")}
+        runs.append((config, run_cold(config), {}))
+    else:
+        config = {key: getattr(args, key) for key in bip_standin.DEFAULT_CONFIG}
+        runs.append((config, run_e2e(config, quiet=not args.verbose), {}))
+
+    for config, metrics, extra in runs:
+        entry = {
+            "benchmark": args.benchmark,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "config": config,
+            "metrics": metrics,
+        }
+        print_report(entry, load_previous(args.results, args.benchmark, config))
+        if extra.get("imports_ms"):
+            print("\nNajwolniejsze importy app.py (ms, łącznie z zależnościami):")
+            for module, ms in extra["imports_ms"].items():
+                print(f"{module:>22}: {ms}")
+        if extra.get("routes"):
+            print(f"Serwer: {config['server']}")
+            print_routes(extra["routes"])
+        entry.update(extra)
+        save_result(args.results, entry)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""
+Local BIP stand-in
+Serves synthetic year, session and agenda pages shaped like bip.pila.pl,
+generated PDF/DOCX/GML attachments and a mock OpenRouter endpoint.
+Used by benchmark.py so performance work can be measured offline.
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+import zipfile
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+DEFAULT_CONFIG = {
+    "year": 2025,
+    "sessions": 3,            # number of Sesja pages on the year index
+    "porzadki": 2,            # "porządek obrad nr N" versions per session
+    "druki": 20,              # druki on the first agenda version
+    "new_per_version": 2,     # druki added by every later agenda version
+    "size_kb": 200,           # approximate attachment size
+    "types": "pdf,docx,gml",  # attachment types, assigned round-robin
+    "page_latency": 0.0,      # seconds added to every HTML page
+    "ai_latency": 0.05,       # seconds the mock OpenRouter takes to answer
+    "ai_jitter": 0.0,         # +/- random seconds added to ai_latency
+    "ai_tail_rate": 0.0,      # fraction of AI calls that take ai_tail_latency instead
+    "ai_tail_latency": 2.0,   # seconds of such a slow AI call (long-tail latency)
+    "ai_429_rate": 0.0,       # fraction of AI calls answered with 429
+    "file_latency": 0.0,      # seconds before an attachment is sent
+    "overload_at": 0,         # more parallel attachment requests get 503 (0 = never)
+}
+
+TOPICS = [
+    ("budżet", "miasto", "zmiana"),
+    ("edukacja", "informacja", "realizacja"),
+    ("wynagrodzenie", "prezydent", "rada"),
+    ("przetarg", "najem", "lokal"),
+    ("plan", "zagospodarowanie", "przestrzenne"),
+    ("interpelacje", "radni", "zapytania"),
+    ("dotacja", "organizacje", "pozarządowe"),
+    ("opłata", "targowa", "stawki"),
+]
+
+ROMAN_NUMERALS = [
+    (1000, "M"), (900, "CM"), (500, "D"), (400, "CD"), (100, "C"), (90, "XC"),
+    (50, "L"), (40, "XL"), (10, "X"), (9, "IX"), (5, "V"), (4, "IV"), (1, "I")
+]
+
+
+def int_to_roman(number):
+    """Convert a positive integer to a roman numeral (e.g. 17 -> XVII)."""
+    result = ""
+    for value, numeral in ROMAN_NUMERALS:
+        while number >= value:
+            result += numeral
+            number -= value
+    return result
+
+
+def druk_number(sesja_number, index):
+    """Druk numbers are unique across the synthetic archive."""
+    return sesja_number * 100 + index
+
+
+def agenda_druki(config, sesja_number, porzadek_number):
+    """List (druk_number, extension) on a given agenda version.
+    Every later version repeats the previous druki and adds new_per_version."""
+    types = [t.strip() for t in config["types"].split(",") if t.strip()]
+    count = config["druki"] + (porzadek_number - 1) * config["new_per_version"]
+    return [(druk_number(sesja_number, i), types[i % len(types)]) for i in range(1, count + 1)]
+
+
+def druk_text(number, folded=False):
+    """Deterministic Polish-like text describing a druk."""
+    words = TOPICS[number % len(TOPICS)]
+    text = (f"Projekt uchwały nr {number} Rady Miasta Piły w sprawie: "
+            f"{' '.join(words)}. Na podstawie art. 18 ust. 2 ustawy o samorządzie gminnym "
+            f"Rada Miasta Piły uchwala, co następuje: {words[0]} {words[1]} {words[2]}.")
+    if folded:
+        text = text.translate(str.maketrans("ąćęłńóśźżĄĆĘŁŃÓŚŹŻ", "acelnoszzACELNOSZZ"))
+    return text
+
+
+def _pdf_stream(data):
+    return b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream"
+
+
+def make_pdf(text, size):
+    """Build a one-page PDF with extractable text, padded to roughly size bytes."""
+    escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    content = f"BT /F1 11 Tf 50 750 Td ({escaped}) Tj ET".encode("latin-1", "replace")
+    padding = random.Random(size).randbytes(max(0, size - 1024))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        _pdf_stream(content),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        _pdf_stream(padding),
+    ]
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % i + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def make_docx(text, size):
+    """Build a DOCX with the text as paragraphs, padded with a stored binary part."""
+    from docx import Document
+
+    doc = Document()
+    for sentence in text.split(". "):
+        doc.add_paragraph(sentence)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    missing = size - buffer.tell()
+    if missing > 0:
+        with zipfile.ZipFile(buffer, "a", compression=zipfile.ZIP_STORED) as archive:
+            archive.writestr("customXml/padding.bin", random.Random(size).randbytes(missing))
+    return buffer.getvalue()
+
+
+def make_gml(text, size):
+    """Build a GML document; coordinate lists make it compress very well."""
+    head = (f'<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<gml:FeatureCollection xmlns:gml="http://www.opengis.net/gml">\n'
+            f'<gml:description>{text}</gml:description>\n')
+    row = '<gml:pos>16.738 53.151</gml:pos>\n'
+    tail = '</gml:FeatureCollection>\n'
+    rows = max(0, (size - len(head) - len(tail)) // len(row))
+    return (head + row * rows + tail).encode("utf-8")
+
+
+@lru_cache(maxsize=256)
+def make_attachment(number, ext, size):
+    """Generate (and memoize) the bytes of one synthetic attachment."""
+    if ext == "pdf":
+        return make_pdf(druk_text(number, folded=True), size)
+    if ext == "docx":
+        return make_docx(druk_text(number), size)
+    return make_gml(druk_text(number), size)
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """Routes year index, session, agenda and attachment URLs plus the AI mock."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _count(self, key, amount=1):
+        with self.server.stats_lock:
+            self.server.stats[key] = self.server.stats.get(key, 0) + amount
+
+    def _send(self, status, body, content_type, extra_headers=None, head_only=False):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if not head_only:
+            self.wfile.write(body)
+            self._count("bytes_sent", len(body))
+
+    def _send_page(self, html, head_only):
+        config = self.server.config
+        if config["page_latency"]:
+            time.sleep(config["page_latency"])
+        body = html.encode("utf-8")
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        headers = {"ETag": etag, "Last-Modified": self.server.started_http_date}
+        self._count("pages")
+        if self.headers.get("If-None-Match") == etag:
+            self._count("pages_not_modified")
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self._send(200, body, "text/html; charset=utf-8", headers, head_only)
+
+    def _route(self, head_only=False):
+        config = self.server.config
+        path = urlparse(self.path).path
+        parts = [p for p in path.split("/") if p]
+
+        if path == f"/{config['year']}.html":
+            items = "\n".join(
+                f'<li><a href="/sesja-{n}.html">{int_to_roman(n)} Sesja Rady Miasta Piły</a></li>'
+                for n in range(config["sessions"], 0, -1)
+            )
+            return self._send_page(f"<html><body><h1>Sesje {config['year']}</h1><ul>\n{items}\n</ul></body></html>",
+                                   head_only)
+
+        if len(parts) == 1 and parts[0].startswith("sesja-") and parts[0].endswith(".html"):
+            sesja = int(parts[0][len("sesja-"):-len(".html")])
+            if not 1 <= sesja <= config["sessions"]:
+                return self._send(404, b"not found", "text/plain")
+            items = "\n".join(
+                f'<li><a href="/sesja-{sesja}/porzadek-{m}.html">Porządek obrad nr {m}</a></li>'
+                for m in range(1, config["porzadki"] + 1)
+            )
+            return self._send_page(f"<html><body><h1>{int_to_roman(sesja)} Sesja</h1><ul>\n{items}\n</ul></body></html>",
+                                   head_only)
+
+        if len(parts) == 2 and parts[0].startswith("sesja-") and parts[1].startswith("porzadek-"):
+            sesja = int(parts[0][len("sesja-"):])
+            porzadek = int(parts[1][len("porzadek-"):-len(".html")])
+            if not (1 <= sesja <= config["sessions"] and 1 <= porzadek <= config["porzadki"]):
+                return self._send(404, b"not found", "text/plain")
+            items = "\n".join(
+                f'<li><a href="/files/{sesja}/druk-{number}.{ext}">DRUK NR {number}</a></li>'
+                for number, ext in agenda_druki(config, sesja, porzadek)
+            )
+            return self._send_page(f"<html><body><h1>Porządek obrad nr {porzadek}</h1><ul>\n{items}\n</ul></body></html>",
+                                   head_only)
+
+        if len(parts) == 3 and parts[0] == "files":
+            with self.server.stats_lock:
+                self.server.files_in_flight += 1
+                overloaded = config["overload_at"] and self.server.files_in_flight > config["overload_at"]
+            try:
+                if overloaded:
+                    self._count("files_503")
+                    return self._send(503, b"busy", "text/plain", {"Retry-After": "1"}, head_only)
+                if config["file_latency"]:
+                    time.sleep(config["file_latency"])
+                return self._send_attachment(parts, head_only)
+            finally:
+                with self.server.stats_lock:
+                    self.server.files_in_flight -= 1
+
+        self._send(404, b"not found", "text/plain", head_only=head_only)
+
+    def _send_attachment(self, parts, head_only):
+        """Attachment body with an ETag; 304 when the client has it."""
+        config = self.server.config
+        name, _, ext = parts[2].partition(".")
+        number = int(name[len("druk-"):])
+        body = make_attachment(number, ext, config["size_kb"] * 1024)
+        etag = '"%d-%d"' % (number, len(body))
+        if self.headers.get("If-None-Match") == etag:
+            self._count("files_not_modified")
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self._count("files")
+        return self._send(200, body, "application/octet-stream", {"ETag": etag}, head_only)
+
+    def do_GET(self):
+        self._route()
+
+    def do_HEAD(self):
+        self._route(head_only=True)
+
+    def do_POST(self):
+        config = self.server.config
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if urlparse(self.path).path != "/api/v1/chat/completions":
+            return self._send(404, b"not found", "text/plain")
+
+        self._count("ai_calls")
+        rng = random.Random()
+        delay = config["ai_latency"] + rng.uniform(-config["ai_jitter"], config["ai_jitter"])
+        if rng.random() < config["ai_tail_rate"]:
+            delay = config["ai_tail_latency"]
+        time.sleep(max(0.0, delay))
+        if rng.random() < config["ai_429_rate"]:
+            self._count("ai_429")
+            body = json.dumps({"error": {"code": 429, "message": "Rate limit exceeded"}}).encode("utf-8")
+            return self._send(429, body, "application/json", {"Retry-After": "1"})
+
+        prompt = payload.get("messages", [{}])[-1].get("content", "")
+        words = TOPICS[int(hashlib.sha1(prompt.encode("utf-8")).hexdigest(), 16) % len(TOPICS)]
+        result = {
+            "model": payload.get("model", ""),
+            "choices": [{"message": {"role": "assistant", "content": " ".join(words)}}]
+        }
+        self._send(200, json.dumps(result, ensure_ascii=False).encode("utf-8"), "application/json")
+
+
+def start_standin(config=None, host="127.0.0.1", port=0):
+    """Start the stand-in in a daemon thread and return the server.
+    server.base_url is the year index URL (use as BIP_URL),
+    server.ai_url the mock chat completions URL (use as OPENROUTER_BASE_URL)."""
+    server = ThreadingHTTPServer((host, port), StandinHandler)
+    server.daemon_threads = True
+    server.config = dict(DEFAULT_CONFIG, **(config or {}))
+    server.stats = {}
+    server.stats_lock = threading.Lock()
+    server.files_in_flight = 0
+    server.started_http_date = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime())
+    root = f"http://{host}:{server.server_address[1]}"
+    server.base_url = f"{root}/{server.config['year']}.html"
+    server.ai_url = f"{root}/api/v1/chat/completions"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_config_arguments(parser):
+    """Expose DEFAULT_CONFIG keys as --options (shared with benchmark.py)."""
+    for key, default in DEFAULT_CONFIG.items():
+        parser.add_argument("--" + key.replace("_", "-"), dest=key, type=type(default), default=default)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lokalny zamiennik BIP i OpenRouter do testów wydajności")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    config = {key: getattr(args, key) for key in DEFAULT_CONFIG}
+
+    server = start_standin(config, args.host, args.port)
+    print(f"BIP_URL={server.base_url}")
+    print(f"OPENROUTER_BASE_URL={server.ai_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Content-addressed blob store
+Attachments are stored once under <download dir>/.blobs/<sha[:2]>/<sha256>
+and the SesjaN/PorzadekM tree holds hardlinks to them (or copies where the
+filesystem has no hardlinks). Byte-identical druki published again in a later
+"porządek obrad" therefore take no extra space and reuse the AI keywords of
+the first copy. Note: with hardlinks, editing a file in place edits the blob
+shared by all agendas - scrub() reports such changes.
+Blobs of compressed old sessions are kept as <sha256>.gz (cold_storage.py).
+"""
+
+import gzip
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+BLOB_DIRNAME = ".blobs"
+CHUNK_SIZE = 1024 * 1024
+
+HASH_CACHE_SIZE = 10000  # paths whose hash is remembered
+
+_hash_cache = OrderedDict()  # path -> (size, mtime_ns, sha256), least recently used first
+_hash_cache_lock = threading.Lock()
+
+
+def file_sha256(path):
+    """SHA-256 of a file, cached per path while its size and mtime stay the same."""
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    with _hash_cache_lock:
+        cached = _hash_cache.get(key)
+        if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            _hash_cache.move_to_end(key)
+            return cached[2]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    sha256 = digest.hexdigest()
+    with _hash_cache_lock:
+        # A rewritten file replaces its old entry
+        _hash_cache[key] = (stat.st_size, stat.st_mtime_ns, sha256)
+        _hash_cache.move_to_end(key)
+        while len(_hash_cache) > HASH_CACHE_SIZE:
+            _hash_cache.popitem(last=False)
+    return sha256
+
+
+class BlobStore:
+    """Blob files plus a small SQLite index of blob metadata and known URLs."""
+
+    def __init__(self, base_dir):
+        self.root = os.path.join(os.path.abspath(base_dir), BLOB_DIRNAME)
+        os.makedirs(self.root, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(self.root, "index.db"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                size INTEGER,
+                keywords TEXT,
+                created REAL
+            );
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                sha256 TEXT,
+                etag TEXT,
+                last_modified TEXT
+            );
+        """)
+        self.last_scrub = None
+
+    def blob_path(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def cold_blob_path(self, sha256):
+        return self.blob_path(sha256) + ".gz"
+
+    def has(self, sha256):
+        return bool(sha256) and (os.path.exists(self.blob_path(sha256))
+                                 or os.path.exists(self.cold_blob_path(sha256)))
+
+    def plain_path(self, sha256):
+        """Path of the plain blob, recreated from its compressed copy if needed."""
+        target = self.blob_path(sha256)
+        if not os.path.exists(target):
+            tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with gzip.open(self.cold_blob_path(sha256), "rb") as source, open(tmp_path, "wb") as f:
+                shutil.copyfileobj(source, f, CHUNK_SIZE)
+            os.replace(tmp_path, target)
+        return target
+
+    def drop_plain(self, sha256):
+        """Remove the plain blob once only the store links to it and a
+        compressed copy exists."""
+        path = self.blob_path(sha256)
+        try:
+            if os.stat(path).st_nlink == 1 and os.path.exists(self.cold_blob_path(sha256)):
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def put(self, temp_path, sha256):
+        """Move a downloaded file into the store (dropping it if the blob already exists)."""
+        target = self.blob_path(sha256)
+        if os.path.exists(target):
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(temp_path, target)
+            with self.lock, self.conn:
+                self.conn.execute("INSERT OR IGNORE INTO blobs (sha256, size, created) VALUES (?, ?, ?)",
+                                  (sha256, os.path.getsize(target), time.time()))
+        return target
+
+    def link(self, sha256, dest_path):
+        """Make dest_path point at the blob: hardlink, or a copy as fallback."""
+        source = self.plain_path(sha256)
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        try:
+            os.link(source, dest_path)
+        except OSError:
+            shutil.copy2(source, dest_path)
+
+    def get_keywords(self, sha256):
+        with self.lock:
+            row = self.conn.execute("SELECT keywords FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+        return row[0] if row else None
+
+    def set_keywords(self, sha256, keywords):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE blobs SET keywords = ? WHERE sha256 = ?", (keywords, sha256))
+
+    def get_url(self, url):
+        """Known (sha256, etag, last_modified) of an attachment URL, or None."""
+        with self.lock:
+            row = self.conn.execute("SELECT sha256, etag, last_modified FROM urls WHERE url = ?",
+                                    (url,)).fetchone()
+        return row if row and self.has(row[0]) else None
+
+    def set_url(self, url, sha256, etag=None, last_modified=None):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO urls (url, sha256, etag, last_modified) VALUES (?, ?, ?, ?)",
+                              (url, sha256, etag, last_modified))
+
+    def iter_blobs(self):
+        for prefix in os.scandir(self.root):
+            if prefix.is_dir() and len(prefix.name) == 2:
+                for entry in os.scandir(prefix.path):
+                    if entry.is_file() and (len(entry.name) == 64
+                                            or len(entry.name) == 67 and entry.name.endswith(".gz")):
+                        yield entry
+
+    def stats(self):
+        count, stored, linked, cold = 0, 0, 0, 0
+        for entry in self.iter_blobs():
+            stat = entry.stat()
+            count += 1
+            stored += stat.st_size
+            cold += entry.name.endswith(".gz")
+            # every link beyond the blob itself is a copy we did not have to store
+            linked += stat.st_size * max(0, stat.st_nlink - 2)
+        return {"blobs": count, "cold_blobs": cold, "stored_bytes": stored, "saved_bytes": linked,
+                "last_scrub": self.last_scrub}
+
+    def scrub(self, workers=4):
+        """Re-hash every blob in parallel and report blobs whose content changed."""
+        started = time.perf_counter()
+
+        def verify(entry):
+            digest = hashlib.sha256()
+            cold = entry.name.endswith(".gz")
+            try:
+                with (gzip.open if cold else open)(entry.path, "rb") as f:
+                    for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                        digest.update(chunk)
+            except (OSError, EOFError):
+                return entry.name, False  # unreadable gzip stream
+            return entry.name, digest.hexdigest() == entry.name[:64]
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(verify, self.iter_blobs()))
+
+        self.last_scrub = {
+            "checked": len(results),
+            "corrupt": [name for name, ok in results if not ok],
+            "seconds": round(time.perf_counter() - started, 3),
+            "finished": time.strftime("%Y-%m-%dT%H:%M:%S")
+        }
+        return self.last_scrub
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_blob_store(base_dir):
+    """Shared BlobStore instance per archive folder."""
+    key = os.path.abspath(base_dir)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = BlobStore(key)
+        return _stores[key]
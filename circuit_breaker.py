@@ -0,0 +1,76 @@
+"""
+Circuit breaker
+Stops calling a failing service for a while. After `threshold` failures in a
+row the circuit opens and calls are refused without waiting; after
+`reset_timeout` seconds one trial call is let through (half-open). Its
+success closes the circuit, its failure opens it again.
+"""
+
+import time
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+
+    def __init__(self, name, threshold=3, reset_timeout=30.0):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_at = 0.0
+        self.opened = 0           # how many times the circuit opened
+        self.refused = 0          # calls refused while open
+        self.listeners = []       # listener(breaker) on every state change
+
+    def retry_in(self):
+        """Seconds until a call would be allowed (0 = now)."""
+        if self.state == CLOSED:
+            return 0.0
+        since = self.opened_at if self.state == OPEN else self.probe_at
+        return max(0.0, since + self.reset_timeout - time.monotonic())
+
+    def allow(self):
+        """May a call go out now? In half-open state one trial call at a time;
+        a trial that never reports back is replaced after reset_timeout."""
+        if self.retry_in() > 0:
+            self.refused += 1
+            return False
+        if self.state != CLOSED:
+            self.probe_at = time.monotonic()
+            self._change(HALF_OPEN)
+        return True
+
+    def success(self):
+        self.failures = 0
+        self._change(CLOSED)
+
+    def failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+            if self.state != OPEN:
+                self.opened += 1
+            self._change(OPEN)
+
+    def _change(self, state):
+        if state == self.state:
+            return
+        print(f"Obwód {self.name}: {self.state} -> {state}")
+        self.state = state
+        for listener in self.listeners:
+            try:
+                listener(self)
+            except Exception as e:
+                print(f"Error in circuit breaker listener: {e}")
+
+    def status(self):
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "retry_in": round(self.retry_in(), 1),
+            "opened": self.opened,
+            "refused": self.refused
+        }
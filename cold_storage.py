@@ -0,0 +1,190 @@
+"""
+Cold storage of old sessions
+SesjaN folders whose files have not changed for COLD_AFTER_DAYS days are
+compressed file by file: DRUK_NR12_plan.gml becomes DRUK_NR12_plan.gml.gz with
+the same mtime. Files that would not shrink by at least MIN_SAVING (PDFs with
+compressed streams, images) stay as they are. Druki stay deduplicated: the .gz
+is a hardlink to .blobs/<sha[:2]>/<sha256>.gz, and the plain blob is removed
+once no folder links to it any more (blob_store.py thaws it when a later
+agenda needs the plain file again).
+Readers keep seeing the original file: the file list and search use the name
+without .gz, /download sends the gzip bytes as they are (Content-Encoding:
+gzip) or decompresses them while streaming, and text extraction and the ZIP
+export read through open_file(). A changed druk downloaded later is written
+as a plain file again.
+
+Usage:
+    python cold_storage.py --dir ./data --days 180
+    python cold_storage.py --dir ./data --days 180 --dry-run
+"""
+
+import argparse
+import gzip
+import os
+import shutil
+import struct
+import time
+
+from blob_store import BLOB_DIRNAME, file_sha256, get_blob_store
+
+COLD_SUFFIX = ".gz"
+COLD_AFTER_DAYS = float(os.getenv("COLD_AFTER_DAYS", "180"))
+MIN_SAVING = 0.1   # keep the plain file unless gzip saves at least 10%
+GZIP_LEVEL = 6
+CHUNK_SIZE = 1024 * 1024
+
+
+def is_cold(path):
+    return path.endswith(COLD_SUFFIX)
+
+
+def logical_name(name):
+    """Name (or path) of a file as readers see it: without the .gz of cold files."""
+    return name[:-len(COLD_SUFFIX)] if is_cold(name) else name
+
+
+def resolve(path):
+    """Path on disk of an archive file given by its original name
+    (the file itself or its cold .gz), None when neither exists."""
+    for candidate in (path, path + COLD_SUFFIX):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def open_file(path):
+    """Binary file object with the original content of a plain or cold file."""
+    return gzip.open(path, "rb") if is_cold(path) else open(path, "rb")
+
+
+def original_size(path):
+    """Size of the original content (for cold files from the gzip trailer,
+    which stores it modulo 4 GB - enough for agenda attachments)."""
+    if not is_cold(path):
+        return os.path.getsize(path)
+    with open(path, "rb") as f:
+        f.seek(-4, os.SEEK_END)
+        return struct.unpack("<I", f.read(4))[0]
+
+
+def _gzip_to(source_path, target_path):
+    """Compress source_path into target_path (through a temp file); returns the size."""
+    tmp_path = f"{target_path}.{os.getpid()}.tmp"
+    with open(source_path, "rb") as source, open(tmp_path, "wb") as raw, \
+            gzip.GzipFile(filename="", mode="wb", fileobj=raw, compresslevel=GZIP_LEVEL, mtime=0) as target:
+        shutil.copyfileobj(source, target, CHUNK_SIZE)
+    os.replace(tmp_path, target_path)
+    return os.path.getsize(target_path)
+
+
+def compress_file(path, store=None):
+    """Replace one plain archive file by its .gz. Returns (plain bytes, cold bytes),
+    or None when compression does not pay off."""
+    from rada_scraper import notify_file_saved
+
+    stat = os.stat(path)
+    target = path + COLD_SUFFIX
+    sha256 = file_sha256(path)
+    blob = store.blob_path(sha256) if store else None
+    if blob and os.path.exists(blob) and os.path.samefile(blob, path):
+        # Share one compressed blob between all agendas with this druk
+        source = store.cold_blob_path(sha256)
+        if not os.path.exists(source):
+            if _gzip_to(path, source) > stat.st_size * (1 - MIN_SAVING):
+                os.remove(source)
+                return None
+        if os.path.exists(target):
+            os.remove(target)
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+    elif _gzip_to(path, target) > stat.st_size * (1 - MIN_SAVING):
+        os.remove(target)
+        return None
+
+    os.utime(target, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.remove(path)
+    if blob:
+        store.drop_plain(sha256)
+    notify_file_saved(target, None, old_path=path, sha256=sha256)
+    return stat.st_size, os.path.getsize(target)
+
+
+def _newest_mtime(sesja_dir):
+    newest = 0.0
+    for dirpath, dirnames, filenames in os.walk(sesja_dir):
+        for filename in filenames:
+            try:
+                newest = max(newest, os.path.getmtime(os.path.join(dirpath, filename)))
+            except OSError:
+                continue
+    return newest
+
+
+def cold_sessions(base_dir, days=COLD_AFTER_DAYS):
+    """SesjaN folders whose newest file is older than `days` days."""
+    if not os.path.isdir(base_dir):
+        return []
+    limit = time.time() - days * 24 * 3600
+    names = sorted(entry.name for entry in os.scandir(base_dir)
+                   if entry.is_dir() and entry.name.startswith("Sesja"))
+    return [name for name in names if _newest_mtime(os.path.join(base_dir, name)) < limit]
+
+
+def compress_sessions(base_dir, days=COLD_AFTER_DAYS, dry_run=False):
+    """Compress the plain files of all cold sessions. Returns a summary."""
+    started = time.perf_counter()
+    sessions = cold_sessions(base_dir, days)
+    store = get_blob_store(base_dir) if os.path.isdir(os.path.join(base_dir, BLOB_DIRNAME)) else None
+    summary = {"sessions": sessions, "compressed": 0, "kept": 0, "already_cold": 0,
+               "bytes_before": 0, "bytes_after": 0}
+    for sesja in sessions:
+        for dirpath, dirnames, filenames in os.walk(os.path.join(base_dir, sesja)):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                # Dotfiles are metadata (e.g. .agenda_versions.json), read by name
+                if filename.startswith((".", "temp_")) or filename.endswith(".tmp"):
+                    continue
+                if is_cold(filename):
+                    summary["already_cold"] += 1
+                    continue
+                if dry_run:
+                    summary["bytes_before"] += os.path.getsize(path)
+                    continue
+                try:
+                    result = compress_file(path, store)
+                except OSError as e:
+                    print(f"Nie udało się skompresować {path}: {e}")
+                    result = None
+                if result:
+                    summary["compressed"] += 1
+                    summary["bytes_before"] += result[0]
+                    summary["bytes_after"] += result[1]
+                else:
+                    summary["kept"] += 1
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kompresja starych sesji (archiwum zimne)")
+    parser.add_argument("--dir", default=os.getenv("DOWNLOAD_DIR", "./data"), help="folder archiwum")
+    parser.add_argument("--days", type=float, default=COLD_AFTER_DAYS,
+                        help="kompresuj sesje bez zmian od tylu dni")
+    parser.add_argument("--dry-run", action="store_true", help="tylko pokaż, które sesje są zimne")
+    args = parser.parse_args()
+
+    summary = compress_sessions(args.dir, args.days, args.dry_run)
+    print(f"Zimne sesje: {', '.join(summary['sessions']) or 'brak'}")
+    if args.dry_run:
+        print(f"Do kompresji: {summary['bytes_before'] / 1024 / 1024:.1f} MB")
+        return
+    saved = summary["bytes_before"] - summary["bytes_after"]
+    print(f"Skompresowano {summary['compressed']} plików, pozostawiono {summary['kept']}, "
+          f"zaoszczędzono {saved / 1024 / 1024:.1f} MB w {summary['seconds']} s")
+
+
+if __name__ == "__main__":
+    main()
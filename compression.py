@@ -0,0 +1,55 @@
+"""
+HTTP response compression
+JSON, HTML, CSS and JS responses are compressed with brotli (when the
+optional brotli package is installed) or gzip, depending on what the client
+accepts. Small bodies, partial content and file downloads are left alone.
+"""
+
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/html", "text/css",
+                      "text/javascript", "application/javascript")
+MIN_SIZE = 500  # bytes; smaller bodies are not worth it
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # fast enough to compress per request
+
+
+def choose_encoding(accept_encodings):
+    """Best supported encoding from a parsed Accept-Encoding header, or None."""
+    if brotli is not None and accept_encodings.quality("br") > 0:
+        return "br"
+    if accept_encodings.quality("gzip") > 0:
+        return "gzip"
+    return None
+
+
+def compress_response(response, accept_encodings):
+    """Compress a buffered Flask response in place when it is worth it."""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding(accept_encodings)
+    data = response.get_data()
+    if encoding is None or len(data) < MIN_SIZE:
+        return response
+
+    if encoding == "br":
+        data = brotli.compress(data, quality=BROTLI_QUALITY)
+    else:
+        data = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    response.set_data(data)
+    response.headers["Content-Encoding"] = encoding
+    # The compressed bytes differ, so a strong validator must become weak
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,158 @@
+"""
+Deferred AI naming
+When the AI is unavailable (circuit open, error or over the time budget) a
+download does not wait: in "ai" keyword mode the file is saved under its basic
+name (DRUK_NR12.pdf), in the default "auto" mode under the local TF-IDF
+keywords (DRUK_NR12_<local>.pdf), and queued here. A background task on the
+scraper loop asks the AI again once the circuit breaker lets calls through and
+renames the file to DRUK_NR12_<keywords>.pdf.
+The queue lives in memory. Files left after a restart keep their name: basic
+names are picked up by the next download of their session (or the plan, as
+keywords_missing), local names stay.
+With several worker processes the rename goes through the job's save guard
+(see async_scraper.set_save_guard), so only one process renames a file, and
+an existing file with the keyword name is never overwritten.
+"""
+
+import asyncio
+import contextvars
+import os
+
+import keywords
+import rada_scraper
+from blob_store import file_sha256
+
+RETRY_PAUSE = 1.0  # seconds between attempts while the circuit is still closed
+
+_pending = {}        # path -> item; only touched from the loop thread
+_task = None
+_listeners = []
+_stats = {"renamed": 0, "gave_up": 0}
+
+
+async def defer(path, text, druk_number, sha256=None, store=None, guard=None, local_keywords=None):
+    """Queue a file saved under its basic name (or with local_keywords) for
+    renaming (call from the loop). guard is the job's save guard; its
+    deferred() form is used for the rename."""
+    global _task
+    from async_scraper import _run_blocking
+
+    _pending[path] = {"text": text, "druk": druk_number, "keywords": local_keywords, "sha256": sha256,
+                      "store": store, "guard": guard.deferred() if guard is not None else None}
+    print(f"AI niedostępne - zapisano {os.path.basename(path)}, nazwa zostanie uzupełniona później")
+    if _task is None or _task.done():
+        # A fresh context: the queue outlives the job that started it (its trace etc.)
+        _task = contextvars.Context().run(asyncio.get_running_loop().create_task, _worker())
+    await _run_blocking(_publish)
+
+
+def _free_path(path):
+    """path, or path with _2, _3... before the extension when it is taken."""
+    stem, ext = os.path.splitext(path)
+    candidate, n = path, 1
+    while os.path.exists(candidate):
+        n += 1
+        candidate = f"{stem}_{n}{ext}"
+    return candidate
+
+
+def _rename(path, item, ai_keywords):
+    """Rename a queued file to its keyword name. Runs in a worker thread."""
+    if not os.path.exists(path):
+        # Renamed or replaced by a later download in the meantime
+        return None
+    save_dir, filename = os.path.split(path)
+    guard = item["guard"]
+    if guard is not None and not guard.claim(save_dir, filename):
+        print(f"Nazwę {filename} uzupełnia inny proces - pomijam")
+        return None
+    # Only the keywords change: DRUK_NR12[_<local>]_załącznik.gml -> DRUK_NR12_<ai>_załącznik.gml
+    named = f"DRUK_NR{item['druk']}" + (f"_{item['keywords']}" if item["keywords"] else "")
+    new_path = os.path.join(save_dir, f"DRUK_NR{item['druk']}_{ai_keywords}{filename[len(named):]}")
+    if os.path.exists(new_path) and item["sha256"] and file_sha256(new_path) == item["sha256"]:
+        # The same content is already saved under the keyword name
+        os.remove(path)
+        print(f"{os.path.basename(new_path)} już istnieje - usunięto kopię {filename}")
+    else:
+        new_path = _free_path(new_path)
+        os.rename(path, new_path)
+        print(f"Uzupełniono nazwę: {filename} -> {os.path.basename(new_path)}")
+    if guard is not None:
+        guard.done(save_dir, filename)
+    if item["store"] and item["sha256"]:
+        item["store"].set_keywords(item["sha256"], ai_keywords)
+    rada_scraper.notify_file_saved(new_path, None, old_path=path, sha256=item["sha256"])
+    return os.path.basename(new_path)
+
+
+async def _worker():
+    from async_scraper import _run_blocking
+
+    backend = keywords.BACKENDS["ai"]
+    while _pending:
+        wait = backend.breaker.retry_in()
+        if wait > 0:
+            await asyncio.sleep(wait)
+            continue
+        path, item = next(iter(_pending.items()))
+        try:
+            ai_keywords = await backend.keywords(item["text"])
+        except Exception as e:
+            print(f"Error in deferred naming of {path}: {e}")
+            ai_keywords = None
+        if ai_keywords is None:
+            # Still unavailable - back to the end of the queue
+            _pending[path] = _pending.pop(path)
+            await asyncio.sleep(RETRY_PAUSE)
+            continue
+        _pending.pop(path, None)
+        if ai_keywords:
+            try:
+                if await _run_blocking(_rename, path, item, ai_keywords):
+                    _stats["renamed"] += 1
+            except OSError as e:
+                print(f"Nie udało się zmienić nazwy {path}: {e}")
+                _stats["gave_up"] += 1
+        else:
+            # The AI answered but found nothing to name the file with
+            _stats["gave_up"] += 1
+        await _run_blocking(_publish)
+
+
+def status():
+    """Queue and circuit state (safe to call from any thread)."""
+    return {
+        "pending": len(_pending),
+        **_stats,
+        "circuit": keywords.BACKENDS["ai"].breaker.status(),
+        "latency": keywords.BACKENDS["ai"].latency_status()
+    }
+
+
+def register_state_listener(listener):
+    """listener(state) gets status() whenever the queue or the circuit changes."""
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def _publish(*_):
+    state = status()
+    for listener in _listeners:
+        try:
+            listener(state)
+        except Exception as e:
+            print(f"Error publishing AI naming state: {e}")
+
+
+def _publish_soon(*_):
+    """Circuit listener: publish without blocking the scraper loop (listeners write SQLite)."""
+    from async_scraper import _run_blocking
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        _publish()
+        return
+    asyncio.ensure_future(_run_blocking(_publish))
+
+
+keywords.BACKENDS["ai"].breaker.listeners.append(_publish_soon)
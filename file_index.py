@@ -0,0 +1,653 @@
+"""
+Incremental index of the archive's files
+Keeps the listing behind /api/files and the list of downloaded sessions in
+memory, so requests never walk the archive. The first build lists the
+PorzadekM folders in parallel with os.scandir; after that the index follows
+the disk incrementally:
+- on Linux an inotify watch (through ctypes) on the archive, every SesjaN and
+  every PorzadekM folder reports files and folders added, renamed or deleted,
+  also by Explorer or a sync client;
+- a periodic reconciliation re-lists only the folders whose mtime changed.
+  Without inotify (other systems) it is the only source and runs more often.
+Downloads of this process update the index directly through the rada_scraper
+file hook, so they show up at once even without inotify.
+Statistics (per session, porządek and extension, keyword coverage) are
+aggregates updated with every change, so /api/stats never visits the files.
+The index is saved next to the archive (<archive>/.file_index.json). A restart
+loads it and re-lists only the folders whose mtime changed, then checks the
+whole archive in the background. warm_file_indexes() loads the indexes of all
+albums up front, so switching albums finds its index ready.
+"""
+
+import atexit
+import ctypes
+import ctypes.util
+import hashlib
+import heapq
+import json
+import os
+import re
+import select
+import stat as stat_module
+import struct
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from cold_storage import is_cold, logical_name
+
+RECONCILE_INTERVAL = float(os.getenv("FILE_INDEX_RECONCILE", "300"))  # seconds, with inotify
+POLL_INTERVAL = float(os.getenv("FILE_INDEX_POLL", "10"))             # seconds, without inotify
+SAVE_INTERVAL = float(os.getenv("FILE_INDEX_SAVE", "30"))            # seconds between snapshots
+SCAN_THREADS = 8
+SNAPSHOT_FILENAME = ".file_index.json"
+SNAPSHOT_VERSION = 1
+
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+_EVENT = struct.Struct("iIII")
+_DRUK_NAME = re.compile(r"DRUK_NR\d+(_.*)?$")
+
+
+class Inotify:
+    """Minimal inotify binding (Linux only; the constructor raises OSError elsewhere)."""
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return wd
+
+    def rm_watch(self, wd):
+        self._rm_watch(self.fd, wd)
+
+    def read(self, timeout):
+        """[(wd, mask, name)] of the events that arrive within timeout seconds."""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events, offset = [], 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, _cookie, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _entry_hash(rel, size, mtime_ns):
+    digest = hashlib.sha1(f"{rel}\0{size}\0{mtime_ns}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def _is_indexed_dir(rel):
+    """SesjaN at depth 0 and SesjaN/PorzadekM at depth 1 are indexed folders."""
+    parts = rel.split("/")
+    return (len(parts) <= 2 and parts[0].startswith("Sesja")
+            and (len(parts) == 1 or parts[1].startswith("Porzadek")))
+
+
+def keyword_state(filename):
+    """"with"/"without" keywords for a DRUK_NR file, None for other files
+    (GML "_załącznik" attachments are never named by keywords)."""
+    name = os.path.splitext(filename)[0]
+    match = _DRUK_NAME.match(name)
+    if not match or name.endswith("_załącznik"):
+        return None
+    return "with" if match.group(1) else "without"
+
+
+class FileStats:
+    """Totals of the indexed files, updated per file in O(1)."""
+
+    def __init__(self):
+        self.groups = {"session": {}, "porzadek": {}, "extension": {}}
+        self.count = 0
+        self.bytes = 0
+        self.keywords = Counter()
+        self._mtimes = Counter()      # mtime_ns -> number of files
+        self._newest = []             # max-heap of mtimes, pruned lazily
+
+    def _update(self, rel, size, mtime_ns, sign):
+        sesja, porzadek, filename = rel.split("/")
+        filename = logical_name(filename)  # sizes stay the bytes on disk
+        keys = {"session": sesja, "porzadek": f"{sesja}/{porzadek}",
+                "extension": os.path.splitext(filename)[1].lower() or "-"}
+        for group, key in keys.items():
+            totals = self.groups[group].setdefault(key, {"count": 0, "bytes": 0})
+            totals["count"] += sign
+            totals["bytes"] += sign * size
+            if not totals["count"]:
+                del self.groups[group][key]
+        self.count += sign
+        self.bytes += sign * size
+        state = keyword_state(filename)
+        if state:
+            self.keywords[state] += sign
+        self._mtimes[mtime_ns] += sign
+        if sign > 0 and self._mtimes[mtime_ns] == 1:
+            heapq.heappush(self._newest, -mtime_ns)
+            if len(self._newest) > 2 * len(self._mtimes) + 64:
+                # Too many stale entries of removed files - rebuild
+                self._newest = [-m for m, n in self._mtimes.items() if n > 0]
+                heapq.heapify(self._newest)
+
+    def add(self, rel, size, mtime_ns):
+        self._update(rel, size, mtime_ns, 1)
+
+    def remove(self, rel, size, mtime_ns):
+        self._update(rel, size, mtime_ns, -1)
+
+    def newest(self):
+        while self._newest and self._mtimes[-self._newest[0]] <= 0:
+            self._mtimes.pop(-heapq.heappop(self._newest), None)
+        return -self._newest[0] if self._newest else None
+
+    def snapshot(self):
+        newest = self.newest()
+        named = self.keywords["with"] + self.keywords["without"]
+        return {
+            "files": self.count,
+            "bytes": self.bytes,
+            "sessions": len(self.groups["session"]),
+            "last_modified": datetime.fromtimestamp(newest / 1e9).isoformat() if newest else None,
+            "keywords": {
+                "with": self.keywords["with"],
+                "without": self.keywords["without"],
+                "coverage": round(self.keywords["with"] / named, 3) if named else None
+            },
+            "by_session": dict(self.groups["session"]),
+            "by_porzadek": dict(self.groups["porzadek"]),
+            "by_extension": dict(self.groups["extension"])
+        }
+
+
+class FileIndex:
+    """Files of one archive (<base>/SesjaN/PorzadekM/<file>) kept in sync with the disk."""
+
+    def __init__(self, base_dir, watch=True):
+        self.base_dir = os.path.abspath(base_dir)
+        self.lock = threading.RLock()
+        self.files = {}           # "SesjaN/PorzadekM/name" -> (size, mtime_ns)
+        self.folder_files = {}    # "SesjaN/PorzadekM" -> set of its file keys
+        self.folders = {}         # "SesjaN" / "SesjaN/PorzadekM" -> mtime_ns when last listed
+        self.checksum = 0         # XOR of the entry hashes: same files -> same version
+        self.stats = FileStats()
+        self.watches = {}         # wd -> folder ("" = the archive itself)
+        self.watched = {}         # folder -> wd
+        self.inotify = None
+        self.events = 0
+        self.reconciles = 0
+        self.last_reconcile = 0.0
+        self.build_seconds = None
+        self.loaded_from = None     # "snapshot" or "scan"
+        self.saved_key = None       # _save_key() of the last snapshot
+        self.last_save = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = None
+
+        if watch:
+            try:
+                self.inotify = Inotify()
+            except OSError as e:
+                print(f"inotify niedostępne ({e}) - indeks plików odświeżany co {POLL_INTERVAL:.0f} s")
+        started = time.perf_counter()
+        if self._load_snapshot():
+            # Only folders changed since the snapshot; in-place rewrites are
+            # caught by the full check at the start of _run
+            self.loaded_from = "snapshot"
+            self.reconcile()
+            self.last_reconcile = 0.0
+        else:
+            self.loaded_from = "scan"
+            self._build()
+        self.build_seconds = time.perf_counter() - started
+        if watch:
+            self._thread = threading.Thread(target=self._run, name="file-index", daemon=True)
+            self._thread.start()
+
+    # --- entries ---
+
+    def _abspath(self, rel):
+        return os.path.join(self.base_dir, *rel.split("/")) if rel else self.base_dir
+
+    def _put(self, rel, size, mtime_ns):
+        old = self.files.get(rel)
+        if old == (size, mtime_ns):
+            return
+        if old:
+            self.checksum ^= _entry_hash(rel, *old)
+            self.stats.remove(rel, *old)
+        self.files[rel] = (size, mtime_ns)
+        self.folder_files.setdefault(rel.rsplit("/", 1)[0], set()).add(rel)
+        self.checksum ^= _entry_hash(rel, size, mtime_ns)
+        self.stats.add(rel, size, mtime_ns)
+
+    def _drop(self, rel):
+        old = self.files.pop(rel, None)
+        if old:
+            self.checksum ^= _entry_hash(rel, *old)
+            self.folder_files.get(rel.rsplit("/", 1)[0], set()).discard(rel)
+            self.stats.remove(rel, *old)
+
+    def _stat_file(self, rel):
+        """Add/update one file from disk (drop it when it is gone or not a file)."""
+        try:
+            stat = os.stat(self._abspath(rel))
+        except OSError:
+            stat = None
+        with self.lock:
+            if stat is None or not stat_module.S_ISREG(stat.st_mode):
+                self._drop(rel)
+            else:
+                self._put(rel, stat.st_size, stat.st_mtime_ns)
+
+    # --- scanning ---
+
+    def _scan_folder(self, rel):
+        """(mtime_ns, {file rel: (size, mtime_ns)}) of a PorzadekM folder, or None if it is gone."""
+        path = self._abspath(rel)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            listing = {}
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        listing[f"{rel}/{entry.name}"] = (stat.st_size, stat.st_mtime_ns)
+            return mtime_ns, listing
+        except OSError:
+            return None
+
+    def _apply_folder(self, rel, scanned):
+        with self.lock:
+            listing = scanned[1] if scanned else {}
+            for file_rel in [r for r in self.folder_files.get(rel, ()) if r not in listing]:
+                self._drop(file_rel)
+            for file_rel, (size, mtime_ns) in listing.items():
+                self._put(file_rel, size, mtime_ns)
+            if scanned:
+                self.folders[rel] = scanned[0]
+
+    def _subfolders(self, rel):
+        """Indexed subfolders of the archive ("") or of a SesjaN folder."""
+        try:
+            with os.scandir(self._abspath(rel)) as entries:
+                names = [entry.name for entry in entries if entry.is_dir()]
+        except OSError:
+            return []
+        children = [f"{rel}/{name}" if rel else name for name in names]
+        return [child for child in children if _is_indexed_dir(child)]
+
+    def _build(self):
+        """Cold build: list all PorzadekM folders in parallel."""
+        self._watch("")
+        porzadki = []
+        for sesja in self._subfolders(""):
+            self._watch(sesja)
+            with self.lock:
+                self.folders[sesja] = 0
+            porzadki.extend(self._subfolders(sesja))
+        for porzadek in porzadki:
+            self._watch(porzadek)
+        with ThreadPoolExecutor(max_workers=SCAN_THREADS) as pool:
+            for porzadek, scanned in zip(porzadki, pool.map(self._scan_folder, porzadki)):
+                self._apply_folder(porzadek, scanned)
+        self.last_reconcile = time.monotonic()
+
+    def reconcile(self, full=False):
+        """Bring the index in line with the disk. Only folders whose mtime
+        changed are listed again (all of them with full=True)."""
+        self.reconciles += 1
+        self.last_reconcile = time.monotonic()
+        self._watch("")
+        sesje = set(self._subfolders(""))
+        porzadki = set()
+        for sesja in sesje:
+            self._watch(sesja)
+            porzadki.update(self._subfolders(sesja))
+        with self.lock:
+            gone = [rel for rel in self.folders if rel not in sesje and rel not in porzadki]
+        for rel in gone:
+            self._remove_tree(rel)
+        with self.lock:
+            for sesja in sesje:
+                self.folders.setdefault(sesja, 0)
+        for porzadek in sorted(porzadki):
+            self._watch(porzadek)
+            try:
+                mtime_ns = os.stat(self._abspath(porzadek)).st_mtime_ns
+            except OSError:
+                continue
+            if full or self.folders.get(porzadek) != mtime_ns:
+                self._apply_folder(porzadek, self._scan_folder(porzadek))
+
+    # --- snapshot ---
+
+    def _snapshot_path(self):
+        return os.path.join(self.base_dir, SNAPSHOT_FILENAME)
+
+    def _save_key(self):
+        with self.lock:
+            return self.checksum, hash(frozenset(self.folders.items()))
+
+    def _load_snapshot(self):
+        try:
+            with open(self._snapshot_path(), encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != SNAPSHOT_VERSION:
+                return False
+            with self.lock:
+                for rel, (size, mtime_ns) in data["files"].items():
+                    self._put(rel, size, mtime_ns)
+                self.folders.update(data["folders"])
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Nie udało się wczytać indeksu plików {self._snapshot_path()}: {e}")
+            with self.lock:
+                for rel in list(self.files):
+                    self._drop(rel)
+                self.folders.clear()
+            return False
+        self.saved_key = self._save_key()
+        return True
+
+    def save(self):
+        """Write the snapshot if the index changed since the last one."""
+        self.last_save = time.monotonic()
+        key = self._save_key()
+        if key == self.saved_key or not os.path.isdir(self.base_dir):
+            return False
+        with self.lock:
+            data = {"version": SNAPSHOT_VERSION, "folders": dict(self.folders),
+                    "files": {rel: list(entry) for rel, entry in self.files.items()}}
+        tmp_path = f"{self._snapshot_path()}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, self._snapshot_path())
+        except OSError as e:
+            print(f"Nie udało się zapisać indeksu plików {self._snapshot_path()}: {e}")
+            return False
+        self.saved_key = key
+        return True
+
+    # --- inotify ---
+
+    def _watch(self, rel):
+        if not self.inotify or rel in self.watched:
+            return
+        try:
+            wd = self.inotify.add_watch(self._abspath(rel))
+        except OSError:
+            return  # not there (yet); the next reconciliation tries again
+        self.watches[wd] = rel
+        self.watched[rel] = wd
+
+    def _unwatch(self, rel):
+        wd = self.watched.pop(rel, None)
+        if wd is not None:
+            self.watches.pop(wd, None)
+            self.inotify.rm_watch(wd)
+
+    def _add_tree(self, rel):
+        """A SesjaN/PorzadekM folder appeared (created or moved in)."""
+        self._watch(rel)
+        if "/" in rel:
+            self._apply_folder(rel, self._scan_folder(rel))
+            return
+        with self.lock:
+            self.folders.setdefault(rel, 0)
+        for porzadek in self._subfolders(rel):
+            self._add_tree(porzadek)
+
+    def _remove_tree(self, rel):
+        """A SesjaN/PorzadekM folder disappeared (deleted or moved out)."""
+        prefix = rel + "/"
+        with self.lock:
+            for folder in [f for f in self.folder_files if f == rel or f.startswith(prefix)]:
+                for file_rel in list(self.folder_files.pop(folder)):
+                    self._drop(file_rel)
+            for folder in [f for f in self.folders if f == rel or f.startswith(prefix)]:
+                del self.folders[folder]
+        if self.inotify:
+            for folder in [f for f in self.watched if f == rel or f.startswith(prefix)]:
+                self._unwatch(folder)
+
+    def _handle(self, wd, mask, name):
+        self.events += 1
+        if mask & IN_Q_OVERFLOW:
+            self.reconcile(full=True)
+            return
+        parent = self.watches.get(wd)
+        if parent is None:
+            return
+        if mask & IN_IGNORED:
+            self.watches.pop(wd, None)
+            if self.watched.get(parent) == wd:
+                del self.watched[parent]
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            if parent == "":
+                # The archive folder itself was removed or renamed
+                self._unwatch("")
+                self.reconcile(full=True)
+            return
+        rel = f"{parent}/{name}" if parent else name
+        if mask & IN_ISDIR:
+            if _is_indexed_dir(rel):
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_tree(rel)
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    self._remove_tree(rel)
+        elif rel.count("/") == 2:
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                with self.lock:
+                    self._drop(rel)
+            else:
+                self._stat_file(rel)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.inotify:
+                    for wd, mask, name in self.inotify.read(timeout=1.0):
+                        self._handle(wd, mask, name)
+                    due = RECONCILE_INTERVAL
+                    if "" not in self.watched and os.path.isdir(self.base_dir):
+                        # The archive folder was (re)created - start watching it
+                        due = 0
+                else:
+                    self._stop.wait(1.0)
+                    due = POLL_INTERVAL
+                if not self.last_reconcile:
+                    self.reconcile(full=True)  # loaded from a snapshot
+                elif time.monotonic() - self.last_reconcile >= due:
+                    self.reconcile()
+                if time.monotonic() - self.last_save >= SAVE_INTERVAL:
+                    self.save()
+            except Exception as e:
+                print(f"Error in file index of {self.base_dir}: {e}")
+                self._stop.wait(5)
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.save()
+        if self.inotify:
+            self.inotify.close()
+            self.inotify = None
+
+    # --- queries ---
+
+    def file_saved(self, file_path, old_path=None):
+        """A file of this archive was written or renamed by our own download."""
+        for path, present in ((old_path, False), (file_path, True)):
+            if not path:
+                continue
+            rel = os.path.relpath(os.path.abspath(path), self.base_dir).replace(os.sep, "/")
+            folder = rel.rsplit("/", 1)[0]
+            if rel.count("/") != 2 or not _is_indexed_dir(folder):
+                continue
+            if present:
+                with self.lock:
+                    # New folders are listed (and watched) by the next reconciliation
+                    self.folders.setdefault(folder.split("/")[0], 0)
+                    self.folders.setdefault(folder, 0)
+                self._stat_file(rel)
+            else:
+                with self.lock:
+                    self._drop(rel)
+
+    def version(self):
+        """Changes whenever a file is added, removed, renamed or rewritten."""
+        return f"files-{self.checksum:016x}"
+
+    def list_files(self):
+        """The /api/files listing, sorted by path."""
+        with self.lock:
+            items = sorted(self.files.items())
+        files_info = []
+        for rel, (size, mtime_ns) in items:
+            sesja, porzadek, filename = rel.split("/")
+            info = {
+                "filename": logical_name(filename),
+                "sesja": sesja,
+                "porzadek": porzadek,
+                "size": size,
+                "modified": datetime.fromtimestamp(mtime_ns / 1e9).isoformat(),
+                "path": os.path.join(sesja, porzadek, logical_name(filename))
+            }
+            if is_cold(filename):
+                info["compressed"] = True  # size is the compressed size
+            files_info.append(info)
+        return files_info
+
+    def statistics(self):
+        """Aggregates for /api/stats (no work per file)."""
+        with self.lock:
+            return self.stats.snapshot()
+
+    def sessions(self):
+        """Numbers of the SesjaN folders, like rada_scraper.get_existing_sessions()."""
+        with self.lock:
+            names = [rel for rel in self.folders if "/" not in rel]
+        numbers = []
+        for name in names:
+            try:
+                numbers.append(int(name[len("Sesja"):]))
+            except ValueError:
+                continue
+        return sorted(numbers)
+
+    def status(self):
+        return {
+            "files": len(self.files),
+            "mode": "inotify" if self.inotify else "polling",
+            "watches": len(self.watched),
+            "events": self.events,
+            "reconciles": self.reconciles,
+            "loaded_from": self.loaded_from,
+            "build_seconds": round(self.build_seconds or 0.0, 3)
+        }
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+_build_locks = {}
+
+
+def get_file_index(base_dir):
+    """Shared FileIndex per archive folder (built on first use). Indexes of
+    different folders are built in parallel; callers of one folder wait for it."""
+    key = os.path.abspath(base_dir)
+    with _indexes_lock:
+        if key in _indexes:
+            return _indexes[key]
+        build_lock = _build_locks.setdefault(key, threading.Lock())
+    with build_lock:
+        with _indexes_lock:
+            if key in _indexes:
+                return _indexes[key]
+        index = FileIndex(key)
+        with _indexes_lock:
+            _indexes[key] = index
+        return index
+
+
+def loaded_file_index(base_dir):
+    """The FileIndex of a folder if it is already built, else None."""
+    return _indexes.get(os.path.abspath(base_dir))
+
+
+def warm_file_indexes(base_dirs):
+    """Build the indexes of these folders in the background (existing folders only)."""
+    def run():
+        for base_dir in base_dirs:
+            if os.path.isdir(base_dir) and not loaded_file_index(base_dir):
+                try:
+                    get_file_index(base_dir)
+                except Exception as e:
+                    print(f"Error warming file index of {base_dir}: {e}")
+
+    thread = threading.Thread(target=run, name="file-index-warm", daemon=True)
+    thread.start()
+    return thread
+
+
+def save_file_indexes():
+    """Write the snapshots of all loaded indexes (e.g. at shutdown)."""
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        index.save()
+
+
+atexit.register(save_file_indexes)
+
+
+def update_file_index(file_path, text=None, old_path=None, sha256=None):
+    """rada_scraper file hook: show our own downloads at once."""
+    from search_index import archive_root
+
+    index = _indexes.get(archive_root(file_path))
+    if index:
+        index.file_saved(file_path, old_path)
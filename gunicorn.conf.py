@@ -0,0 +1,23 @@
+"""
+gunicorn configuration: gunicorn -c gunicorn.conf.py app:app
+Status, settings, logs and job leases live in the shared SQLite store
+(job_store.py), so any number of workers can serve the UI while only one
+of them runs a download or the background watcher at a time.
+"""
+
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("THREADS", "4"))
+timeout = 120
+
+
+def post_worker_init(worker):
+    from app import load_settings, apply_watcher_settings, get_current_download_dir, warm_album_indexes
+    from pathlib import Path
+
+    load_settings()
+    Path(get_current_download_dir()).mkdir(parents=True, exist_ok=True)
+    apply_watcher_settings()
+    warm_album_indexes()
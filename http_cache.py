@@ -0,0 +1,154 @@
+"""
+Disk cache of BIP pages
+The HTML pages the scraper reads (year index, session and agenda pages) are
+kept in SQLite together with their ETag/Last-Modified. A page younger than its
+TTL is served from disk; an older one is revalidated with a conditional GET,
+so an unchanged page costs a 304. Only the newest OPEN_SESSIONS sessions still
+change - older session pages and their agendas get a much longer TTL. When
+revalidation fails the cached copy is used. Pages not checked for
+HTTP_CACHE_MAX_AGE days are pruned when the cache is opened, and only the
+HTTP_CACHE_MAX_PAGES most recently checked pages are kept.
+
+HTTP_CACHE=off   no cache (every page is fetched)
+HTTP_CACHE=on    default
+HTTP_CACHE=replay  offline: pages only from the cache, no network at all
+                   (attachments already in the blob store count as unchanged)
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+MODES = ("on", "off", "replay")
+MODE = os.getenv("HTTP_CACHE", "on").lower()
+CACHE_DB = os.getenv("HTTP_CACHE_DB", "http_cache.db")
+OPEN_TTL = float(os.getenv("HTTP_CACHE_TTL", "60"))                      # seconds
+CLOSED_TTL = float(os.getenv("HTTP_CACHE_CLOSED_TTL", str(7 * 24 * 3600)))  # seconds
+MAX_AGE = float(os.getenv("HTTP_CACHE_MAX_AGE", "30")) * 24 * 3600         # seconds
+MAX_PAGES = int(os.getenv("HTTP_CACHE_MAX_PAGES", "5000"))
+OPEN_SESSIONS = 2  # the newest sessions still get agendas (as in watcher.py)
+
+
+class OfflineMiss(RuntimeError):
+    """A page or attachment is not in the cache in replay mode."""
+
+
+def set_mode(mode):
+    global MODE
+    if mode not in MODES:
+        raise ValueError(f"Nieznany tryb pamięci podręcznej: {mode}")
+    MODE = mode
+
+
+def replaying():
+    return MODE == "replay"
+
+
+class PageCache:
+    """Pages with their validators and the set of pages that no longer change."""
+
+    def __init__(self, db_path=CACHE_DB):
+        self.db_path = db_path
+        self.local = threading.local()
+        self.stats = Counter()
+        self._connection().executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                body TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                checked REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS closed (
+                url TEXT PRIMARY KEY
+            );
+        """)
+
+    def _connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def get(self, url):
+        row = self._connection().execute("""
+            SELECT body, etag, last_modified, checked, closed.url IS NOT NULL
+            FROM pages LEFT JOIN closed USING (url) WHERE url = ?
+        """, (url,)).fetchone()
+        if not row:
+            return None
+        return {"body": row[0], "etag": row[1], "last_modified": row[2], "checked": row[3], "closed": bool(row[4])}
+
+    def put(self, url, body, etag=None, last_modified=None):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO pages (url, body, etag, last_modified, checked) VALUES (?, ?, ?, ?, ?)",
+            (url, body, etag, last_modified, time.time()))
+
+    def touch(self, url):
+        """The server confirmed the cached copy (304)."""
+        self._connection().execute("UPDATE pages SET checked = ? WHERE url = ?", (time.time(), url))
+
+    def mark_closed(self, urls):
+        self._connection().executemany("INSERT OR IGNORE INTO closed (url) VALUES (?)", [(u,) for u in urls])
+
+    def is_closed(self, url):
+        return self._connection().execute("SELECT 1 FROM closed WHERE url = ?", (url,)).fetchone() is not None
+
+    def is_fresh(self, entry):
+        ttl = CLOSED_TTL if entry["closed"] else OPEN_TTL
+        return time.time() - entry["checked"] < ttl
+
+    def prune(self, max_age=MAX_AGE, max_pages=MAX_PAGES):
+        """Drop pages not checked for max_age seconds and all but the
+        max_pages most recently checked ones. Returns the number removed."""
+        conn = self._connection()
+        removed = conn.execute("DELETE FROM pages WHERE checked < ?", (time.time() - max_age,)).rowcount
+        removed += conn.execute("""
+            DELETE FROM pages WHERE url NOT IN (SELECT url FROM pages ORDER BY checked DESC LIMIT ?)
+        """, (max_pages,)).rowcount
+        if removed:
+            conn.execute("DELETE FROM closed WHERE url NOT IN (SELECT url FROM pages)")
+        return removed
+
+    def status(self):
+        pages = self._connection().execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        return {"mode": MODE, "pages": pages, **self.stats}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The shared PageCache, or None when the cache is off."""
+    global _cache
+    if MODE == "off":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = PageCache(CACHE_DB)
+            _cache.prune()
+        return _cache
+
+
+def set_db(path):
+    """Use another cache database from now on (benchmarks use a temporary one)."""
+    global CACHE_DB, _cache
+    with _cache_lock:
+        CACHE_DB, _cache = path, None
+
+
+def status():
+    cache = get_cache()
+    return cache.status() if cache else {"mode": MODE}
+
+
+def closed_sessions(sessions):
+    """URLs of the sessions that no longer change, from [(sesja_url, sesja_number)]."""
+    newest = sorted((number for _, number in sessions), reverse=True)[:OPEN_SESSIONS]
+    return [url for url, number in sessions if number not in newest]
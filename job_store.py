@@ -0,0 +1,188 @@
+"""
+Shared job state for multi-worker deployments
+Settings, download progress, the activity log and job leases live in one
+SQLite database in WAL mode, so every gunicorn worker (and the download
+thread of whichever worker runs the job) sees the same state. A lease is a
+row with an owner and an expiry time; only the owner may run the job, and it
+keeps the lease alive with heartbeats. If a worker dies the lease expires
+and another worker may start the job again.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+STATE_DB = os.getenv("STATE_DB", "app_state.db")
+LOG_LIMIT = 100
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def new_owner_id():
+    """Unique lease owner for one job run of this worker."""
+    return f"{WORKER_ID}:{uuid.uuid4().hex[:8]}"
+
+
+class JobStore:
+    """Key/value state, activity log and leases in a shared SQLite database."""
+
+    def __init__(self, db_path=STATE_DB):
+        self.db_path = db_path
+        self.local = threading.local()
+        self._connection().executescript("""
+            CREATE TABLE IF NOT EXISTS kv (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL,
+                action TEXT NOT NULL,
+                details TEXT
+            );
+        """)
+
+    def _connection(self):
+        """This thread's connection (sqlite3 connections are not thread-safe)."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def _connect(self, write=True):
+        """Transaction on this thread's connection.
+        Writers use BEGIN IMMEDIATE; in WAL mode readers never block them."""
+        return _Transaction(self._connection(), "BEGIN IMMEDIATE" if write else "BEGIN")
+
+    # --- key/value state ---
+
+    def get(self, key, default=None):
+        with self._connect(write=False) as conn:
+            row = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key, value):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)",
+                         (key, json.dumps(value, ensure_ascii=False)))
+
+    def update(self, key, **fields):
+        """Atomically merge fields into a dict value and return the result."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+            value = json.loads(row[0]) if row else {}
+            value.update(fields)
+            conn.execute("INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)",
+                         (key, json.dumps(value, ensure_ascii=False)))
+        return value
+
+    # --- activity log ---
+
+    def add_log(self, timestamp, action, details=""):
+        with self._connect() as conn:
+            conn.execute("INSERT INTO logs (timestamp, action, details) VALUES (?, ?, ?)",
+                         (timestamp, action, details))
+            conn.execute("DELETE FROM logs WHERE id <= (SELECT MAX(id) FROM logs) - ?", (LOG_LIMIT,))
+
+    def get_logs(self, limit=20):
+        """Last entries, oldest first."""
+        with self._connect(write=False) as conn:
+            rows = conn.execute("SELECT timestamp, action, details FROM logs ORDER BY id DESC LIMIT ?",
+                                (limit,)).fetchall()
+        return [{"timestamp": t, "action": a, "details": d} for t, a, d in reversed(rows)]
+
+    def last_log_id(self):
+        """Grows with every new entry; used as the version of the log."""
+        with self._connect(write=False) as conn:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM logs").fetchone()[0]
+
+    def log_count(self):
+        with self._connect(write=False) as conn:
+            return conn.execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+
+    # --- leases ---
+
+    def acquire_lease(self, name, owner, ttl):
+        """Take the lease if it is free, expired or already ours. Returns True on success."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT owner, expires FROM leases WHERE name = ?", (name,)).fetchone()
+            if row and row[0] != owner and row[1] > now:
+                return False
+            conn.execute("INSERT OR REPLACE INTO leases (name, owner, expires) VALUES (?, ?, ?)",
+                         (name, owner, now + ttl))
+            return True
+
+    def renew_lease(self, name, owner, ttl):
+        with self._connect() as conn:
+            cursor = conn.execute("UPDATE leases SET expires = ? WHERE name = ? AND owner = ?",
+                                  (time.time() + ttl, name, owner))
+            return cursor.rowcount == 1
+
+    def release_lease(self, name, owner):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    def lease_holder(self, name):
+        """Owner of an active lease, or None."""
+        with self._connect(write=False) as conn:
+            row = conn.execute("SELECT owner FROM leases WHERE name = ? AND expires > ?",
+                               (name, time.time())).fetchone()
+        return row[0] if row else None
+
+
+class _Transaction:
+    """BEGIN ... COMMIT/ROLLBACK around a block."""
+
+    def __init__(self, conn, begin):
+        self.conn = conn
+        self.begin = begin
+
+    def __enter__(self):
+        self.conn.execute(self.begin)
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+class LeaseHeartbeat:
+    """Keeps a lease alive from a background thread until stop() is called."""
+
+    def __init__(self, store, name, owner, ttl):
+        self.store, self.name, self.owner, self.ttl = store, name, owner, ttl
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                renewed = self.store.renew_lease(self.name, self.owner, self.ttl)
+            except Exception as e:
+                # e.g. "database is locked" - the lease is still ours until it expires
+                print(f"Error renewing lease {self.name}: {e}")
+                continue
+            if not renewed:
+                print(f"Lost lease {self.name} ({self.owner})")
+                return
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.store.release_lease(self.name, self.owner)
@@ -0,0 +1,340 @@
+"""
+Keyword backends for file names
+"ai" asks OpenRouter for 3 words; "local" picks them offline with TF-IDF
+over our own archive (Polish stopwords, light suffix stemming) in
+microseconds. "auto" (default) uses the AI and falls back to the local
+extractor when the AI gives nothing; when the AI was unavailable the file is
+named locally and renamed once the AI answers (deferred_naming.py). The mode can be set per job with
+set_mode(); other backends can be added with register_backend().
+The AI backend sits behind a circuit breaker and a time budget: when
+OpenRouter fails or hangs, calls return None at once instead of waiting.
+With AI_HEDGE=1 a call that has not answered within the model's p90 latency
+(from its recent answers) gets a second request - to the same model or the
+fastest one in AI_HEDGE_MODELS - and the first answer wins. At most
+AI_HEDGE_BUDGET extra requests per call are sent.
+"""
+
+import asyncio
+import contextvars
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+
+from circuit_breaker import CircuitBreaker
+from tracing import span
+
+KEYWORD_MODES = ("ai", "local", "auto")  # plus names of registered backends
+DEFAULT_MODE = os.getenv("KEYWORDS_MODE", "auto")
+KEYWORD_COUNT = 3
+CORPUS_REFRESH = 0.1  # rebuild the corpus when the archive grew by 10%
+AI_TIMEOUT = float(os.getenv("AI_TIMEOUT", "15"))          # seconds per AI call, slot wait included
+AI_FAILURES = int(os.getenv("AI_FAILURES", "3"))           # failures in a row that open the circuit
+AI_RESET_TIMEOUT = float(os.getenv("AI_RESET_TIMEOUT", "30"))  # seconds before a trial call
+AI_HEDGE = os.getenv("AI_HEDGE", "").lower() in ("1", "true", "yes", "on")
+AI_HEDGE_MODELS = [m.strip() for m in os.getenv("AI_HEDGE_MODELS", "").split(",") if m.strip()]  # default: same model
+AI_HEDGE_BUDGET = float(os.getenv("AI_HEDGE_BUDGET", "0.1"))  # extra requests per call
+AI_HEDGE_PERCENTILE = 0.9
+LATENCY_SAMPLES = 200       # recent answer times kept per model
+LATENCY_MIN_SAMPLES = 10    # no hedging before a model answered this many times
+
+_mode = contextvars.ContextVar("keywords_mode", default=None)
+
+STOPWORDS = set("""
+a aby ach acz aczkolwiek aj albo ale ależ ani aż bardziej bardzo bez bo bowiem by byli bym bynajmniej być był była
+było były będzie będą cali cała cały chce co coraz coś czy czyli często dla do dlaczego dlatego dany dane danych
+dnia dniu gdy gdyż gdzie go i ich ile im inna inne inny innych ja jak jaka jaki jakie jako je jeden jedna jedno
+jego jej jemu jest jestem jeszcze jeśli jeżeli już ją każdy kiedy kilka kto która które którego której który
+których którym którzy lub ma mają mam mi między mnie mogą może można mój na nad nam nas natomiast nawet nich nie
+niech niego niej niż no o od oraz oto pan po pod podczas pomimo ponad ponieważ przed przez przy się sobie sposób
+swoje są ta tak taka taki takie także tam te tego tej temu ten też to tobie toteż trzeba tu tutaj twoje ty tych
+tylko tym u w we według więc wiele wielu właśnie wszyscy wszystkich wszystko wtedy wy z za zaś ze został została
+zostały zostanie że żeby
+uchwała uchwały uchwałę uchwale uchwał projekt projektu druk nr sprawie sprawy rada rady radzie miasta miasto
+mieście piła piły pile roku rok r art ust pkt poz dz zm późn zmianami dotyczy dotyczące zgodnie podstawie
+stosunku ramach celu wraz latach lata pily miejskiej
+stycznia lutego marca kwietnia maja czerwca lipca sierpnia września października listopada grudnia
+""".split())
+
+# Longest first; a stem keeps at least 4 letters
+SUFFIXES = sorted("""
+owania owanie owaniu owaną owane owany owych owymi owym owej owego owemu owa owe owi owy ów
+ami ach iami iach ych ymi ego emu ej ia ie iu ią ię om ow em a ą e ę i o u y
+""".split(), key=len, reverse=True)
+
+_WORD = re.compile(r"[a-ząćęłńóśźż]+")
+_ROMAN = re.compile(r"[ivxlcdm]+")  # session/resolution numbers like XII
+
+
+class UnknownModeError(ValueError):
+    pass
+
+
+def check_mode(mode):
+    if mode is not None and mode != "auto" and mode not in BACKENDS:
+        raise UnknownModeError(f"Nieznany tryb słów kluczowych: {mode}")
+    return mode
+
+
+def set_mode(mode):
+    """Keyword mode for the current thread/job (None = KEYWORDS_MODE default)."""
+    _mode.set(check_mode(mode))
+
+
+def current_mode():
+    return _mode.get() or DEFAULT_MODE
+
+
+def stem(word):
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokens(text):
+    """(stem, word) pairs of the content words of a text."""
+    return [(stem(word), word) for word in _WORD.findall(text.lower())
+            if len(word) >= 3 and word not in STOPWORDS and not _ROMAN.fullmatch(word)]
+
+
+class Corpus:
+    """Document frequencies of stems in an archive."""
+
+    def __init__(self, texts=()):
+        self.documents = 0
+        self.df = Counter()
+        for text in texts:
+            self.add(text)
+
+    def add(self, text):
+        self.documents += 1
+        self.df.update({s for s, _ in tokens(text)})
+
+    def idf(self, stem_):
+        return math.log((self.documents + 1) / (self.df.get(stem_, 0) + 1)) + 1.0
+
+
+def extract_keywords(text, corpus=None, count=KEYWORD_COUNT):
+    """Top words by TF-IDF ("word_word_word"); ties go to the earlier word."""
+    found = tokens(text)
+    if not found:
+        return ""
+    tf = Counter(s for s, _ in found)
+    first, forms = {}, {}
+    for position, (s, word) in enumerate(found):
+        first.setdefault(s, position)
+        forms.setdefault(s, Counter())[word] += 1
+    idf = corpus.idf if corpus else (lambda s: 1.0)
+    ranked = sorted(tf, key=lambda s: (-tf[s] * idf(s), first[s]))
+    return "_".join(forms[s].most_common(1)[0][0] for s in ranked[:count])
+
+
+_corpora = {}
+_corpora_lock = threading.Lock()
+
+
+def get_corpus(archive_dir, build=True):
+    """Corpus of an archive from the full-text index (None when there is no index).
+    With build=False only an up-to-date cached corpus is returned."""
+    from search_index import INDEX_FILENAME, get_search_index
+
+    if not archive_dir or not os.path.exists(os.path.join(archive_dir, INDEX_FILENAME)):
+        return None
+    index = get_search_index(archive_dir)
+    documents = index.count()
+    key = os.path.abspath(archive_dir)
+    with _corpora_lock:
+        corpus = _corpora.get(key)
+        if corpus is None or documents > corpus.documents * (1 + CORPUS_REFRESH):
+            if not build:
+                return None
+            corpus = _corpora[key] = Corpus(index.iter_texts())
+        return corpus
+
+
+class KeywordBackend:
+    """Interface: keywords(text, archive_dir) -> "word_word_word", "" or
+    None when the backend is unavailable right now."""
+    name = ""
+
+    async def keywords(self, text, archive_dir=None):
+        raise NotImplementedError
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class LatencyStats:
+    """Recent answer times of one model."""
+
+    def __init__(self):
+        self.samples = deque(maxlen=LATENCY_SAMPLES)
+        self.failures = 0
+
+    def quantile(self, fraction):
+        """None until the model answered LATENCY_MIN_SAMPLES times."""
+        if len(self.samples) < LATENCY_MIN_SAMPLES:
+            return None
+        return percentile(self.samples, fraction)
+
+    def status(self):
+        return {
+            "samples": len(self.samples),
+            "failures": self.failures,
+            **{f"p{int(f * 100)}_ms": round(percentile(self.samples, f) * 1000, 1) for f in (0.5, 0.9, 0.99)}
+        }
+
+
+class OpenRouterBackend(KeywordBackend):
+    name = "ai"
+
+    def __init__(self):
+        self.breaker = CircuitBreaker("AI", AI_FAILURES, AI_RESET_TIMEOUT)
+        self.latency = {}      # model -> LatencyStats
+        self.calls = 0
+        self.hedges = 0        # second requests sent
+        self.hedge_wins = 0    # ...that answered first
+
+    def _stats(self, model):
+        return self.latency.setdefault(model, LatencyStats())
+
+    async def _ask(self, text, model, sent):
+        """One request; sent (asyncio.Event) is set when it leaves the throttle
+        queue, and its latency is counted from there."""
+        import async_scraper
+        started = []
+
+        def on_sent():
+            started.append(time.perf_counter())
+            sent.set()
+
+        result = await async_scraper.analyze_content_with_ai(text, model, on_sent)
+        if result is None:
+            self._stats(model).failures += 1
+        elif started:
+            self._stats(model).samples.append(time.perf_counter() - started[0])
+        return result
+
+    def hedge_delay(self, model):
+        """Seconds to wait before a second request, None when no hedge may be sent."""
+        if not AI_HEDGE or self.hedges + 1 > AI_HEDGE_BUDGET * self.calls:
+            return None
+        return self._stats(model).quantile(AI_HEDGE_PERCENTILE)
+
+    def hedge_model(self, model):
+        """The candidate with the lowest p90 (one without enough answers yet is tried first)."""
+        return min(AI_HEDGE_MODELS or [model],
+                   key=lambda m: self._stats(m).quantile(AI_HEDGE_PERCENTILE) or 0.0)
+
+    async def _hedged(self, text):
+        import rada_scraper
+        model = rada_scraper.OPENROUTER_MODEL
+        self.calls += 1
+        sent = asyncio.Event()
+        tasks = [asyncio.ensure_future(self._ask(text, model, sent))]
+        try:
+            delay = self.hedge_delay(model)
+            if delay is None:
+                return await tasks[0]
+            # The p90 clock starts when the request leaves the throttle queue
+            waiting = asyncio.ensure_future(sent.wait())
+            await asyncio.wait([tasks[0], waiting], return_when=asyncio.FIRST_COMPLETED)
+            waiting.cancel()
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return tasks[0].result()
+            second = self.hedge_model(model)
+            self.hedges += 1
+            print(f"AI nie odpowiedziało w {delay:.1f} s (p90) - wysyłam drugie zapytanie ({second})")
+            tasks.append(asyncio.ensure_future(self._ask(text, second, asyncio.Event())))
+            pending, result = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result is not None:
+                        if task is tasks[1]:
+                            self.hedge_wins += 1
+                        return result
+            return result
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def latency_status(self):
+        return {
+            "hedging": AI_HEDGE,
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "models": {model: stats.status() for model, stats in list(self.latency.items())}
+        }
+
+    async def keywords(self, text, archive_dir=None):
+        if not self.breaker.allow():
+            return None
+        try:
+            result = await asyncio.wait_for(self._hedged(text), AI_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"AI nie odpowiedziało w ciągu {AI_TIMEOUT:.0f} s")
+            result = None
+        if result is None:
+            self.breaker.failure()
+        else:
+            self.breaker.success()
+        return result
+
+
+class LocalBackend(KeywordBackend):
+    name = "local"
+
+    async def keywords(self, text, archive_dir=None):
+        corpus = get_corpus(archive_dir, build=False)
+        if corpus is None and archive_dir:
+            # Building the corpus reads the whole index - keep it off the event loop
+            corpus = await asyncio.to_thread(get_corpus, archive_dir)
+        return extract_keywords(text, corpus)
+
+
+BACKENDS = {}
+
+
+def register_backend(backend):
+    BACKENDS[backend.name] = backend
+
+
+register_backend(OpenRouterBackend())
+register_backend(LocalBackend())
+
+
+async def file_keywords(text, archive_dir=None, mode=None):
+    """(keywords, ask_ai_later) for a file name using the job's mode.
+    ask_ai_later is True when the AI was unavailable: keywords is then None in
+    "ai" mode and the local fallback in "auto" mode."""
+    mode = mode or current_mode()
+    if mode in ("ai", "auto"):
+        with span("ai"):
+            result = await BACKENDS["ai"].keywords(text, archive_dir)
+        if result or mode == "ai":
+            return result, result is None
+        unavailable = result is None
+        mode = "local"
+    else:
+        unavailable = False
+    with span("keywords", backend=mode):
+        return await BACKENDS[mode].keywords(text, archive_dir), unavailable
+
+
+async def generate_keywords(text, archive_dir=None, mode=None):
+    """Keywords for a file name using the job's mode.
+    None means the AI was unavailable in "ai" mode (name the file later)."""
+    return (await file_keywords(text, archive_dir, mode))[0]
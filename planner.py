@@ -0,0 +1,218 @@
+"""
+Dry-run planner
+Compares the remote agendas with the local archive without downloading any
+attachment: only the year index, session and agenda pages are fetched, plus
+one HEAD request per attachment for its size and ETag. Every attachment is
+reported as new, changed, keywords_missing or up_to_date; execute_plan()
+then downloads exactly the planned attachments.
+
+Usage:
+    python planner.py --dir ./data               # show the plan
+    python planner.py --dir ./data --sessions 3,5 --execute
+    python planner.py --dir ./data --offline     # plan from cached pages only
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urljoin
+
+import async_scraper
+import cold_storage
+import http_cache
+import rada_scraper
+from blob_store import BLOB_DIRNAME, get_blob_store
+
+STATUSES = ("new", "changed", "keywords_missing", "up_to_date")
+TODO_STATUSES = ("new", "changed", "keywords_missing")
+
+STATUS_LABELS = {
+    "new": "nowe",
+    "changed": "zmienione",
+    "keywords_missing": "bez słów kluczowych",
+    "up_to_date": "aktualne",
+}
+
+
+def _existing_store(base_dir):
+    """The archive's blob store, without creating one in a dry run."""
+    if os.path.isdir(os.path.join(base_dir, BLOB_DIRNAME)):
+        return get_blob_store(base_dir)
+    return None
+
+
+async def _plan_item(link, porzadek_url, save_dir, store):
+    file_url = urljoin(porzadek_url, link["href"])
+    original_filename = os.path.basename(file_url.split("?")[0])
+    druk_number = rada_scraper.get_druk_number_from_link(link)
+
+    exists, has_keywords, local = False, False, None
+    if os.path.isdir(save_dir):
+        if druk_number:
+            exists, has_keywords, local = rada_scraper.check_druk_exists_in_directory(save_dir, druk_number)
+        else:
+            # Attachments without a druk number keep their name (plus .gz in cold storage)
+            stored = cold_storage.resolve(os.path.join(save_dir, original_filename))
+            if stored:
+                exists, has_keywords, local = True, True, os.path.basename(stored)
+
+    remote_size, remote_etag = await async_scraper.fetch_head(file_url)
+    known = store.get_url(file_url) if store else None
+    same_as_stored = bool(known and remote_etag and known[1] == remote_etag)
+
+    if not exists:
+        status = "new"
+    elif not has_keywords:
+        status = "keywords_missing"
+    elif known and known[1] and remote_etag:
+        status = "up_to_date" if same_as_stored else "changed"
+    else:
+        # Downloaded before the blob store kept ETags - compare sizes
+        local_size = cold_storage.original_size(os.path.join(save_dir, local))
+        status = "changed" if remote_size is not None and remote_size != local_size else "up_to_date"
+
+    # A stored copy with the same ETag is answered with 304, nothing to transfer
+    transfer = status in TODO_STATUSES and not same_as_stored
+    return {
+        "druk": druk_number,
+        "href": link["href"],
+        "text": link.get_text(strip=True),
+        "url": file_url,
+        "local": local,
+        "status": status,
+        "bytes": (remote_size or 0) if transfer else 0
+    }
+
+
+async def _plan_session(sesja_url, sesja_number, base_dir, store):
+    porzadek_url, porzadek_number = await async_scraper.get_latest_porządek_url(sesja_url)
+    links = async_scraper.attachment_links(await async_scraper.fetch_page(porzadek_url))
+    save_dir = os.path.join(base_dir, f"Sesja{sesja_number}", f"Porzadek{porzadek_number}")
+    items = await asyncio.gather(*(_plan_item(link, porzadek_url, save_dir, store) for link in links))
+    return {
+        "sesja": sesja_number,
+        "sesja_url": sesja_url,
+        "porzadek": porzadek_number,
+        "porzadek_url": porzadek_url,
+        "items": list(items)
+    }
+
+
+def summarize(sessions):
+    summary = {status: 0 for status in STATUSES}
+    summary["bytes"] = 0
+    for session in sessions:
+        for item in session["items"]:
+            summary[item["status"]] += 1
+            summary["bytes"] += item["bytes"]
+    summary["sessions"] = len(sessions)
+    summary["todo"] = sum(summary[status] for status in TODO_STATUSES)
+    return summary
+
+
+async def build_plan(base_dir, sessions=None, progress=None):
+    """Plan of what a download of the given session numbers (default: all) would do.
+    progress(done_sessions, total_sessions, sesja_number) is called as sessions finish,
+    in the engine's thread pool."""
+    remote = await async_scraper.get_all_sesja_urls()
+    if sessions:
+        remote = [(url, number) for url, number in remote if number in set(sessions)]
+    base_dir = os.path.abspath(base_dir)
+    store = _existing_store(base_dir)
+    done = 0
+    reporting = asyncio.Lock()  # FIFO, so progress never goes backwards
+
+    async def plan_session(url, number):
+        nonlocal done
+        session = await _plan_session(url, number, base_dir, store)
+        done += 1
+        if progress:
+            finished = done
+            async with reporting:
+                await async_scraper._run_blocking(progress, finished, len(remote), number)
+        return session
+
+    planned = await asyncio.gather(*(plan_session(url, number) for url, number in remote))
+    planned = sorted(planned, key=lambda session: session["sesja"])
+    return {
+        "id": uuid.uuid4().hex[:12],
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "base_dir": base_dir,
+        "sessions": planned,
+        "summary": summarize(planned)
+    }
+
+
+def _link_tag(item):
+    """<a> tag for an attachment of a plan (download_attachment works on tags)."""
+    from bs4 import BeautifulSoup
+    tag = BeautifulSoup("", "html.parser").new_tag("a", href=item["href"])
+    tag.string = item["text"]
+    return tag
+
+
+async def execute_plan(plan, progress=None):
+    """Download exactly the planned attachments (new, changed, keywords_missing).
+    progress(done_sessions, total_sessions, sesja_number) is called before each session,
+    in the engine's thread pool.
+    Returns the per-file results."""
+    sessions = [session for session in plan["sessions"]
+                if any(item["status"] in TODO_STATUSES for item in session["items"])]
+    store = get_blob_store(plan["base_dir"])
+    results = []
+    for done, session in enumerate(sessions):
+        if progress:
+            await async_scraper._run_blocking(progress, done, len(sessions), session["sesja"])
+        items = [item for item in session["items"] if item["status"] in TODO_STATUSES]
+        save_dir = os.path.join(plan["base_dir"], f"Sesja{session['sesja']}", f"Porzadek{session['porzadek']}")
+        Path(save_dir).mkdir(parents=True, exist_ok=True)
+        results.extend(await async_scraper.download_links(
+            [_link_tag(item) for item in items], session["porzadek_url"], save_dir, store,
+            replace_hrefs={item["href"] for item in items if item["status"] == "changed"}))
+    return results
+
+
+def print_plan(plan):
+    for session in plan["sessions"]:
+        counts = {}
+        for item in session["items"]:
+            counts[item["status"]] = counts.get(item["status"], 0) + 1
+        line = ", ".join(f"{STATUS_LABELS[status]}: {counts[status]}" for status in STATUSES if status in counts)
+        print(f"Sesja {session['sesja']} / Porządek {session['porzadek']}: {line or 'brak załączników'}")
+        for item in session["items"]:
+            if item["status"] in TODO_STATUSES:
+                print(f"  [{STATUS_LABELS[item['status']]}] DRUK NR {item['druk'] or '-'} "
+                      f"{item['url']} ({item['bytes'] / 1024:.0f} KB)")
+    summary = plan["summary"]
+    print(f"\nDo pobrania: {summary['todo']} plików, ok. {summary['bytes'] / (1024 * 1024):.1f} MB "
+          f"({', '.join(f'{STATUS_LABELS[s]}: {summary[s]}' for s in STATUSES)})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan pobierania: porównanie BIP z lokalnym archiwum")
+    parser.add_argument("--dir", default=os.getenv("DOWNLOAD_DIR", "./data"), help="folder archiwum")
+    parser.add_argument("--sessions", default="", help="numery sesji, np. 3,5 (domyślnie wszystkie)")
+    parser.add_argument("--json", action="store_true", help="wypisz plan jako JSON")
+    parser.add_argument("--execute", action="store_true", help="pobierz zaplanowane pliki")
+    parser.add_argument("--offline", action="store_true", help="tylko strony z pamięci podręcznej, bez sieci")
+    args = parser.parse_args()
+    if args.offline:
+        http_cache.set_mode("replay")
+
+    sessions = [int(n) for n in args.sessions.split(",") if n.strip()]
+    plan = async_scraper.run_sync(build_plan(args.dir, sessions))
+    if args.json:
+        print(json.dumps(plan, ensure_ascii=False, indent=2))
+    else:
+        print_plan(plan)
+    if args.execute and plan["summary"]["todo"]:
+        results = async_scraper.run_sync(execute_plan(plan))
+        print(f"Pobrano {len(results)} plików")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,34 @@
 """
 Rada Miasta Scraper Module
 Refactored from script.py for web application use
+Network operations run on the asyncio engine (async_scraper.py); the
+functions here are their synchronous wrappers.
+BeautifulSoup, PyPDF2 and python-docx are imported on first use, so
+importing this module (and app.py) stays cheap.
 """
 
+import io
 import os
 import re
-import requests
-from bs4 import BeautifulSoup
 from pathlib import Path
 from urllib.parse import urljoin
 import json
-import PyPDF2
-from docx import Document
 import tempfile
 
+from tracing import span
+from blob_store import get_blob_store
+import async_scraper
+import cold_storage
+
 # Base configuration
-DEF_URL = "https://bip.pila.pl/2025.html"
+# BIP_URL / OPENROUTER_BASE_URL can point at a local stand-in (see bip_standin.py)
+DEF_URL = os.getenv("BIP_URL", "https://bip.pila.pl/2025.html")
 BASE_SAVE_DIR = r"C:\Users\PC\Desktop\SesjeRady"
 
 # OpenRouter AI configuration (read from environment)
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
 OPENROUTER_MODEL = "nvidia/nemotron-nano-9b-v2:free"
-OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1/chat/completions")
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -30,87 +37,63 @@ HEADERS = {
 }
 
 
-def get_latest_sesja_url():
-    """Find the latest Sesja Rady Miasta link and its number."""
-    resp = requests.get(DEF_URL, headers=HEADERS)
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
+def fetch_page(url):
+    """Fetch an HTML page and return its text."""
+    return async_scraper.run_sync(async_scraper.fetch_page(url))
 
-    # look for Sesja Rady Miasta links
-    sesja_links = soup.find_all("a", href=True, string=re.compile(r"Sesja Rady Miasta Piły", re.I))
-    if not sesja_links:
-        raise RuntimeError("Nie znaleziono żadnej sesji!")
 
-    latest = sesja_links[0]  # assume first is the latest
-    sesja_text = latest.get_text(strip=True)
+def fetch_page_if_changed(url, etag=None, last_modified=None):
+    """Conditional GET of an HTML page.
+    Returns (html, etag, last_modified); html is None when the server answered 304."""
+    return async_scraper.run_sync(async_scraper.fetch_page_if_changed(url, etag, last_modified))
 
-    # extract roman numeral (e.g. XVII)
-    match = re.search(r"([IVXLCDM]+)", sesja_text)
-    if not match:
-        raise RuntimeError("Nie udało się znaleźć numeru sesji")
-    roman_num = match.group(1)
 
-    # Convert roman to int
+def roman_to_int(s):
+    """Convert a roman numeral (e.g. XVII) to int."""
     roman_map = {'I':1,'V':5,'X':10,'L':50,'C':100,'D':500,'M':1000}
-    def roman_to_int(s):
-        total, prev = 0, 0
-        for ch in reversed(s):
-            val = roman_map[ch]
-            if val < prev:
-                total -= val
-            else:
-                total += val
-                prev = val
-        return total
-    sesja_number = roman_to_int(roman_num)
-
-    return urljoin(DEF_URL, latest["href"]), sesja_number
+    total, prev = 0, 0
+    for ch in reversed(s):
+        val = roman_map[ch]
+        if val < prev:
+            total -= val
+        else:
+            total += val
+            prev = val
+    return total
 
 
-def get_all_sesja_urls():
-    """Get all Sesja Rady Miasta links and their numbers."""
-    resp = requests.get(DEF_URL, headers=HEADERS)
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
+def parse_sesja_links(html, page_url):
+    """Parse Sesja Rady Miasta links from a year index page.
+    Returns [(sesja_url, sesja_number)] in page order (latest first)."""
+    from bs4 import BeautifulSoup
 
     # look for Sesja Rady Miasta links
-    sesja_links = soup.find_all("a", href=True, string=re.compile(r"Sesja Rady Miasta Piły", re.I))
+    with span("parse_links"):
+        soup = BeautifulSoup(html, "html.parser")
+        sesja_links = soup.find_all("a", href=True, string=re.compile(r"Sesja Rady Miasta Piły", re.I))
     if not sesja_links:
         raise RuntimeError("Nie znaleziono żadnej sesji!")
 
     sessions = []
-    roman_map = {'I':1,'V':5,'X':10,'L':50,'C':100,'D':500,'M':1000}
-    
-    def roman_to_int(s):
-        total, prev = 0, 0
-        for ch in reversed(s):
-            val = roman_map[ch]
-            if val < prev:
-                total -= val
-            else:
-                total += val
-                prev = val
-        return total
-
     for link in sesja_links:
         sesja_text = link.get_text(strip=True)
+        # extract roman numeral (e.g. XVII)
         match = re.search(r"([IVXLCDM]+)", sesja_text)
         if match:
-            roman_num = match.group(1)
-            sesja_number = roman_to_int(roman_num)
-            sessions.append((urljoin(DEF_URL, link["href"]), sesja_number))
-    
+            sessions.append((urljoin(page_url, link["href"]), roman_to_int(match.group(1))))
     return sessions
 
 
-def get_latest_porządek_url(sesja_url):
-    """Find the latest Porządek obrad subpage inside a Sesja page."""
-    resp = requests.get(sesja_url, headers=HEADERS)
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
+def parse_porzadek_links(html, sesja_url):
+    """Parse Porządek obrad links from a Sesja page.
+    Returns [(porzadek_url, porzadek_number)]: all numbered agendas, or the first
+    unnumbered one as number 1 when the session has no numbered agendas."""
+    from bs4 import BeautifulSoup
 
     # Find all porządek obrad links (bez względu na wielkość liter i czy ma numer)
-    porzadek_links = soup.find_all("a", href=True, string=re.compile(r"porządek obrad", re.I))
+    with span("parse_links"):
+        soup = BeautifulSoup(html, "html.parser")
+        porzadek_links = soup.find_all("a", href=True, string=re.compile(r"porządek obrad", re.I))
     if not porzadek_links:
         raise RuntimeError("Nie znaleziono żadnego porządku obrad")
 
@@ -124,22 +107,30 @@ def get_latest_porządek_url(sesja_url):
         match = re.search(r"nr\s*([1-9])", text)
         if match:
             number = int(match.group(1))
-            numbered_porzadki.append((link, number))
+            numbered_porzadki.append((urljoin(sesja_url, link["href"]), number))
         else:
             # Porządek bez numeru
             unnumbered_porzadki.append(link)
     
-    # Jeśli są porządki z numerami, wybierz ten z najwyższym numerem
     if numbered_porzadki:
-        latest_link, latest_number = max(numbered_porzadki, key=lambda x: x[1])
-        return urljoin(sesja_url, latest_link["href"]), latest_number
-    else:
-        # Jeśli nie ma numerowanych, weź pierwszy bez numeru
-        if unnumbered_porzadki:
-            latest_link = unnumbered_porzadki[0]
-            return urljoin(sesja_url, latest_link["href"]), 1
-        else:
-            raise RuntimeError("Nie znaleziono żadnego porządku obrad")
+        return numbered_porzadki
+    # Jeśli nie ma numerowanych, weź pierwszy bez numeru
+    return [(urljoin(sesja_url, unnumbered_porzadki[0]["href"]), 1)]
+
+
+def get_latest_sesja_url():
+    """Find the latest Sesja Rady Miasta link and its number."""
+    return async_scraper.run_sync(async_scraper.get_latest_sesja_url())
+
+
+def get_all_sesja_urls():
+    """Get all Sesja Rady Miasta links and their numbers."""
+    return async_scraper.run_sync(async_scraper.get_all_sesja_urls())
+
+
+def get_latest_porządek_url(sesja_url):
+    """Find the latest Porządek obrad subpage inside a Sesja page."""
+    return async_scraper.run_sync(async_scraper.get_latest_porządek_url(sesja_url))
 
 
 def get_druk_number_from_link(link):
@@ -154,6 +145,7 @@ def get_druk_number_from_link(link):
 def extract_text_from_pdf(file_path):
     """Extract text from PDF file."""
     try:
+        import PyPDF2
         with open(file_path, 'rb') as file:
             pdf_reader = PyPDF2.PdfReader(file)
             text = ""
@@ -172,6 +164,7 @@ def extract_text_from_pdf(file_path):
 def extract_text_from_docx(file_path):
     """Extract text from DOCX file."""
     try:
+        from docx import Document
         doc = Document(file_path)
         text = ""
         # Read first few paragraphs
@@ -203,51 +196,56 @@ def get_file_content_preview(file_path):
         return ""
 
 
-def analyze_content_with_ai(content_text):
-    """Use OpenRouter AI to analyze content and return 3-word summary."""
-    if not content_text or len(content_text.strip()) < 10:
-        return ""
-    
-    prompt = f"""
-    Analyze this Polish document text (first 35 words) and provide exactly 3 words that best describe its main topic or purpose. 
-    The response should be in Polish and contain ONLY the 3 words, separated by spaces, no punctuation.
-    
-    Document text:
-    {content_text}
-    
-    Respond with exactly 3 Polish words:"""
-    
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    data = {
-        "model": OPENROUTER_MODEL,
-        "messages": [
-            {"role": "user", "content": prompt}
-        ],
-        "max_tokens": 10,
-        "temperature": 0.3
-    }
-    
+def extract_pages(file_path, max_pages=200):
+    """Text of a PDF per page (a DOCX is one page); [] for other files.
+    Compressed files of old sessions (.gz, see cold_storage.py) are read as well."""
+    file_ext = os.path.splitext(cold_storage.logical_name(file_path))[1].lower()
     try:
-        response = requests.post(OPENROUTER_BASE_URL, headers=headers, json=data)
-        response.raise_for_status()
-        result = response.json()
-        
-        if 'choices' in result and len(result['choices']) > 0:
-            ai_response = result['choices'][0]['message']['content'].strip()
-            # Clean up the response - take only first 3 words
-            words = ai_response.split()[:3]
-            return "_".join(words) if words else ""
-        else:
-            print(f"Unexpected AI response format: {result}")
-            return ""
-            
+        if file_ext == ".pdf":
+            import PyPDF2
+            with cold_storage.open_file(file_path) as file:
+                # Both readers seek a lot - a gzip stream is read into memory first
+                pdf_reader = PyPDF2.PdfReader(io.BytesIO(file.read()) if cold_storage.is_cold(file_path) else file)
+                return [page.extract_text() or "" for page in pdf_reader.pages[:max_pages]]
+        elif file_ext == ".docx":
+            from docx import Document
+            with cold_storage.open_file(file_path) as file:
+                document = Document(io.BytesIO(file.read()) if cold_storage.is_cold(file_path) else file)
+            return ["\n".join(paragraph.text for paragraph in document.paragraphs)]
     except Exception as e:
-        print(f"Error calling OpenRouter AI: {e}")
-        return ""
+        print(f"Error extracting text from {file_path}: {e}")
+    return []
+
+
+def extract_full_text(file_path, max_pages=200):
+    """Extract the whole text of a PDF/DOCX file (used for full-text search).
+    The first 35 words are the same as get_file_content_preview()."""
+    return "\n".join(extract_pages(file_path, max_pages))
+
+
+# Callbacks notified after a downloaded file got its final name:
+# hook(file_path, text, old_path=None, sha256=None) where text is the extracted
+# full text, or None when the content is identical to an already stored blob
+FILE_SAVED_HOOKS = []
+
+
+def register_file_hook(hook):
+    """Register a callback for saved/renamed files (e.g. the search index)."""
+    if hook not in FILE_SAVED_HOOKS:
+        FILE_SAVED_HOOKS.append(hook)
+
+
+def notify_file_saved(file_path, text, old_path=None, sha256=None):
+    for hook in FILE_SAVED_HOOKS:
+        try:
+            hook(file_path, text, old_path=old_path, sha256=sha256)
+        except Exception as e:
+            print(f"Error in file hook {getattr(hook, '__name__', hook)}: {e}")
+
+
+def analyze_content_with_ai(content_text):
+    """Use OpenRouter AI to analyze content and return 3-word summary."""
+    return async_scraper.run_sync(async_scraper.analyze_content_with_ai(content_text))
 
 
 def generate_new_filename(link, original_filename, ai_keywords=""):
@@ -288,9 +286,11 @@ def check_druk_exists_in_directory(save_dir, druk_number):
         return False, False, None
     
     for filename in os.listdir(save_dir):
-        if filename.startswith(f"DRUK_NR{druk_number}"):
-            # Check if file has AI keywords (more than just druk number and extension)
-            name_without_ext = os.path.splitext(filename)[0]
+        # DRUK_NR24 must not match DRUK_NR248_...
+        if re.match(rf"DRUK_NR{druk_number}[_.]", filename):
+            # Check if file has AI keywords (more than just druk number and extension);
+            # compressed files of old sessions end with an extra .gz
+            name_without_ext = os.path.splitext(cold_storage.logical_name(filename))[0]
             
             # Pattern analysis:
             # DRUK_NR248.pdf -> no keywords
@@ -310,76 +310,22 @@ def check_druk_exists_in_directory(save_dir, druk_number):
     return False, False, None
 
 
-def download_attachments(porzadek_url, save_dir):
-    """Download all file attachments from Porządek obrad page."""
-    resp = requests.get(porzadek_url, headers=HEADERS)
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
+def download_to_file(file_url, dest_path, etag=None, last_modified=None):
+    """Stream an attachment to dest_path, hashing it on the way.
+    Returns (sha256, size, etag, last_modified); sha256 is None when the server
+    answered 304 Not Modified to the validators (nothing is written then)."""
+    return async_scraper.run_sync(async_scraper.download_to_file(file_url, dest_path, etag, last_modified))
 
-    for link in soup.find_all("a", href=True):
-        href = link["href"]
-        if href.lower().endswith((".pdf", ".doc", ".docx", ".xls", ".xlsx", ".gml")):
-            file_url = urljoin(porzadek_url, href)
-            original_filename = os.path.basename(file_url.split("?")[0])  # clean ?params
-            
-            # Extract druk number first to check for duplicates
-            druk_number = get_druk_number_from_link(link)
-            
-            # Check if file with this druk number already exists
-            exists, has_keywords, existing_filename = check_druk_exists_in_directory(save_dir, druk_number)
-            
-            if exists and has_keywords:
-                print(f"Plik DRUK_NR{druk_number} z słowami kluczowymi już istnieje - pomijam {original_filename}")
-                continue
-            
-            # Download to temporary file (either new file or to analyze existing one)
-            temp_filepath = os.path.join(save_dir, f"temp_{original_filename}")
-            print(f"Pobieram {file_url} -> temp file")
-            file_resp = requests.get(file_url, headers=HEADERS)
-            file_resp.raise_for_status()
-            with open(temp_filepath, "wb") as f:
-                f.write(file_resp.content)
-            
-            # Analyze content with AI
-            ai_keywords = ""
-            print(f"Analizuję zawartość pliku {original_filename}...")
-            content_text = get_file_content_preview(temp_filepath)
-            if content_text:
-                ai_keywords = analyze_content_with_ai(content_text)
-                print(f"AI wygenerował słowa kluczowe: {ai_keywords}")
-            else:
-                print("Nie udało się wyciągnąć tekstu z pliku")
-            
-            if exists and not has_keywords:
-                # File exists but without keywords - rename existing file and remove temp
-                print(f"Plik DRUK_NR{druk_number} istnieje bez słów kluczowych - dodaję słowa kluczowe")
-                existing_filepath = os.path.join(save_dir, existing_filename)
-                
-                # Generate new filename with AI keywords using existing file extension
-                existing_ext = os.path.splitext(existing_filename)[1]
-                if ai_keywords:
-                    new_filename = f"DRUK_NR{druk_number}_{ai_keywords}{existing_ext}"
-                else:
-                    new_filename = existing_filename  # Keep original if AI failed
-                
-                new_filepath = os.path.join(save_dir, new_filename)
-                
-                # Rename existing file
-                os.rename(existing_filepath, new_filepath)
-                print(f"Przemianowano istniejący plik: {existing_filename} -> {new_filename}")
-                
-                # Remove temporary file
-                os.remove(temp_filepath)
-            else:
-                # New file - generate filename and save
-                final_filename = generate_new_filename(link, original_filename, ai_keywords)
-                final_filepath = os.path.join(save_dir, final_filename)
-                
-                # Rename temp file to final name
-                os.rename(temp_filepath, final_filepath)
-                print(f"Zapisano jako: {final_filepath}")
-            
-            print("---")
+
+def download_attachments(porzadek_url, save_dir, store=None):
+    """Download all file attachments from Porządek obrad page.
+    With a BlobStore (blob_store.py) files are kept once per content hash and
+    linked into save_dir; an attachment identical to one already stored reuses
+    its AI keywords without extraction or an AI call.
+    Returns a list of per-file results: {"url", "filename", "bytes", "seconds"}.
+    Skipped files (already named with keywords) are not included.
+    """
+    return async_scraper.run_sync(async_scraper.download_attachments(porzadek_url, save_dir, store=store))
 
 
 def get_existing_sessions(base_save_dir):
@@ -398,26 +344,9 @@ def get_existing_sessions(base_save_dir):
 
 
 def download_specific_sesja(sesja_url, sesja_number, base_save_dir):
-    """Download the latest porządek from a specific session."""
-    try:
-        print(f"Przetwarzanie Sesji {sesja_number}...")
-        
-        # Get latest porządek for this session
-        porzadek_url, porzadek_number = get_latest_porządek_url(sesja_url)
-        
-        # Create directories
-        sesja_dir = os.path.join(base_save_dir, f"Sesja{sesja_number}")
-        porzadek_dir = os.path.join(sesja_dir, f"Porzadek{porzadek_number}")
-        Path(porzadek_dir).mkdir(parents=True, exist_ok=True)
-        
-        print(f"Pobieranie z Porządku {porzadek_number}...")
-        download_attachments(porzadek_url, porzadek_dir)
-        
-        print(f"Zakończono Sesję {sesja_number}")
-        
-    except Exception as e:
-        print(f"Błąd podczas przetwarzania Sesji {sesja_number}: {e}")
-        raise
+    """Download the latest porządek from a specific session.
+    Returns the per-file results of download_attachments."""
+    return async_scraper.run_sync(async_scraper.download_specific_sesja(sesja_url, sesja_number, base_save_dir))
 
 
 def main():
@@ -435,7 +364,7 @@ def main():
     print(f"Najświeższy porządek: {porzadek_number}, URL: {porzadek_url}")
 
     # Step 3: download files
-    download_attachments(porzadek_url, porzadek_dir)
+    download_attachments(porzadek_url, porzadek_dir, store=get_blob_store(BASE_SAVE_DIR))
 
 
 if __name__ == "__main__":
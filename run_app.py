@@ -4,7 +4,10 @@ Run this file to start the web server
 """
 
 if __name__ == '__main__':
-    from app import app
+    from app import app, load_settings, apply_watcher_settings, warm_album_indexes
+    load_settings()
+    apply_watcher_settings()
+    warm_album_indexes()
     print("🚀 Uruchamianie aplikacji Rada Miasta Piły...")
     print("📱 Aplikacja będzie dostępna pod adresem:")
     print("   http://localhost:5000")
@@ -5,8 +5,6 @@ from bs4 import BeautifulSoup
 from pathlib import Path
 from urllib.parse import urljoin
 import json
-import PyPDF2
-from docx import Document
 import tempfile
 
 # Base configuration
@@ -122,6 +120,7 @@ def get_druk_number_from_link(link):
 def extract_text_from_pdf(file_path):
     """Extract text from PDF file."""
     try:
+        import PyPDF2  # loaded only when there is a new file to read
         with open(file_path, 'rb') as file:
             pdf_reader = PyPDF2.PdfReader(file)
             text = ""
@@ -140,6 +139,7 @@ def extract_text_from_pdf(file_path):
 def extract_text_from_docx(file_path):
     """Extract text from DOCX file."""
     try:
+        from docx import Document
         doc = Document(file_path)
         text = ""
         # Read first few paragraphs
@@ -0,0 +1,269 @@
+"""
+Full-text search over downloaded documents
+An SQLite FTS5 index stored next to the archive (<download dir>/.search_index.db).
+Text is folded for Polish (lowercase, ą->a, ł->l, ...) both when indexing and
+when querying, so "uchwala budzetowa" finds "Uchwała budżetowa". Files are
+added incrementally by the download hook; rebuild() indexes existing files
+with text extraction running in parallel processes. Text already extracted
+once (text_cache.py) is not extracted again.
+"""
+
+import multiprocessing
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from cold_storage import logical_name
+from text_cache import content_sha256, get_text_cache, has_text
+
+INDEX_FILENAME = ".search_index.db"
+
+# Every character maps to exactly one character, so offsets in folded text
+# are the same as in the original text (used to cut snippets).
+_FOLD_TABLE = str.maketrans("ąćęłńóśźżĄĆĘŁŃÓŚŹŻ", "acelnoszzacelnoszz")
+
+
+def fold(text):
+    """Lowercase and strip Polish diacritics, keeping the text length unchanged."""
+    return text.lower().translate(_FOLD_TABLE)
+
+
+def query_terms(query):
+    """Split a user query into folded search terms."""
+    return re.findall(r"\w+", fold(query))
+
+
+def make_snippet(body, terms, width=160):
+    """Cut a window of the original text around the first matching term."""
+    folded = fold(body)
+    positions = [folded.find(term) for term in terms]
+    positions = [p for p in positions if p >= 0]
+    start = max(0, min(positions) - width // 3) if positions else 0
+    snippet = " ".join(body[start:start + width].split())
+    if start > 0:
+        snippet = "…" + snippet
+    if start + width < len(body):
+        snippet += "…"
+    return snippet
+
+
+def iter_archive_files(base_dir):
+    """Yield paths of files in SesjaN/PorzadekM folders."""
+    if not os.path.isdir(base_dir):
+        return
+    for sesja in os.scandir(base_dir):
+        if not (sesja.is_dir() and sesja.name.startswith("Sesja")):
+            continue
+        for porzadek in os.scandir(sesja.path):
+            if not (porzadek.is_dir() and porzadek.name.startswith("Porzadek")):
+                continue
+            for entry in os.scandir(porzadek.path):
+                if entry.is_file() and not entry.name.startswith("temp_"):
+                    yield entry.path
+
+
+def _extract(path):
+    """Worker for rebuild(): runs in a separate process."""
+    from rada_scraper import extract_pages
+    return path, extract_pages(path)
+
+
+class SearchIndex:
+    """FTS5 index of one archive folder (thread-safe)."""
+
+    def __init__(self, base_dir):
+        self.base_dir = os.path.abspath(base_dir)
+        self.db_path = os.path.join(self.base_dir, INDEX_FILENAME)
+        self.lock = threading.Lock()
+        os.makedirs(self.base_dir, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                path TEXT UNIQUE NOT NULL,
+                size INTEGER,
+                mtime REAL,
+                body TEXT,
+                sha256 TEXT
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+                name, body, tokenize = 'unicode61 remove_diacritics 2'
+            );
+        """)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(documents)")]
+        if "sha256" not in columns:
+            self.conn.execute("ALTER TABLE documents ADD COLUMN sha256 TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS documents_sha256 ON documents (sha256)")
+
+    def _relpath(self, path):
+        """Archive path as readers see it (compressed files without their .gz)."""
+        return logical_name(os.path.relpath(os.path.abspath(path), self.base_dir).replace(os.sep, "/"))
+
+    def _add(self, rel, text, size, mtime, sha256=None):
+        row = self.conn.execute("SELECT id FROM documents WHERE path = ?", (rel,)).fetchone()
+        if row:
+            self.conn.execute("UPDATE documents SET size = ?, mtime = ?, body = ?, sha256 = ? WHERE id = ?",
+                              (size, mtime, text, sha256, row[0]))
+            self.conn.execute("DELETE FROM documents_fts WHERE rowid = ?", (row[0],))
+            doc_id = row[0]
+        else:
+            doc_id = self.conn.execute(
+                "INSERT INTO documents (path, size, mtime, body, sha256) VALUES (?, ?, ?, ?, ?)",
+                (rel, size, mtime, text, sha256)).lastrowid
+        name = os.path.splitext(os.path.basename(rel))[0].replace("_", " ")
+        self.conn.execute("INSERT INTO documents_fts (rowid, name, body) VALUES (?, ?, ?)",
+                          (doc_id, fold(name), fold(text)))
+
+    def _remove(self, rel):
+        row = self.conn.execute("SELECT id FROM documents WHERE path = ?", (rel,)).fetchone()
+        if row:
+            self.conn.execute("DELETE FROM documents_fts WHERE rowid = ?", (row[0],))
+            self.conn.execute("DELETE FROM documents WHERE id = ?", (row[0],))
+
+    def add_file(self, path, text, old_path=None, sha256=None):
+        """Index (or re-index) one file; old_path is dropped when the file was renamed.
+        text=None means "same content as an indexed file with this sha256"."""
+        stat = os.stat(path)
+        if text is None and sha256:
+            with self.lock:
+                row = self.conn.execute("SELECT body FROM documents WHERE sha256 = ? LIMIT 1",
+                                        (sha256,)).fetchone()
+            text = row[0] if row else None
+        if text is None and has_text(path):
+            text = get_text_cache(self.base_dir).full_text(path, sha256)
+        with self.lock, self.conn:
+            if old_path and os.path.abspath(old_path) != os.path.abspath(path):
+                self._remove(self._relpath(old_path))
+            self._add(self._relpath(path), text or "", stat.st_size, stat.st_mtime, sha256)
+
+    def remove_file(self, path):
+        with self.lock, self.conn:
+            self._remove(self._relpath(path))
+
+    def search(self, query, limit=20):
+        """Return ranked results with snippets for a free-text query."""
+        terms = query_terms(query)
+        if not terms:
+            return []
+        # Prefix match on each term acts as crude stemming (budżet* -> budżetowy)
+        match = " ".join(f'"{term}"*' for term in terms)
+        with self.lock:
+            rows = self.conn.execute("""
+                SELECT d.path, d.body, d.size, bm25(documents_fts, 5.0, 1.0) AS score
+                FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid
+                WHERE documents_fts MATCH ?
+                ORDER BY score LIMIT ?
+            """, (match, limit)).fetchall()
+
+        results = []
+        for rel, body, size, score in rows:
+            parts = rel.split("/")
+            results.append({
+                "path": rel,
+                "filename": parts[-1],
+                "sesja": parts[0] if len(parts) > 2 else "",
+                "porzadek": parts[1] if len(parts) > 2 else "",
+                "size": size,
+                "score": round(-score, 3),
+                "snippet": make_snippet(body or "", terms)
+            })
+        return results
+
+    def iter_texts(self, batch=200):
+        """Bodies of all indexed documents, read in batches."""
+        last_id = 0
+        while True:
+            with self.lock:
+                rows = self.conn.execute("SELECT id, body FROM documents WHERE id > ? ORDER BY id LIMIT ?",
+                                         (last_id, batch)).fetchall()
+            if not rows:
+                return
+            for last_id, body in rows:
+                yield body or ""
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def rebuild(self, workers=None):
+        """Index new/changed files and drop missing ones; extraction runs in parallel.
+        Returns {"indexed", "unchanged", "removed", "seconds"}."""
+        started = time.perf_counter()
+        with self.lock:
+            known = {path: (size, mtime) for path, size, mtime in
+                     self.conn.execute("SELECT path, size, mtime FROM documents")}
+
+        todo = []
+        seen = set()
+        for path in iter_archive_files(self.base_dir):
+            rel = self._relpath(path)
+            seen.add(rel)
+            stat = os.stat(path)
+            if known.get(rel) != (stat.st_size, stat.st_mtime):
+                todo.append(path)
+
+        indexed = 0
+        texts = get_text_cache(self.base_dir)
+        with_text = {}
+        for path in todo:
+            if not has_text(path):
+                self.add_file(path, "")
+                indexed += 1
+                continue
+            sha256 = content_sha256(path)
+            cached = texts.get(sha256)
+            if cached and cached["text"] is not None:
+                texts.hits += 1
+                self.add_file(path, cached["text"], sha256=sha256)
+                indexed += 1
+            else:
+                texts.misses += 1
+                with_text[path] = sha256
+        if with_text:
+            # spawn: forking a process that runs the scraper loop, inotify and
+            # SQLite connections copies all of them into the children
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                for path, pages in pool.map(_extract, with_text, chunksize=4):
+                    text = texts.put_pages(with_text[path], pages)
+                    if os.path.exists(path):
+                        self.add_file(path, text, sha256=with_text[path])
+                        indexed += 1
+
+        removed = [rel for rel in known if rel not in seen]
+        with self.lock, self.conn:
+            for rel in removed:
+                self._remove(rel)
+
+        return {
+            "indexed": indexed,
+            "unchanged": len(seen) - len(todo),
+            "removed": len(removed),
+            "seconds": round(time.perf_counter() - started, 3)
+        }
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_search_index(base_dir):
+    """Shared SearchIndex instance per archive folder."""
+    key = os.path.abspath(base_dir)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = SearchIndex(key)
+        return _indexes[key]
+
+
+def archive_root(file_path):
+    """Archive folder of a file stored as <base>/SesjaN/PorzadekM/<file>."""
+    return os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(file_path))))
+
+
+def index_saved_file(file_path, text, old_path=None, sha256=None):
+    """rada_scraper file hook: keep the search index in sync with downloads."""
+    get_search_index(archive_root(file_path)).add_file(file_path, text, old_path=old_path, sha256=sha256)
@@ -0,0 +1,603 @@
+// Global variables
+let isDownloading = false;
+let statusCheckInterval;
+
+// Initialize page
+document.addEventListener('DOMContentLoaded', function() {
+    refreshStatus();
+    refreshFiles();
+    refreshLogs();
+    loadFolderSettings();
+
+    // Set up file search
+    document.getElementById('fileSearch').addEventListener('input', filterFiles);
+    document.getElementById('fileSearch').addEventListener('keydown', function(event) {
+        if (event.key === 'Enter') {
+            searchContent();
+        }
+    });
+
+    // Set up album selector change
+    document.getElementById('albumSelector').addEventListener('change', function() {
+        if (this.value) {
+            changeAlbum(this.value);
+        }
+    });
+});
+
+// API Functions
+async function refreshStatus() {
+    try {
+        const response = await fetch('/api/status');
+        const data = await response.json();
+
+        if (data.error) {
+            showError('Błąd pobierania statusu: ' + data.error);
+            return;
+        }
+
+        document.getElementById('latestSesja').textContent = `Sesja ${data.latest_sesja}`;
+        document.getElementById('latestPorzadek').textContent = `Porządek ${data.latest_porzadek}`;
+        document.getElementById('existingSessions').textContent = `${data.existing_sessions_count} sesji`;
+        document.getElementById('updateTime').textContent = new Date().toLocaleString('pl-PL');
+        document.getElementById('currentDownloadDir').textContent = data.current_download_dir;
+
+        // Update download status
+        if (data.download_status.is_running) {
+            startStatusMonitoring();
+            updateProgress(data.download_status);
+        }
+
+    } catch (error) {
+        showError('Błąd połączenia z serwerem');
+    }
+}
+
+async function downloadLatest() {
+    if (isDownloading) return;
+
+    try {
+        const response = await fetch('/api/download/latest', { method: 'POST' });
+        const data = await response.json();
+
+        if (data.error) {
+            showError(data.error);
+            return;
+        }
+
+        showSuccess('Rozpoczęto pobieranie najnowszych plików');
+        startStatusMonitoring();
+
+    } catch (error) {
+        showError('Błąd podczas rozpoczynania pobierania');
+    }
+}
+
+async function downloadAll() {
+    if (isDownloading) return;
+
+    if (!confirm('Czy na pewno chcesz zaktualizować wszystkie sesje? To może potrwać długo.')) {
+        return;
+    }
+
+    try {
+        const response = await fetch('/api/download/all', { method: 'POST' });
+        const data = await response.json();
+
+        if (data.error) {
+            showError(data.error);
+            return;
+        }
+
+        showSuccess('Rozpoczęto aktualizację wszystkich sesji');
+        startStatusMonitoring();
+
+    } catch (error) {
+        showError('Błąd podczas rozpoczynania aktualizacji');
+    }
+}
+
+async function downloadSession() {
+    if (isDownloading) return;
+
+    const sessionNumber = document.getElementById('sessionNumber').value;
+    if (!sessionNumber || sessionNumber < 1) {
+        showError('Podaj prawidłowy numer sesji');
+        return;
+    }
+
+    try {
+        const response = await fetch(`/api/download/session/${sessionNumber}`, { method: 'POST' });
+        const data = await response.json();
+
+        if (data.error) {
+            showError(data.error);
+            return;
+        }
+
+        showSuccess(`Rozpoczęto pobieranie Sesji ${sessionNumber}`);
+        startStatusMonitoring();
+
+    } catch (error) {
+        showError('Błąd podczas rozpoczynania pobierania sesji');
+    }
+}
+
+async function downloadFromFirst() {
+    if (isDownloading) return;
+
+    if (!confirm('Czy na pewno chcesz pobrać WSZYSTKIE sesje od pierwszej? To może potrwać bardzo długo i zająć dużo miejsca.')) {
+        return;
+    }
+
+    try {
+        const response = await fetch('/api/download/from_first', { method: 'POST' });
+        const data = await response.json();
+
+        if (data.error) {
+            showError(data.error);
+            return;
+        }
+
+        showSuccess('Rozpoczęto pobieranie wszystkich sesji od pierwszej');
+        startStatusMonitoring();
+
+    } catch (error) {
+        showError('Błąd podczas rozpoczynania pobierania od pierwszej sesji');
+    }
+}
+
+async function refreshFiles() {
+    try {
+        const response = await fetch('/api/files');
+        const files = await response.json();
+
+        displayFiles(files);
+        refreshStats();
+
+    } catch (error) {
+        document.getElementById('filesList').innerHTML = 
+            '<div class="text-center text-danger py-4"><i class="bi bi-exclamation-triangle fs-1"></i><p class="mt-2">Błąd ładowania plików</p></div>';
+    }
+}
+
+async function refreshLogs() {
+    try {
+        const response = await fetch('/api/logs');
+        const logs = await response.json();
+
+        displayLogs(logs);
+
+    } catch (error) {
+        document.getElementById('logsList').innerHTML = 
+            '<div class="text-center text-danger py-4"><i class="bi bi-exclamation-triangle fs-1"></i><p class="mt-2">Błąd ładowania historii</p></div>';
+    }
+}
+
+// UI Functions
+function startStatusMonitoring() {
+    isDownloading = true;
+    document.querySelector('.progress-container').style.display = 'block';
+
+    // Disable buttons
+    document.getElementById('btnLatest').disabled = true;
+    document.getElementById('btnAll').disabled = true;
+    document.getElementById('btnFromFirst').disabled = true;
+    document.getElementById('btnSession').disabled = true;
+
+    // Start polling
+    statusCheckInterval = setInterval(checkDownloadStatus, 2000);
+}
+
+function stopStatusMonitoring() {
+    isDownloading = false;
+    document.querySelector('.progress-container').style.display = 'none';
+
+    // Enable buttons
+    document.getElementById('btnLatest').disabled = false;
+    document.getElementById('btnAll').disabled = false;
+    document.getElementById('btnFromFirst').disabled = false;
+    document.getElementById('btnSession').disabled = false;
+
+    // Stop polling
+    if (statusCheckInterval) {
+        clearInterval(statusCheckInterval);
+    }
+
+    // Refresh data
+    setTimeout(() => {
+        refreshFiles();
+        refreshLogs();
+        refreshStatus();
+    }, 1000);
+}
+
+async function checkDownloadStatus() {
+    try {
+        const response = await fetch('/api/status');
+        const data = await response.json();
+
+        if (data.download_status) {
+            updateProgress(data.download_status);
+
+            if (!data.download_status.is_running) {
+                stopStatusMonitoring();
+
+                if (data.download_status.error) {
+                    showError('Błąd: ' + data.download_status.error);
+                } else {
+                    showSuccess('Pobieranie zakończone pomyślnie!');
+                }
+            }
+        }
+    } catch (error) {
+        console.error('Error checking status:', error);
+    }
+}
+
+function updateProgress(status) {
+    document.getElementById('progressTitle').textContent = status.current_task || 'Pobieranie w toku...';
+    document.getElementById('progressPercent').textContent = status.progress + '%';
+    document.getElementById('progressBar').style.width = status.progress + '%';
+    document.getElementById('progressDetails').textContent = 
+        status.last_update ? `Ostatnia aktualizacja: ${new Date(status.last_update).toLocaleTimeString('pl-PL')}` : '';
+}
+
+function displayFiles(files) {
+    const container = document.getElementById('filesList');
+
+    if (!files || files.length === 0) {
+        container.innerHTML = 
+            '<div class="text-center text-muted py-4"><i class="bi bi-folder2-open fs-1"></i><p class="mt-2">Brak pobranych plików</p></div>';
+        return;
+    }
+
+    // Group files by session and agenda
+    const grouped = {};
+    files.forEach(file => {
+        const key = `${file.sesja}/${file.porzadek}`;
+        if (!grouped[key]) {
+            grouped[key] = [];
+        }
+        grouped[key].push(file);
+    });
+
+    let html = '';
+    Object.keys(grouped).sort().reverse().forEach(group => {
+        const [sesja, porzadek] = group.split('/');
+        const groupFiles = grouped[group];
+
+        html += `
+            <div class="card mb-3">
+                <div class="card-header">
+                    <h6 class="mb-0 d-flex align-items-center">
+                        <i class="bi bi-folder me-2"></i>
+                        ${sesja} - ${porzadek} 
+                        <span class="badge bg-secondary ms-2">${groupFiles.length} plików</span>
+                        <a href="/api/export/zip?path=${encodeURIComponent(group)}" class="btn btn-outline-secondary btn-sm ms-auto" title="Pobierz wszystkie jako ZIP">
+                            <i class="bi bi-file-earmark-zip"></i> ZIP
+                        </a>
+                    </h6>
+                </div>
+                <div class="card-body">
+                    <div class="row">
+        `;
+
+        groupFiles.forEach(file => {
+            const sizeKB = Math.round(file.size / 1024);
+            const modifiedDate = new Date(file.modified).toLocaleDateString('pl-PL');
+
+            html += `
+                <div class="col-md-6 col-lg-4 mb-2 file-item" data-filename="${file.filename.toLowerCase()}">
+                    <div class="d-flex align-items-center p-2 border rounded">
+                        <i class="bi bi-file-earmark-pdf text-danger me-2"></i>
+                        <div class="flex-grow-1 text-truncate">
+                            <div class="fw-bold text-truncate" title="${file.filename}">${file.filename}</div>
+                            <small class="text-muted">${sizeKB} KB • ${modifiedDate}</small>
+                        </div>
+                        <a href="/download/${file.path}" class="btn btn-outline-primary btn-sm ms-2" title="Pobierz">
+                            <i class="bi bi-download"></i>
+                        </a>
+                    </div>
+                </div>
+            `;
+        });
+
+        html += `
+                    </div>
+                </div>
+            </div>
+        `;
+    });
+
+    container.innerHTML = html;
+}
+
+function displayLogs(logs) {
+    const container = document.getElementById('logsList');
+
+    if (!logs || logs.length === 0) {
+        container.innerHTML = 
+            '<div class="text-center text-muted py-4"><i class="bi bi-journal-text fs-1"></i><p class="mt-2">Brak historii działań</p></div>';
+        return;
+    }
+
+    let html = '';
+    logs.reverse().forEach(log => {
+        const date = new Date(log.timestamp).toLocaleString('pl-PL');
+        const isError = log.action.includes('Błąd') || log.action.includes('Error');
+        const logClass = isError ? 'error' : 'success';
+
+        html += `
+            <div class="log-item ${logClass}">
+                <div class="d-flex justify-content-between align-items-start">
+                    <strong>${log.action}</strong>
+                    <small class="text-muted">${date}</small>
+                </div>
+                ${log.details ? `<div class="text-muted small mt-1">${log.details}</div>` : ''}
+            </div>
+        `;
+    });
+
+    container.innerHTML = html;
+}
+
+async function refreshStats() {
+    try {
+        const response = await fetch('/api/stats');
+        const stats = await response.json();
+
+        updateStats(stats);
+
+    } catch (error) {
+        console.error('Error loading stats:', error);
+    }
+}
+
+function updateStats(stats) {
+    if (!stats || stats.error) return;
+
+    const totalSizeMB = Math.round(stats.bytes / (1024 * 1024));
+    const lastDownload = stats.last_modified ?
+        new Date(stats.last_modified).toLocaleDateString('pl-PL') :
+        'Brak';
+    const coverage = stats.keywords.coverage;
+
+    document.getElementById('totalFiles').textContent = stats.files;
+    document.getElementById('totalSessions').textContent = stats.sessions;
+    document.getElementById('totalSize').textContent = totalSizeMB;
+    document.getElementById('lastDownload').textContent = lastDownload;
+    document.getElementById('keywordCoverage').textContent =
+        coverage === null ? '-' : `${Math.round(coverage * 100)}%`;
+
+    // Per-session totals, newest session first
+    const sessionNumber = name => parseInt(name.replace('Sesja', ''), 10) || 0;
+    const rows = Object.keys(stats.by_session)
+        .sort((a, b) => sessionNumber(b) - sessionNumber(a))
+        .map(sesja => {
+            const totals = stats.by_session[sesja];
+            return `<tr><td>${sesja}</td><td class="text-end">${totals.count}</td>` +
+                `<td class="text-end">${(totals.bytes / (1024 * 1024)).toFixed(1)}</td></tr>`;
+        });
+    document.getElementById('sessionStats').innerHTML = rows.join('') ||
+        '<tr><td colspan="3" class="text-center text-muted">Brak pobranych plików</td></tr>';
+
+    const extensions = Object.keys(stats.by_extension)
+        .sort((a, b) => stats.by_extension[b].count - stats.by_extension[a].count)
+        .map(ext => `<span class="badge bg-secondary me-1">${ext} ${stats.by_extension[ext].count}</span>`);
+    document.getElementById('extensionStats').innerHTML = extensions.join('');
+}
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
+async function searchContent() {
+    const query = document.getElementById('fileSearch').value.trim();
+    const container = document.getElementById('searchResults');
+    if (!query) {
+        container.innerHTML = '';
+        return;
+    }
+
+    try {
+        const response = await fetch(`/api/search?q=${encodeURIComponent(query)}`);
+        const data = await response.json();
+        if (data.error) {
+            showError(data.error);
+            return;
+        }
+
+        let html = `<div class="card"><div class="card-header d-flex justify-content-between">
+            <h6 class="mb-0"><i class="bi bi-search me-2"></i>Wyniki w treści: ${data.results.length}</h6>
+            <span><small class="text-muted me-2">${data.took_ms} ms</small>
+            ${data.results.length ? `<a href="/api/export/zip?q=${encodeURIComponent(query)}" class="btn btn-outline-secondary btn-sm"><i class="bi bi-file-earmark-zip"></i> ZIP</a>` : ''}</span>
+            </div><div class="list-group list-group-flush">`;
+        data.results.forEach(result => {
+            html += `
+                <a href="/download/${result.path}" class="list-group-item list-group-item-action">
+                    <div class="fw-bold text-truncate">${escapeHtml(result.filename)}</div>
+                    <small class="text-muted">${escapeHtml(result.sesja)} - ${escapeHtml(result.porzadek)}</small>
+                    <div class="small">${escapeHtml(result.snippet)}</div>
+                </a>
+            `;
+        });
+        html += '</div></div>';
+        container.innerHTML = html;
+    } catch (error) {
+        showError('Błąd wyszukiwania');
+    }
+}
+
+function filterFiles() {
+    const query = document.getElementById('fileSearch').value.toLowerCase();
+    const fileItems = document.querySelectorAll('.file-item');
+
+    fileItems.forEach(item => {
+        const filename = item.getAttribute('data-filename');
+        item.style.display = filename.includes(query) ? 'block' : 'none';
+    });
+}
+
+function showSuccess(message) {
+    showToast(message, 'success');
+}
+
+function showError(message) {
+    showToast(message, 'danger');
+}
+
+function showToast(message, type) {
+    // Simple toast implementation
+    const toast = document.createElement('div');
+    toast.className = `alert alert-${type} alert-dismissible position-fixed`;
+    toast.style.cssText = 'top: 20px; right: 20px; z-index: 9999; min-width: 300px;';
+    toast.innerHTML = `
+        ${message}
+        <button type="button" class="btn-close" data-bs-dismiss="alert"></button>
+    `;
+
+    document.body.appendChild(toast);
+
+    setTimeout(() => {
+        if (toast.parentNode) {
+            toast.parentNode.removeChild(toast);
+        }
+    }, 5000);
+}
+
+// Album/Folder Management Functions
+async function loadFolderSettings() {
+    try {
+        const response = await fetch('/api/settings/folder');
+        const data = await response.json();
+
+        if (data.error) return;
+
+        // Update album selector
+        const selector = document.getElementById('albumSelector');
+        selector.innerHTML = '';
+
+        // Get current album name from path
+        const currentDir = data.current_download_dir;
+        const currentAlbum = currentDir.split('\\').pop() || currentDir.split('/').pop();
+
+        data.available_albums.forEach(album => {
+            const option = document.createElement('option');
+            option.value = album;
+            option.textContent = album;
+            if (album === currentAlbum) {
+                option.selected = true;
+            }
+            selector.appendChild(option);
+        });
+
+    } catch (error) {
+        console.error('Error loading folder settings:', error);
+    }
+}
+
+async function changeAlbum(albumName) {
+    try {
+        const response = await fetch('/api/settings/folder', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ album_name: albumName })
+        });
+
+        const data = await response.json();
+
+        if (data.error) {
+            showError('Błąd zmiany albumu: ' + data.error);
+            return;
+        }
+
+        showSuccess(`Album zmieniony na: ${albumName}`);
+
+        // Refresh file list and status
+        setTimeout(() => {
+            refreshFiles();
+            refreshStatus();
+        }, 1000);
+
+    } catch (error) {
+        showError('Błąd podczas zmiany albumu');
+    }
+}
+
+async function promptChangeFolderPath() {
+    const current = document.getElementById('currentDownloadDir').textContent || '';
+    // First try native dialog (local only). If not available, fallback to prompt.
+    try {
+        const pickResp = await fetch('/api/settings/folder/pick', { method: 'POST' });
+        const pickData = await pickResp.json();
+        if (pickData && pickData.new_download_dir) {
+            showSuccess('Folder zapisów zmieniony');
+            document.getElementById('currentDownloadDir').textContent = pickData.new_download_dir;
+            setTimeout(() => { refreshFiles(); refreshStatus(); }, 1000);
+            return;
+        }
+        if (pickData && pickData.cancelled) {
+            return; // user cancelled
+        }
+        // If error from picker, fall through to prompt
+    } catch (e) {
+        // Ignore and fallback
+    }
+
+    const newPath = prompt('Podaj pełną ścieżkę folderu zapisu (zostanie utworzony, jeśli nie istnieje):', current);
+    if (!newPath || !newPath.trim()) return;
+    try {
+        const response = await fetch('/api/settings/folder/set_path', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ path: newPath.trim() })
+        });
+        const data = await response.json();
+        if (data.error) {
+            showError('Błąd zmiany folderu: ' + data.error);
+            return;
+        }
+        showSuccess('Folder zapisów zmieniony');
+        document.getElementById('currentDownloadDir').textContent = data.new_download_dir;
+        setTimeout(() => { refreshFiles(); refreshStatus(); }, 1000);
+    } catch (error) {
+        showError('Błąd podczas zmiany folderu');
+    }
+}
+
+async function addNewAlbum() {
+    const albumName = prompt('Podaj nazwę nowego albumu:');
+    if (!albumName || !albumName.trim()) return;
+
+    try {
+        const response = await fetch('/api/settings/folder/add', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ album_name: albumName.trim() })
+        });
+
+        const data = await response.json();
+
+        if (data.error) {
+            showError('Błąd dodawania albumu: ' + data.error);
+            return;
+        }
+
+        showSuccess(`Album "${albumName}" został dodany`);
+
+        // Reload folder settings to update selector
+        await loadFolderSettings();
+
+        // Optionally switch to new album
+        if (confirm(`Czy chcesz przełączyć się na nowy album "${albumName}"?`)) {
+            document.getElementById('albumSelector').value = albumName;
+            changeAlbum(albumName);
+        }
+
+    } catch (error) {
+        showError('Błąd podczas dodawania albumu');
+    }
+}
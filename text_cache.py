@@ -0,0 +1,158 @@
+"""
+Extracted-text cache
+The text PyPDF2/python-docx extract from an attachment is stored per content
+hash in <download dir>/.text_cache.db: the 35-word preview used for naming
+and, once something needed it, the full text (zlib-compressed) with the
+offsets where each page starts. Naming a file again (other prompt, model or
+word count), re-indexing and rebuilding the search index read it from here
+instead of parsing the document again; byte-identical druki in several
+agendas share one entry.
+Bump EXTRACTOR_VERSION when extraction changes, so old entries are redone.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from blob_store import CHUNK_SIZE, file_sha256
+from cold_storage import is_cold, logical_name
+
+CACHE_FILENAME = ".text_cache.db"
+EXTRACTOR_VERSION = 1
+TEXT_EXTENSIONS = (".pdf", ".docx")  # the formats rada_scraper extracts text from
+PREVIEW_WORDS = 35
+
+
+def has_text(path):
+    return os.path.splitext(logical_name(path))[1].lower() in TEXT_EXTENSIONS
+
+
+def content_sha256(path):
+    """SHA-256 of the original content (compressed cold files are hashed decompressed)."""
+    if not is_cold(path):
+        return file_sha256(path)
+    digest = hashlib.sha256()
+    with gzip.open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def page_offsets(pages):
+    """Start of every page in "\n".join(pages)."""
+    offsets, position = [], 0
+    for page in pages:
+        offsets.append(position)
+        position += len(page) + 1
+    return offsets
+
+
+class TextCache:
+    """Preview and full text per content hash (thread-safe, one connection per thread)."""
+
+    def __init__(self, base_dir):
+        self.base_dir = os.path.abspath(base_dir)
+        self.db_path = os.path.join(self.base_dir, CACHE_FILENAME)
+        self.local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.base_dir, exist_ok=True)
+        self._connection().executescript("""
+            CREATE TABLE IF NOT EXISTS texts (
+                sha256 TEXT PRIMARY KEY,
+                extractor INTEGER NOT NULL,
+                preview TEXT NOT NULL,
+                body BLOB,
+                pages TEXT,
+                created REAL
+            );
+        """)
+
+    def _connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def get(self, sha256):
+        """{"preview", "text" (None if only the preview is stored), "pages"} or None."""
+        row = self._connection().execute(
+            "SELECT preview, body, pages FROM texts WHERE sha256 = ? AND extractor = ?",
+            (sha256, EXTRACTOR_VERSION)).fetchone()
+        if not row:
+            return None
+        return {
+            "preview": row[0],
+            "text": zlib.decompress(row[1]).decode("utf-8") if row[1] is not None else None,
+            "pages": json.loads(row[2]) if row[2] else None
+        }
+
+    def put_pages(self, sha256, pages):
+        """Store the full text of a document from its pages; returns the text."""
+        text = "\n".join(pages)
+        self._connection().execute(
+            "INSERT OR REPLACE INTO texts (sha256, extractor, preview, body, pages, created) VALUES (?, ?, ?, ?, ?, ?)",
+            (sha256, EXTRACTOR_VERSION, " ".join(text.split()[:PREVIEW_WORDS]),
+             zlib.compress(text.encode("utf-8"), 6), json.dumps(page_offsets(pages)), time.time()))
+        return text
+
+    def put_preview(self, sha256, preview):
+        self._connection().execute(
+            "INSERT OR IGNORE INTO texts (sha256, extractor, preview, created) VALUES (?, ?, ?, ?)",
+            (sha256, EXTRACTOR_VERSION, preview, time.time()))
+
+    def full_text(self, path, sha256=None):
+        """Full text of a PDF/DOCX file ("" for other formats), extracted once per content."""
+        if not has_text(path):
+            return ""
+        sha256 = sha256 or content_sha256(path)
+        cached = self.get(sha256)
+        if cached and cached["text"] is not None:
+            self.hits += 1
+            return cached["text"]
+        self.misses += 1
+        from rada_scraper import extract_pages
+        return self.put_pages(sha256, extract_pages(path))
+
+    def preview(self, path, sha256=None):
+        """First 35 words of a PDF/DOCX file, without parsing the whole document."""
+        if not has_text(path):
+            return ""
+        sha256 = sha256 or content_sha256(path)
+        cached = self.get(sha256)
+        if cached:
+            self.hits += 1
+            return cached["preview"]
+        self.misses += 1
+        from rada_scraper import get_file_content_preview
+        preview = get_file_content_preview(path)
+        if preview:
+            self.put_preview(sha256, preview)
+        return preview
+
+    def status(self):
+        row = self._connection().execute(
+            "SELECT COUNT(*), COUNT(body), COALESCE(SUM(LENGTH(body)), 0) FROM texts").fetchone()
+        return {"documents": row[0], "full_texts": row[1], "stored_bytes": row[2],
+                "hits": self.hits, "misses": self.misses}
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_text_cache(base_dir):
+    """Shared TextCache per archive folder."""
+    key = os.path.abspath(base_dir)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = TextCache(key)
+        return _caches[key]
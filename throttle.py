@@ -0,0 +1,287 @@
+"""
+Adaptive politeness throttling
+Each host gets an AIMD concurrency limit: it grows by about one request per
+round of fast successful responses and is halved on 429/503, timeouts,
+connection errors or latency rising well above the host's baseline. A
+Retry-After header pauses the host. Optionally the robots.txt Crawl-delay is
+honoured, and a global token bucket caps download bandwidth.
+Everything runs on the async_scraper event loop; state listeners run in its
+thread pool.
+"""
+
+import asyncio
+import contextvars
+import os
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+INITIAL_LIMIT = float(os.getenv("SCRAPER_HOST_LIMIT", "4"))
+MAX_LIMIT = float(os.getenv("SCRAPER_MAX_HOST_LIMIT", "16"))
+MIN_LIMIT = 1.0
+DECREASE_FACTOR = 0.5
+LATENCY_FACTOR = 2.0        # "rising latency": EWMA above 2x the baseline...
+LATENCY_MARGIN = 0.05       # ...and at least 50 ms above it
+RESPECT_ROBOTS = os.getenv("RESPECT_ROBOTS", "").lower() in ("1", "true", "yes")
+BANDWIDTH_LIMIT = int(os.getenv("BANDWIDTH_LIMIT", "0"))  # bytes/s for downloads, 0 = no cap
+PUBLISH_INTERVAL = 1.0      # seconds between state notifications
+
+BACKOFF_STATUSES = (429, 503)
+RETRIES = 3                 # attempts per GET when the server signals overload
+
+_hosts = {}
+_listeners = []
+_last_publish = 0.0
+_published_idle = False
+_pending_state = None
+_publisher = None
+
+
+def parse_crawl_delay(robots_txt, user_agent="*"):
+    """Crawl-delay (seconds) for user_agent from robots.txt, or 0."""
+    delay, applies = 0.0, False
+    for line in robots_txt.splitlines():
+        key, _, value = line.split("#", 1)[0].partition(":")
+        key, value = key.strip().lower(), value.strip()
+        if key == "user-agent":
+            applies = value == "*" or value.lower() == user_agent.lower()
+        elif key == "crawl-delay" and applies:
+            try:
+                delay = max(delay, float(value))
+            except ValueError:
+                pass
+    return delay
+
+
+def is_backoff_error(exc):
+    """Timeouts and connection problems count as overload signals."""
+    import aiohttp
+    return isinstance(exc, (asyncio.TimeoutError, aiohttp.ClientConnectionError))
+
+
+def should_retry(exc):
+    """429/503 answers and overload errors are worth another attempt."""
+    import aiohttp
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return exc.status in BACKOFF_STATUSES
+    return is_backoff_error(exc)
+
+
+class HostThrottle:
+    """AIMD concurrency limit, pacing and latency tracking of one host."""
+
+    def __init__(self, host):
+        self.host = host
+        self.limit = INITIAL_LIMIT
+        self.in_flight = 0
+        self.latency = None       # EWMA of time to response headers
+        self.baseline = None      # slowly drifting minimum of the EWMA
+        self.crawl_delay = 0.0
+        self.robots_checked = False
+        self.next_start = 0.0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.requests = 0
+        self.decreases = 0
+        self.last_signal = None
+        self._changed = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._changed:
+            while self.in_flight >= int(self.limit):
+                await self._changed.wait()
+            self.in_flight += 1
+        now = time.monotonic()
+        start = max(now, self.next_start, self.paused_until)
+        self.next_start = start + self.crawl_delay
+        if start > now:
+            try:
+                await asyncio.sleep(start - now)
+            except BaseException:
+                await self.release()
+                raise
+
+    async def release(self):
+        async with self._changed:
+            self.in_flight -= 1
+            self._changed.notify_all()
+
+    def record(self, latency=None, status=None, error=None, retry_after=None):
+        """Feed back the outcome of one request and adjust the limit."""
+        self.requests += 1
+        now = time.monotonic()
+        if latency is not None:
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            if self.baseline is None or self.latency < self.baseline:
+                self.baseline = self.latency
+            else:
+                self.baseline += (self.latency - self.baseline) * 0.01
+
+        if status in BACKOFF_STATUSES:
+            signal = f"HTTP {status}"
+        elif error is not None:
+            signal = type(error).__name__
+        elif (self.latency is not None and self.latency > self.baseline * LATENCY_FACTOR
+                and self.latency > self.baseline + LATENCY_MARGIN):
+            signal = "latency"
+        else:
+            signal = None
+
+        if retry_after:
+            self.paused_until = max(self.paused_until, now + retry_after)
+        if signal:
+            self.last_signal = signal
+            # One cut per round trip, so a burst of errors does not collapse the limit
+            if now - self.last_decrease >= max(self.latency or 0.0, 0.5):
+                self.limit = max(MIN_LIMIT, self.limit * DECREASE_FACTOR)
+                self.last_decrease = now
+                self.decreases += 1
+        elif status is not None and status < 400 and self.in_flight >= int(self.limit):
+            # Grow only while the limit is actually used
+            self.limit = min(MAX_LIMIT, self.limit + 1.0 / self.limit)
+
+    def status(self):
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "baseline_ms": round(self.baseline * 1000, 1) if self.baseline is not None else None,
+            "crawl_delay": self.crawl_delay,
+            "paused_for": max(0.0, round(self.paused_until - time.monotonic(), 1)),
+            "requests": self.requests,
+            "decreases": self.decreases,
+            "last_signal": self.last_signal
+        }
+
+
+class TokenBucket:
+    """Global bytes/second cap with a one-second burst."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.bytes = 0
+        self.waited = 0.0
+
+    async def consume(self, amount):
+        self.bytes += amount
+        if not self.rate:
+            return
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= amount
+        if self.tokens < 0:
+            delay = -self.tokens / self.rate
+            self.waited += delay
+            await asyncio.sleep(delay)
+
+    def status(self):
+        return {"limit_bytes_per_sec": self.rate, "bytes": self.bytes, "waited_seconds": round(self.waited, 2)}
+
+
+bandwidth = TokenBucket(BANDWIDTH_LIMIT)
+
+
+def get_host(url):
+    host = urlsplit(url).netloc
+    if host not in _hosts:
+        _hosts[host] = HostThrottle(host)
+    return _hosts[host]
+
+
+async def _check_robots(throttle, url, session):
+    throttle.robots_checked = True
+    parts = urlsplit(url)
+    try:
+        async with session.get(f"{parts.scheme}://{parts.netloc}/robots.txt") as resp:
+            if resp.status == 200:
+                throttle.crawl_delay = parse_crawl_delay(await resp.text())
+    except Exception as e:
+        print(f"Nie udało się pobrać robots.txt z {parts.netloc}: {e}")
+
+
+class Slot:
+    """Handle of one throttled request; call response(resp) once headers arrive."""
+
+    def __init__(self, started):
+        self.started = started
+        self.latency = None
+        self.status = None
+        self.retry_after = None
+
+    def response(self, resp):
+        self.latency = time.monotonic() - self.started
+        self.status = resp.status
+        if resp.status in BACKOFF_STATUSES:
+            try:
+                self.retry_after = float(resp.headers.get("Retry-After", ""))
+            except ValueError:
+                self.retry_after = None
+
+
+@asynccontextmanager
+async def request_slot(url, session, robots=True):
+    """Wait for the host's concurrency/pacing, then time the request."""
+    throttle = get_host(url)
+    if robots and RESPECT_ROBOTS and not throttle.robots_checked:
+        await _check_robots(throttle, url, session)
+    await throttle.acquire()
+    slot = Slot(time.monotonic())
+    try:
+        yield slot
+    except Exception as e:
+        throttle.record(slot.latency, slot.status, e if is_backoff_error(e) else None, slot.retry_after)
+        raise
+    else:
+        throttle.record(slot.latency, slot.status, None, slot.retry_after)
+    finally:
+        await throttle.release()
+        _publish()
+
+
+def status():
+    """Current throttle state of all hosts (safe to call from any thread)."""
+    return {
+        "hosts": {host: throttle.status() for host, throttle in list(_hosts.items())},
+        "bandwidth": bandwidth.status(),
+        "respect_robots": RESPECT_ROBOTS
+    }
+
+
+def register_state_listener(listener):
+    """listener(state) gets status() at most once per PUBLISH_INTERVAL, in
+    the engine's thread pool (listeners may write SQLite)."""
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def _publish():
+    global _last_publish, _published_idle, _pending_state, _publisher
+    now = time.monotonic()
+    idle = all(throttle.in_flight == 0 for throttle in _hosts.values())
+    # Throttled while busy; the final idle state is always sent
+    if not _listeners or (now - _last_publish < PUBLISH_INTERVAL and not (idle and not _published_idle)):
+        return
+    _last_publish, _published_idle = now, idle
+    _pending_state = status()
+    if _publisher is None or _publisher.done():
+        # One publisher at a time, so an older state never overwrites a newer one
+        _publisher = contextvars.Context().run(asyncio.get_running_loop().create_task, _send_pending())
+
+
+async def _send_pending():
+    from async_scraper import _run_blocking
+    global _pending_state
+    while _pending_state is not None:
+        state, _pending_state = _pending_state, None
+        await _run_blocking(_send, state)
+
+
+def _send(state):
+    for listener in _listeners:
+        try:
+            listener(state)
+        except Exception as e:
+            print(f"Error publishing throttle state: {e}")
@@ -0,0 +1,196 @@
+"""
+Stage-level tracing for download jobs
+Spans (fetch page, parse links, download, extract, AI, rename) are recorded
+only while a trace is active and saved as Chrome trace JSON
+(open in chrome://tracing or https://ui.perfetto.dev).
+The active trace is a context variable: async_scraper.run_sync and its
+worker threads carry it along, so a job only records its own spans even on
+the shared scraper loop.
+A job's work runs on the scraper-loop and scraper-io threads, not in the job
+thread, so profiling samples the stacks of all of them (cProfile only sees
+the thread that enables it); whatever else runs on those threads at the
+same time is sampled too. The .prof file has the pstats format (snakeviz,
+python -m pstats); call counts there are sample counts.
+"""
+
+import contextvars
+import json
+import marshal
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+TRACE_DIR = os.getenv("TRACE_DIR", "traces")
+SAMPLE_INTERVAL = 0.005                       # seconds between stack samples
+PROFILED_THREADS = ("scraper-loop", "scraper-io")  # plus the job thread itself
+# Frames where a thread only waits for work (event loop select, idle pool thread, Future.result)
+IDLE_FRAMES = {("selectors.py", "select"), ("thread.py", "_worker"), ("threading.py", "wait")}
+
+_current = contextvars.ContextVar("trace", default=None)
+
+
+class JobTrace:
+    """Collects timing spans of one job."""
+
+    def __init__(self, job_name):
+        self.job_name = job_name
+        self.started = time.perf_counter()
+        self.events = []
+        self.lock = threading.Lock()
+
+    def add(self, name, start, end, args=None):
+        event = {
+            "name": name,
+            "cat": "job",
+            "ph": "X",
+            "ts": round((start - self.started) * 1_000_000, 1),
+            "dur": round((end - start) * 1_000_000, 1),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args or {}
+        }
+        with self.lock:
+            self.events.append(event)
+
+    def summary(self):
+        """Total seconds per stage name."""
+        totals = {}
+        with self.lock:
+            for event in self.events:
+                totals[event["name"]] = totals.get(event["name"], 0.0) + event["dur"] / 1_000_000
+        return {name: round(seconds, 3) for name, seconds in totals.items()}
+
+    def save(self, path):
+        summary = self.summary()
+        with self.lock:
+            data = {
+                "traceEvents": list(self.events),
+                "displayTimeUnit": "ms",
+                "otherData": {"job": self.job_name, "summary": summary}
+            }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+
+def start_trace(job_name):
+    """Make a new trace the active one in this context and return it."""
+    trace = JobTrace(job_name)
+    _current.set(trace)
+    return trace
+
+
+def stop_trace():
+    """Deactivate and return the current trace (or None)."""
+    trace = _current.get()
+    _current.set(None)
+    return trace
+
+
+class SamplingProfiler:
+    """Samples the stacks of the job thread and the scraper engine threads."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL, thread_prefixes=PROFILED_THREADS):
+        self.interval = interval
+        self.thread_prefixes = thread_prefixes
+        self.samples = Counter()  # stack (root first) -> number of samples
+        self._job_thread = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def enable(self):
+        self._job_thread = threading.get_ident()
+        self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _profiled(self, ident, names):
+        return ident == self._job_thread or names.get(ident, "").startswith(self.thread_prefixes)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if not self._profiled(ident, names):
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                self.samples[tuple(reversed(stack))] += 1
+
+    def stats(self):
+        """{func: (cc, nc, tt, ct, callers)} as in pstats, from the samples."""
+        stats = {}
+        for stack, count in self.samples.items():
+            seconds = count * self.interval
+            seen = set()
+            for depth, func in enumerate(stack):
+                cc, nc, tt, ct, callers = stats.get(func, (0, 0, 0.0, 0.0, {}))
+                if depth == len(stack) - 1:
+                    tt += seconds
+                if func not in seen:  # recursion counts once per sample
+                    seen.add(func)
+                    cc, nc, ct = cc + count, nc + count, ct + seconds
+                    if depth:
+                        caller = stack[depth - 1]
+                        e_nc, e_cc, e_tt, e_ct = callers.get(caller, (0, 0, 0.0, 0.0))
+                        callers[caller] = (e_nc + count, e_cc + count,
+                                           e_tt + (seconds if depth == len(stack) - 1 else 0.0), e_ct + seconds)
+                stats[func] = (cc, nc, tt, ct, callers)
+        return stats
+
+    def dump_stats(self, path):
+        with open(path, "wb") as f:
+            marshal.dump(self.stats(), f)
+
+
+@contextmanager
+def span(name, **args):
+    """Time a block as a stage of the active trace; no-op when not tracing."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.perf_counter(), args)
+
+
+def run_traced(job_name, target, trace=False, profile=False):
+    """Run target() optionally under a trace and the sampling profiler.
+    Returns the list of written files (trace JSON and .prof next to it)."""
+    if not (trace or profile):
+        target()
+        return []
+
+    base_path = os.path.join(TRACE_DIR, f"{job_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    job_trace = start_trace(job_name)
+    profiler = SamplingProfiler() if profile else None
+    written = []
+    try:
+        if profiler:
+            profiler.enable()
+        target()
+    finally:
+        if profiler:
+            profiler.disable()
+        stop_trace()
+        job_trace.save(base_path + ".trace.json")
+        written.append(base_path + ".trace.json")
+        if profiler:
+            profiler.dump_stats(base_path + ".prof")
+            written.append(base_path + ".prof")
+    return written
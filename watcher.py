@@ -0,0 +1,240 @@
+"""
+Background watcher for new sessions and agendas
+Periodically revalidates the year index and the most recent session pages
+with conditional requests and a content hash, and reports only what changed
+(a new session or a new "porządek obrad nr N"). When nothing changes a check
+costs one or a few 304 responses; between checks the thread just sleeps.
+With several app workers the interval, check requests and the status are
+shared through callbacks: the thread re-reads the interval before every
+check (and while sleeping) and stops when it becomes 0. The state file,
+including sessions not handed off yet, is re-read before every check, so the
+worker that takes over the lease continues where the previous one stopped.
+"""
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+import rada_scraper
+
+WATCHER_STATE_FILE = "watcher_state.json"
+OPEN_SESSIONS = 2          # how many of the newest sessions count as "open"
+MAX_BACKOFF = 3600         # seconds
+JITTER = 0.2               # +/- fraction of the interval
+SETTINGS_POLL = 5          # seconds between looks at the shared settings while sleeping
+
+
+def links_hash(items):
+    """Content hash of a parsed link list (stable against cosmetic page changes)."""
+    return hashlib.sha256(json.dumps(sorted(items)).encode("utf-8")).hexdigest()
+
+
+class Watcher:
+    """Detects new sessions/agendas and hands them to on_changes([(sesja_url, sesja_number)]).
+    on_changes returns False when it could not start the download (e.g. a job
+    is already running); the items are then retried on the next check.
+    should_run() is asked before each check; with several app workers only the
+    one holding the watcher lease checks, the others stay on standby.
+    Optional shared state: get_interval() -> seconds (0 stops the thread),
+    checks_requested() -> a number that grows with every "check now" request,
+    on_status(status) after each check of the active worker and on_stop()
+    when the thread ends (e.g. to release the lease)."""
+
+    def __init__(self, on_changes, interval=900, state_file=WATCHER_STATE_FILE, should_run=None,
+                 get_interval=None, checks_requested=None, on_status=None, on_stop=None):
+        self.on_changes = on_changes
+        self.should_run = should_run
+        self.get_interval = get_interval
+        self.checks_requested = checks_requested
+        self.on_status = on_status
+        self.on_stop = on_stop
+        self._seen_check = 0
+        self.standby = False
+        self.interval = interval
+        self.state_file = state_file
+        self.state = self._load_state()
+        self.pending = self._pending_from_state()
+        self.failures = 0
+        self.last_check = None
+        self.last_error = None
+        self.next_check = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _load_state(self):
+        try:
+            if os.path.exists(self.state_file):
+                with open(self.state_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception as e:
+            print(f"Error loading watcher state: {e}")
+        return {"index": {}, "sessions": {}, "pending": {}}
+
+    def _pending_from_state(self):
+        return {int(number): url for number, url in self.state.get("pending", {}).items()}
+
+    def _save_state(self):
+        self.state["pending"] = {str(number): url for number, url in self.pending.items()}
+        try:
+            # Through a temp file: a worker taking over the lease may read it at any time
+            with open(self.state_file + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump(self.state, f, ensure_ascii=False, indent=2)
+            os.replace(self.state_file + ".tmp", self.state_file)
+        except Exception as e:
+            print(f"Error saving watcher state: {e}")
+
+    def _revalidate(self, url, entry):
+        """Conditional GET; returns new html or None when unchanged (304)."""
+        html, etag, last_modified = rada_scraper.fetch_page_if_changed(
+            url, entry.get("etag"), entry.get("last_modified"))
+        entry["etag"], entry["last_modified"] = etag, last_modified
+        return html
+
+    def check_once(self):
+        """Run one revalidation pass. Returns the list of queued (sesja_url, sesja_number)."""
+        with self._lock:
+            # Another worker may have held the lease since our last check
+            self.state = self._load_state()
+            self.pending = self._pending_from_state()
+            first_run = not self.state["index"]
+            changed = False
+            index = self.state["index"]
+
+            html = self._revalidate(rada_scraper.DEF_URL, index)
+            if html is not None:
+                sessions = rada_scraper.parse_sesja_links(html, rada_scraper.DEF_URL)
+                digest = links_hash(sessions)
+                if digest != index.get("hash"):
+                    known = set(index.get("sessions", {}).values())
+                    for sesja_url, sesja_number in sessions:
+                        if not first_run and sesja_number not in known:
+                            print(f"Watcher: nowa sesja {sesja_number}")
+                            self.pending[sesja_number] = sesja_url
+                    index["hash"] = digest
+                    index["sessions"] = {url: number for url, number in sessions}
+                changed = True
+
+            # Revalidate the newest (still open) sessions for new agenda versions
+            newest = sorted(index.get("sessions", {}).items(), key=lambda x: x[1], reverse=True)[:OPEN_SESSIONS]
+            for sesja_url, sesja_number in newest:
+                entry = self.state["sessions"].setdefault(str(sesja_number), {})
+                html = self._revalidate(sesja_url, entry)
+                if html is None:
+                    continue
+                porzadki = rada_scraper.parse_porzadek_links(html, sesja_url)
+                digest = links_hash(porzadki)
+                if digest != entry.get("hash"):
+                    latest = max(number for _, number in porzadki)
+                    if "latest_porzadek" in entry and latest > entry["latest_porzadek"]:
+                        print(f"Watcher: Sesja {sesja_number} ma nowy porządek obrad nr {latest}")
+                        self.pending[sesja_number] = sesja_url
+                    entry["hash"] = digest
+                    entry["latest_porzadek"] = latest
+                changed = True
+
+            queued = sorted(((url, number) for number, url in self.pending.items()), key=lambda x: x[1])
+            if queued and self.on_changes(queued) is not False:
+                self.pending.clear()
+                changed = True
+            if changed:
+                self._save_state()
+            return queued
+
+    def _delay(self):
+        """Next sleep: jittered interval, doubled per consecutive failure."""
+        base = self.interval
+        if self.failures:
+            base = min(self.interval * 2 ** min(self.failures, 10), max(self.interval, MAX_BACKOFF))
+        return base * random.uniform(1 - JITTER, 1 + JITTER)
+
+    def _settings_changed(self):
+        """The shared interval changed or someone asked for a check now."""
+        if self.get_interval and self.get_interval() != self.interval:
+            return True
+        return bool(self.checks_requested and self.checks_requested() > self._seen_check)
+
+    def _sleep(self, delay):
+        deadline = time.monotonic() + delay
+        while not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if self._wake.wait(min(remaining, SETTINGS_POLL)):
+                self._wake.clear()
+                return
+            if self._settings_changed():
+                return
+
+    def _publish(self):
+        if self.on_status:
+            try:
+                self.on_status(self.status())
+            except Exception as e:
+                print(f"Error publishing watcher status: {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.get_interval:
+                self.interval = self.get_interval()
+                if self.interval <= 0:
+                    break
+            if self.checks_requested:
+                self._seen_check = self.checks_requested()
+            try:
+                self.standby = bool(self.should_run and not self.should_run())
+                if not self.standby:
+                    self.check_once()
+                self.failures = 0
+                self.last_error = None
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                print(f"Watcher error: {e}")
+            self.last_check = datetime.now().isoformat()
+            delay = self._delay()
+            self.next_check = datetime.fromtimestamp(time.time() + delay).isoformat()
+            if not self.standby:
+                self._publish()
+            self._sleep(delay)
+        self._stop.set()
+        was_active, self.standby = not self.standby, False
+        self.next_check = None
+        if self.on_stop:
+            self.on_stop()
+        if was_active:
+            self._publish()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            if not self._stop.is_set():
+                return
+            self._thread.join()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def trigger(self):
+        """Check now instead of waiting for the next interval."""
+        self._wake.set()
+
+    def status(self):
+        return {
+            "running": bool(self._thread and self._thread.is_alive() and not self._stop.is_set()),
+            "interval": self.interval,
+            "standby": self.standby,
+            "last_check": self.last_check,
+            "next_check": self.next_check,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "pending_sessions": sorted(self.pending)
+        }
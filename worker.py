@@ -0,0 +1,509 @@
+"""
+Distributed backfill workers
+Several processes - on one host or on several hosts that mount the same
+archive folder - download the archive together from a shared work queue in
+<download dir>/.work_queue.db. `enqueue` adds one item per session; a worker
+that takes a session item resolves its latest agenda and adds one item per
+druk (all attachments of a druk stay in one item, in page order). In
+all-versions mode a session item downloads the whole session itself.
+Taking an item is a lease, as in job_store.py: the worker keeps it alive with
+heartbeats, and when a worker dies its items expire after LEASE_TTL and
+another worker takes them over (an item that expires MAX_ATTEMPTS times is
+marked failed). Downloads may be repeated after a crash, but every attachment
+gets its final name exactly once: before the rename the worker claims the
+target in the queue, which only succeeds while it still holds the item's
+lease, and the claim is marked done after the rename.
+The queue uses WAL by default, which needs all workers on one host; on a
+network filesystem set WORK_QUEUE_JOURNAL=DELETE (plain file locks).
+
+Usage:
+    python worker.py enqueue --dir ./data [--sessions 12,13]
+    python worker.py run --dir ./data [--forever]
+    python worker.py status --dir ./data
+    python worker.py selftest --workers 3 --sessions 4 --druki 8
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from job_store import _Transaction, new_owner_id
+
+QUEUE_FILENAME = ".work_queue.db"
+LEASE_TTL = float(os.getenv("WORKER_LEASE_TTL", "60"))  # seconds
+JOURNAL_MODE = os.getenv("WORK_QUEUE_JOURNAL", "WAL").upper()
+MAX_ATTEMPTS = 3
+POLL_INTERVAL = 1.0
+PRIORITY = {"druk": 1, "session": 0}  # finish started sessions before opening new ones
+
+
+class WorkQueue:
+    """Work items and rename claims in a shared SQLite database."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.local = threading.local()
+        self._connection().executescript("""
+            CREATE TABLE IF NOT EXISTS items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT UNIQUE NOT NULL,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                state TEXT NOT NULL DEFAULT 'pending',
+                owner TEXT,
+                expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                result TEXT,
+                updated REAL
+            );
+            CREATE INDEX IF NOT EXISTS items_state ON items (state, priority, id);
+            CREATE TABLE IF NOT EXISTS renames (
+                target TEXT PRIMARY KEY,
+                item_id INTEGER NOT NULL,
+                owner TEXT NOT NULL,
+                state TEXT NOT NULL,
+                updated REAL
+            );
+        """)
+
+    def _connection(self):
+        """This thread's connection (sqlite3 connections are not thread-safe)."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute(f"PRAGMA journal_mode={JOURNAL_MODE}")
+            conn.execute("PRAGMA synchronous=NORMAL" if JOURNAL_MODE == "WAL" else "PRAGMA synchronous=FULL")
+            self.local.conn = conn
+        return conn
+
+    def _connect(self, write=True):
+        return _Transaction(self._connection(), "BEGIN IMMEDIATE" if write else "BEGIN")
+
+    def add(self, kind, key, payload, again=False):
+        """Add an item; an existing one is left alone unless `again` is set
+        (True or a timestamp), which makes an item that finished (done or
+        failed) before it pending again, with the new payload. Returns True if
+        the item will run."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO items (key, kind, payload, priority, updated) VALUES (?, ?, ?, ?, ?)",
+                (key, kind, json.dumps(payload, ensure_ascii=False), PRIORITY[kind], time.time()))
+            if cursor.rowcount == 0 and again:
+                now = time.time()
+                cursor = conn.execute("""
+                    UPDATE items SET state = 'pending', attempts = 0, owner = NULL, error = NULL, payload = ?,
+                                     updated = ?
+                    WHERE key = ? AND state IN ('done', 'failed') AND updated < ?
+                """, (json.dumps(payload, ensure_ascii=False), now, key, now if again is True else again))
+                if cursor.rowcount == 1:
+                    # A new run may rename its files again
+                    conn.execute("DELETE FROM renames WHERE item_id = (SELECT id FROM items WHERE key = ?)", (key,))
+            return cursor.rowcount == 1
+
+    def claim(self, owner, ttl=LEASE_TTL):
+        """Lease the next pending item (or one whose lease expired).
+        Returns {"id", "kind", "key", "payload", "attempts"} or None."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("""
+                UPDATE items SET state = 'failed', error = 'dzierżawa wygasła zbyt wiele razy', updated = ?
+                WHERE state = 'leased' AND expires < ? AND attempts >= ?
+            """, (now, now, MAX_ATTEMPTS))
+            row = conn.execute("""
+                SELECT id, kind, key, payload, attempts FROM items
+                WHERE state = 'pending' OR (state = 'leased' AND expires < ?)
+                ORDER BY priority DESC, id LIMIT 1
+            """, (now,)).fetchone()
+            if not row:
+                return None
+            conn.execute("UPDATE items SET state = 'leased', owner = ?, expires = ?, attempts = attempts + 1, "
+                         "updated = ? WHERE id = ?", (owner, now + ttl, now, row[0]))
+        return {"id": row[0], "kind": row[1], "key": row[2], "payload": json.loads(row[3]), "attempts": row[4] + 1}
+
+    def renew(self, item_id, owner, ttl=LEASE_TTL):
+        with self._connect() as conn:
+            cursor = conn.execute("UPDATE items SET expires = ? WHERE id = ? AND owner = ? AND state = 'leased'",
+                                  (time.time() + ttl, item_id, owner))
+            return cursor.rowcount == 1
+
+    def complete(self, item_id, owner, result=None):
+        """Mark our item done. False when the lease was lost (the item runs elsewhere)."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE items SET state = 'done', result = ?, error = NULL, updated = ? "
+                "WHERE id = ? AND owner = ? AND state = 'leased'",
+                (json.dumps(result, ensure_ascii=False), time.time(), item_id, owner))
+            return cursor.rowcount == 1
+
+    def fail(self, item_id, owner, error):
+        """Give an item back after an error; it is retried until MAX_ATTEMPTS."""
+        with self._connect() as conn:
+            conn.execute("""
+                UPDATE items SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                                 error = ?, owner = NULL, updated = ?
+                WHERE id = ? AND owner = ? AND state = 'leased'
+            """, (MAX_ATTEMPTS, str(error), time.time(), item_id, owner))
+
+    def claim_rename(self, target, item_id, owner, ttl=LEASE_TTL):
+        """Permission to give target its final name: only while we hold the
+        item's lease (which is extended for the rename) and nobody renamed it
+        yet. A claim left by a dead owner is taken over."""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute("UPDATE items SET expires = ? WHERE id = ? AND owner = ? AND state = 'leased' "
+                                  "AND expires > ?", (now + ttl, item_id, owner, now))
+            if cursor.rowcount != 1:
+                return False
+            row = conn.execute("SELECT state FROM renames WHERE target = ?", (target,)).fetchone()
+            if row and row[0] == "done":
+                return False
+            conn.execute("INSERT OR REPLACE INTO renames (target, item_id, owner, state, updated) "
+                         "VALUES (?, ?, ?, 'claimed', ?)", (target, item_id, owner, now))
+            return True
+
+    def claim_once(self, target, owner):
+        """Rename claim outside any item (a later rename of a saved file):
+        the first process to ask gets it."""
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO renames (target, item_id, owner, state, updated) "
+                         "VALUES (?, 0, ?, 'claimed', ?)", (target, owner, time.time()))
+            row = conn.execute("SELECT owner, state FROM renames WHERE target = ?", (target,)).fetchone()
+            return row == (owner, "claimed")
+
+    def finish_rename(self, target, owner):
+        with self._connect() as conn:
+            conn.execute("UPDATE renames SET state = 'done', updated = ? WHERE target = ? AND owner = ?",
+                         (time.time(), target, owner))
+
+    def has_work(self):
+        """Anything pending or still leased (a leased item may come back)."""
+        with self._connect(write=False) as conn:
+            return conn.execute("SELECT 1 FROM items WHERE state IN ('pending', 'leased') LIMIT 1").fetchone() is not None
+
+    def status(self):
+        with self._connect(write=False) as conn:
+            states = dict(conn.execute("SELECT kind || ':' || state, COUNT(*) FROM items GROUP BY kind, state"))
+            renames = dict(conn.execute("SELECT state, COUNT(*) FROM renames GROUP BY state"))
+            failed = conn.execute("SELECT key, error FROM items WHERE state = 'failed' ORDER BY id").fetchall()
+            workers = [row[0] for row in conn.execute(
+                "SELECT DISTINCT owner FROM items WHERE state = 'leased' AND expires > ?", (time.time(),))]
+        return {"items": states, "renames": renames, "failed": [{"key": k, "error": e} for k, e in failed],
+                "active_workers": workers}
+
+
+def get_queue(base_dir):
+    os.makedirs(base_dir, exist_ok=True)
+    return WorkQueue(os.path.join(base_dir, QUEUE_FILENAME))
+
+
+class ItemHeartbeat:
+    """Keeps an item's lease alive from a background thread until stop() is called."""
+
+    def __init__(self, queue, item_id, owner, ttl):
+        self.queue, self.item_id, self.owner, self.ttl = queue, item_id, owner, ttl
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.ttl / 3):
+            if not self.queue.renew(self.item_id, self.owner, self.ttl):
+                print(f"Utracono dzierżawę zadania {self.item_id} ({self.owner})")
+                self.lost = True
+                return
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+class RenameGuard:
+    """async_scraper save guard: final renames go through the queue's claims.
+    Targets are relative to the archive folder, so hosts may mount it anywhere."""
+
+    def __init__(self, queue, base_dir, item_id, owner, ttl, crash_after=None):
+        self.queue, self.base_dir, self.item_id, self.owner, self.ttl = queue, base_dir, item_id, owner, ttl
+        self.crash_after = crash_after
+
+    def _target(self, save_dir, filename):
+        return Path(os.path.relpath(os.path.join(save_dir, filename), self.base_dir)).as_posix()
+
+    def claim(self, save_dir, filename):
+        claimed = self.queue.claim_rename(self._target(save_dir, filename), self.item_id, self.owner, self.ttl)
+        if claimed and self.crash_after is not None:
+            self.crash_after[0] -= 1
+            if self.crash_after[0] <= 0:
+                print("Symulowana awaria procesu (--crash-after)", flush=True)
+                os._exit(3)
+        return claimed
+
+    def done(self, save_dir, filename):
+        self.queue.finish_rename(self._target(save_dir, filename), self.owner)
+
+    def deferred(self):
+        return DeferredRenameGuard(self.queue, self.base_dir, self.owner)
+
+
+class DeferredRenameGuard(RenameGuard):
+    """Guard for deferred AI naming, which renames a saved file after its item
+    finished (no lease to check): one claim per file."""
+
+    def __init__(self, queue, base_dir, owner):
+        super().__init__(queue, base_dir, None, owner, None)
+
+    def _target(self, save_dir, filename):
+        return "deferred:" + super()._target(save_dir, filename)
+
+    def claim(self, save_dir, filename):
+        return self.queue.claim_once(self._target(save_dir, filename), self.owner)
+
+    def deferred(self):
+        return self
+
+
+def enqueue(base_dir, numbers=None, again=False):
+    """Add a session item per Sesja on BIP (only `numbers` when given). Returns the number added."""
+    import rada_scraper
+
+    queue = get_queue(base_dir)
+    # The session passes the time on to its druki: a retried session must not
+    # reset druki that this run already finished.
+    again = time.time() if again else False
+    added = 0
+    for sesja_url, sesja_number in rada_scraper.get_all_sesja_urls():
+        if numbers and sesja_number not in numbers:
+            continue
+        payload = {"url": sesja_url, "number": sesja_number}
+        if again:
+            payload["again"] = again
+        if queue.add("session", f"session:{sesja_number}", payload, again):
+            added += 1
+    return added
+
+
+async def _run_session(queue, base_dir, payload, store):
+    """Resolve the latest agenda of a session and add an item per druk."""
+    import async_scraper
+    import rada_scraper
+
+    if async_scraper.all_versions():
+        results = await async_scraper.download_specific_sesja(payload["url"], payload["number"], base_dir)
+        return {"files": len(results)}
+
+    porzadek_url, porzadek_number = await async_scraper.get_latest_porządek_url(payload["url"])
+    save_dir = os.path.join(f"Sesja{payload['number']}", f"Porzadek{porzadek_number}")
+    Path(base_dir, save_dir).mkdir(parents=True, exist_ok=True)
+    groups = {}
+    for link in async_scraper.attachment_links(await async_scraper.fetch_page(porzadek_url)):
+        druk_number = rada_scraper.get_druk_number_from_link(link)
+        groups.setdefault(druk_number or link["href"], []).append(link["href"])
+    for group, hrefs in groups.items():
+        queue.add("druk", f"druk:{Path(save_dir).as_posix()}:{group}",
+                  {"porzadek_url": porzadek_url, "save_dir": Path(save_dir).as_posix(), "hrefs": hrefs},
+                  again=payload.get("again", False))
+    print(f"Sesja {payload['number']}: porządek {porzadek_number}, {len(groups)} druków w kolejce")
+    return {"porzadek": porzadek_number, "druki": len(groups)}
+
+
+async def _run_druk(base_dir, payload, store):
+    """Download the attachments of one druk, in page order."""
+    import async_scraper
+
+    links = {link["href"]: link
+             for link in async_scraper.attachment_links(await async_scraper.fetch_page(payload["porzadek_url"]))}
+    save_dir = os.path.join(base_dir, payload["save_dir"])
+    files = []
+    for href in payload["hrefs"]:
+        if href not in links:
+            print(f"{href} zniknął z porządku - pomijam")
+            continue
+        result = await async_scraper.download_attachment(links[href], payload["porzadek_url"], save_dir, store)
+        if result:
+            files.append(result["filename"])
+    return {"files": files}
+
+
+def run_worker(base_dir, forever=False, ttl=LEASE_TTL, crash_after=None, crash_after_session=None):
+    """Take and run items until the queue is empty (or forever). Returns a summary."""
+    import async_scraper
+    from blob_store import get_blob_store
+
+    base_dir = os.path.abspath(base_dir)
+    queue = get_queue(base_dir)
+    store = get_blob_store(base_dir)
+    owner = new_owner_id()
+    crash_counter = [crash_after] if crash_after else None
+    sessions_run = 0
+    summary = {"worker": owner, "done": 0, "failed": 0, "lost": 0}
+    print(f"Worker {owner} startuje ({base_dir})")
+    while True:
+        item = queue.claim(owner, ttl)
+        if item is None:
+            if not forever and not queue.has_work():
+                break
+            time.sleep(POLL_INTERVAL)
+            continue
+        print(f"Zadanie {item['key']} (próba {item['attempts']})")
+        heartbeat = ItemHeartbeat(queue, item["id"], owner, ttl).start()
+        async_scraper.set_save_guard(RenameGuard(queue, base_dir, item["id"], owner, ttl, crash_counter))
+        try:
+            if item["kind"] == "session":
+                result = async_scraper.run_sync(_run_session(queue, base_dir, item["payload"], store))
+                sessions_run += 1
+                if crash_after_session and sessions_run >= crash_after_session:
+                    print("Symulowana awaria procesu (--crash-after-session)", flush=True)
+                    os._exit(3)
+            else:
+                result = async_scraper.run_sync(_run_druk(base_dir, item["payload"], store))
+        except Exception as e:
+            print(f"Błąd zadania {item['key']}: {e}")
+            queue.fail(item["id"], owner, e)
+            summary["failed"] += 1
+        else:
+            if queue.complete(item["id"], owner, result):
+                summary["done"] += 1
+            else:
+                summary["lost"] += 1
+        finally:
+            heartbeat.stop()
+            async_scraper.set_save_guard(None)
+    print(f"Worker {owner} kończy: {summary}")
+    return summary
+
+
+def selftest(workers=3, sessions=4, druki=8, ttl=3.0, crash=True):
+    """Run `workers` local worker processes against bip_standin.py, one of which
+    dies after its second claimed rename and another after its first session
+    queued its druki, and check that every druk of every session was saved
+    exactly once and no finished druk was run again. Returns True on success."""
+    import bip_standin
+
+    config = {"sessions": sessions, "druki": druki, "ai_latency": 0.05}
+    server = bip_standin.start_standin(config)
+    work_dir = tempfile.mkdtemp(prefix="worker_selftest_")
+    base_dir = os.path.join(work_dir, "data")
+    env = dict(os.environ, BIP_URL=server.base_url, OPENROUTER_BASE_URL=server.ai_url,
+               OPENROUTER_API_KEY=os.getenv("OPENROUTER_API_KEY") or "selftest",
+               HTTP_CACHE_DB=os.path.join(work_dir, "http_cache.db"), WORKER_LEASE_TTL=str(ttl),
+               PYTHONUNBUFFERED="1")
+    script = os.path.abspath(__file__)
+    problems = ["przerwany"]
+    try:
+        started = time.perf_counter()
+        subprocess.run([sys.executable, script, "enqueue", "--dir", base_dir], env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        processes = []
+        for i in range(workers):
+            command = [sys.executable, script, "run", "--dir", base_dir]
+            if crash and i == 0:
+                command += ["--crash-after", "2"]
+            elif crash and i == 1:
+                command += ["--crash-after-session", "1"]
+            log = open(os.path.join(work_dir, f"worker{i}.log"), "w")
+            processes.append((subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT), log))
+        codes = []
+        for process, log in processes:
+            codes.append(process.wait())
+            log.close()
+        elapsed = time.perf_counter() - started
+
+        status = get_queue(base_dir).status()
+        problems.clear()
+        if status["failed"] or any(not key.endswith(":done") for key in status["items"]):
+            problems.append(f"niedokończone zadania: {status['items']}")
+        saved = 0
+        for sesja_number in range(1, sessions + 1):
+            porzadek = config.get("porzadki", bip_standin.DEFAULT_CONFIG["porzadki"])
+            folder = os.path.join(base_dir, f"Sesja{sesja_number}", f"Porzadek{porzadek}")
+            names = os.listdir(folder) if os.path.isdir(folder) else []
+            leftovers = [n for n in names if n.startswith("temp_")]
+            if leftovers:
+                problems.append(f"{folder}: pliki tymczasowe {leftovers}")
+            for number, ext in bip_standin.agenda_druki(dict(bip_standin.DEFAULT_CONFIG, **config),
+                                                         sesja_number, porzadek):
+                copies = [n for n in names if n.startswith(f"DRUK_NR{number}_") or n == f"DRUK_NR{number}.{ext}"]
+                saved += len(copies)
+                if len(copies) != 1:
+                    problems.append(f"DRUK_NR{number}: {len(copies)} kopii {copies}")
+        # A druk taken on its first attempt more than once was reset after it finished
+        first_runs = {}
+        for i in range(workers):
+            with open(os.path.join(work_dir, f"worker{i}.log"), encoding="utf-8") as log:
+                for line in log:
+                    if line.startswith("Zadanie druk:") and line.rstrip().endswith("(próba 1)"):
+                        key = line.split()[1]
+                        first_runs[key] = first_runs.get(key, 0) + 1
+        rerun = sorted(key for key, count in first_runs.items() if count > 1)
+        if rerun:
+            problems.append(f"zakończone druki uruchomione ponownie: {rerun}")
+
+        print(f"Procesy: {workers}, kody wyjścia: {codes}, czas: {elapsed:.2f} s")
+        print(f"Zadania: {status['items']}")
+        print(f"Przemianowania: {status['renames']}, zapisane druki: {saved}")
+        print(f"BIP: {server.stats.get('files', 0)} pobrań plików, {server.stats.get('ai_calls', 0)} zapytań AI")
+        for problem in problems:
+            print(f"BŁĄD: {problem}")
+        if problems:
+            print(f"Logi workerów: {work_dir}")
+        else:
+            print("OK - każdy druk zapisany dokładnie raz")
+        return not problems
+    finally:
+        server.shutdown()
+        if not problems:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rozproszone pobieranie archiwum ze wspólnej kolejki")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p_enqueue = commands.add_parser("enqueue", help="dodaj sesje do kolejki")
+    p_enqueue.add_argument("--sessions", help="numery sesji, np. 12,13 (domyślnie wszystkie)")
+    p_enqueue.add_argument("--again", action="store_true", help="pobierz ponownie także zakończone sesje")
+
+    p_run = commands.add_parser("run", help="uruchom workera")
+    p_run.add_argument("--forever", action="store_true", help="czekaj na nowe zadania zamiast kończyć")
+    p_run.add_argument("--crash-after", type=int, help=argparse.SUPPRESS)  # selftest: die after N claims
+    p_run.add_argument("--crash-after-session", type=int, help=argparse.SUPPRESS)  # selftest: die after N sessions
+
+    commands.add_parser("status", help="stan kolejki")
+
+    p_selftest = commands.add_parser("selftest", help="test z kilkoma lokalnymi workerami (bip_standin.py)")
+    p_selftest.add_argument("--workers", type=int, default=3)
+    p_selftest.add_argument("--sessions", type=int, default=4)
+    p_selftest.add_argument("--druki", type=int, default=8)
+    p_selftest.add_argument("--no-crash", action="store_true", help="bez symulowanej awarii workera")
+
+    for p in (p_enqueue, p_run, commands.choices["status"]):
+        p.add_argument("--dir", default=os.getenv("DOWNLOAD_DIR", "./data"), help="folder archiwum")
+    args = parser.parse_args()
+
+    if args.command == "enqueue":
+        numbers = {int(n) for n in args.sessions.split(",")} if args.sessions else None
+        print(f"Dodano {enqueue(args.dir, numbers, args.again)} sesji do kolejki")
+    elif args.command == "run":
+        summary = run_worker(args.dir, args.forever, crash_after=args.crash_after,
+                             crash_after_session=args.crash_after_session)
+        sys.exit(1 if summary["failed"] else 0)
+    elif args.command == "status":
+        print(json.dumps(get_queue(args.dir).status(), ensure_ascii=False, indent=2))
+    else:
+        sys.exit(0 if selftest(args.workers, args.sessions, args.druki, crash=not args.no_crash) else 1)
+
+
+if __name__ == "__main__":
+    main()
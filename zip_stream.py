@@ -0,0 +1,71 @@
+"""
+Streaming ZIP export
+Builds a ZIP archive on the fly as a generator of byte chunks, so a whole
+SesjaN or PorzadekM folder can be sent to the browser without creating a
+temporary archive on disk or in memory. Already compressed formats (PDF,
+DOCX, XLSX) are stored as-is; the rest is deflated. Files of compressed old
+sessions (cold_storage.py) go in decompressed, under their original name.
+"""
+
+import os
+import zipfile
+
+from cold_storage import is_cold, logical_name, open_file, original_size
+
+CHUNK_SIZE = 256 * 1024
+STORED_EXTENSIONS = (".pdf", ".docx", ".xlsx", ".zip", ".jpg", ".png")
+
+
+class _ChunkSink:
+    """Write-only file object collecting what zipfile writes until it is drained.
+    It has no tell()/seek(), so zipfile streams entries with data descriptors."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+def iter_zip(files):
+    """Yield the bytes of a ZIP archive made of files = [(arcname, path)]."""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w") as archive:
+        for arcname, path in files:
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            if is_cold(path):
+                info.file_size = original_size(path)  # the size on disk is the compressed one
+            if os.path.splitext(logical_name(path))[1].lower() in STORED_EXTENSIONS:
+                info.compress_type = zipfile.ZIP_STORED
+            else:
+                info.compress_type = zipfile.ZIP_DEFLATED
+            with open_file(path) as source, \
+                    archive.open(info, "w", force_zip64=info.file_size >= zipfile.ZIP64_LIMIT) as target:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                    target.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    yield from sink.drain()
+
+
+def folder_files(base_dir, rel_folder):
+    """[(arcname, path)] of all archive files below base_dir/rel_folder.
+    Arcnames keep the SesjaN/PorzadekM structure."""
+    files = []
+    root = os.path.join(base_dir, rel_folder)
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for filename in sorted(filenames):
+            if filename.startswith(("temp_", ".")):
+                continue
+            path = os.path.join(dirpath, filename)
+            files.append((logical_name(os.path.relpath(path, base_dir).replace(os.sep, "/")), path))
+    return files